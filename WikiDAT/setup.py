@@ -26,6 +26,10 @@ setup(
         "python-dateutil>=1.5",
         "requests>=2.2.1",
         "ujson>=1.3.0",
-        "redis>=2.10.3"
+        "redis>=2.10.3",
+        "numpy>=1.9"
     ],
+    extras_require={
+        "parquet": ["pyarrow>=0.17.0"],
+    },
 )
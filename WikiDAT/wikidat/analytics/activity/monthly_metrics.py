@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+Monthly activity metrics of a wiki, computed in a single pass over its
+revision history, instead of the per-month tables and COUNT(*) scans built
+with templates in retrieval/db/metrics_queries.py.
+
+Revisions are streamed in order of rev_timestamp, in chunks processed with
+NumPy, and all metrics of each month are computed at once. The current state
+of every article (page in main namespace) is kept in arrays indexed by
+page_id: length of its latest revision, whether it is a redirect or a
+featured article (FA), and whether it was ever an FA.
+
+Metrics are stored in table monthly_metrics (one row per month), and the
+state of articles at the start of the last month, which is usually
+incomplete, in table monthly_metrics_pages. Later runs resume from that
+month, streaming only its revisions and newer ones (e.g. after incremental
+ETL loads), unless option --full is given.
+
+Users in group 'bot' (table user_groups, if loaded from SQL dumps) are not
+counted in user metrics and edits_nobots; users in group 'sysop' with edits
+are counted as sysops.
+
+Usage (from the wikidat folder):
+    python -m analytics.activity.monthly_metrics db_name db_user db_pass
+    [db_engine] [--full]
+"""
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+from utils.dbutils import MySQLDB, BulkLoader, load_profile
+from retrieval.db import base_schema as bs
+from retrieval.tsv import TSVWriter, LOAD_FIELDS
+
+# Columns of table monthly_metrics after month, in the same order
+METRICS = ('edits', 'edits_reg', 'edits_nobots', 'users', 'active_users',
+           'very_active_users', 'sysops', 'new_articles', 'articles',
+           'new_redirects', 'redirects', 'new_fa', 'fa_articles',
+           'total_length')
+
+# Cumulative metrics, carried over from one month to the next one
+TOTALS = ('articles', 'redirects', 'fa_articles', 'total_length')
+
+# Active and very active users have more edits than these in a month
+ACTIVE_EDITS = 5
+VERY_ACTIVE_EDITS = 100
+
+query_revisions = """SELECT EXTRACT(YEAR_MONTH FROM rev_timestamp),
+                     rev_page, rev_user, rev_len, rev_is_redirect, rev_fa
+                     FROM revision {where!s}
+                     ORDER BY rev_timestamp"""
+
+query_group = """SELECT ug_user FROM user_groups
+                 WHERE ug_group = '{group!s}'"""
+
+load_pages = ("LOAD DATA LOCAL INFILE '%s' "
+              "INTO TABLE monthly_metrics_pages " + LOAD_FIELDS)
+
+
+def next_month(month):
+    """
+    Return month (int YYYYMM) following month
+    """
+    year, month = divmod(month, 100)
+    return (year * 100 + month + 1) if month < 12 else ((year + 1) * 100 + 1)
+
+
+class MonthlyMetrics(object):
+    """
+    Computes monthly metrics from revisions given in chunks (see update),
+    in order of timestamp. Rows of finished months are appended to rows
+    """
+
+    def __init__(self, max_page_id, articles, bots=(), sysops=()):
+        """
+        Arguments:
+            - max_page_id = Largest page_id in table page
+            - articles = page_id of pages in main namespace
+            - bots = user_id of bots
+            - sysops = user_id of sysops
+        """
+        size = max_page_id + 1
+        self.is_article = np.zeros(size, dtype=bool)
+        self.is_article[np.asarray(articles, dtype=np.int64)] = True
+        self.seen = np.zeros(size, dtype=bool)
+        self.length = np.zeros(size, dtype=np.int64)
+        self.redirect = np.zeros(size, dtype=bool)
+        self.fa = np.zeros(size, dtype=bool)
+        self.ever_fa = np.zeros(size, dtype=bool)
+        # Last month with revisions of each page, and state of pages before
+        # their first revision in the current month, to restore the state at
+        # the start of the last month (see finish)
+        self.touched = np.zeros(size, dtype=np.int32)
+        self.undo = []
+        self.bots = np.unique(np.asarray(bots, dtype=np.int64))
+        self.sysops = np.unique(np.asarray(sysops, dtype=np.int64))
+        self.totals = dict.fromkeys(TOTALS, 0)
+        self.month = None
+        self.counts = None
+        self.user_edits = []  # (users, edits) arrays of current month
+        self.rows = []
+
+    def restore(self, pages):
+        """
+        Restore state of articles saved by a previous run (see state)
+        """
+        pages = np.asarray(pages, dtype=np.int64).reshape(-1, 5)
+        pages = pages[pages[:, 0] < len(self.seen)]
+        page = pages[:, 0]
+        self.seen[page] = True
+        self.length[page] = pages[:, 1]
+        self.redirect[page] = pages[:, 2] != 0
+        self.fa[page] = pages[:, 3] != 0
+        self.ever_fa[page] = pages[:, 4] != 0
+        articles = self.seen & self.is_article
+        self.totals['articles'] = int((articles & ~self.redirect).sum())
+        self.totals['redirects'] = int((articles & self.redirect).sum())
+        self.totals['fa_articles'] = int((articles & self.fa).sum())
+        self.totals['total_length'] = int(
+            self.length[articles & ~self.redirect].sum())
+
+    def state(self):
+        """
+        Return array with rows (page_id, length, is_redirect, is_fa,
+        ever_fa) of every article with revisions
+        """
+        page = np.flatnonzero(self.seen)
+        return np.column_stack((page, self.length[page],
+                                self.redirect[page], self.fa[page],
+                                self.ever_fa[page])).astype(np.int64)
+
+    def update(self, chunk):
+        """
+        Add chunk of revisions: array with rows (month YYYYMM, rev_page,
+        rev_user, rev_len, rev_is_redirect, rev_fa), sorted by timestamp
+        """
+        if not len(chunk):
+            return
+        bounds = np.flatnonzero(np.diff(chunk[:, 0])) + 1
+        for revs in np.split(chunk, bounds):
+            month = int(revs[0, 0])
+            if month != self.month:
+                self._start_month(month)
+            self._add_revisions(revs)
+
+    def finish(self):
+        """
+        Finish last month, and restore state of articles at its start, so
+        that it can be computed again with new revisions by a later run
+        """
+        if self.month is not None:
+            self._finish_month()
+        for page, seen, length, redirect, fa, ever_fa in self.undo:
+            self.seen[page] = seen
+            self.length[page] = length
+            self.redirect[page] = redirect
+            self.fa[page] = fa
+            self.ever_fa[page] = ever_fa
+        self.undo = []
+        return self.rows
+
+    def _start_month(self, month):
+        if self.month is not None:
+            self._finish_month()
+            # Months without revisions
+            gap = next_month(self.month)
+            while gap < month:
+                self.rows.append(self._row(gap, dict.fromkeys(METRICS, 0)))
+                gap = next_month(gap)
+        self.month = month
+        self.counts = dict.fromkeys(METRICS, 0)
+        self.user_edits = []
+        self.undo = []
+
+    def _finish_month(self):
+        counts = self.counts
+        if self.user_edits:
+            users, inverse = np.unique(
+                np.concatenate([u for u, e in self.user_edits]),
+                return_inverse=True)
+            edits = np.bincount(inverse, weights=np.concatenate(
+                [e for u, e in self.user_edits]))
+            counts['users'] = len(users)
+            counts['active_users'] = int((edits > ACTIVE_EDITS).sum())
+            counts['very_active_users'] = int(
+                (edits > VERY_ACTIVE_EDITS).sum())
+            counts['sysops'] = int(np.isin(users, self.sysops,
+                                           assume_unique=True).sum())
+        self.rows.append(self._row(self.month, counts))
+
+    def _row(self, month, counts):
+        counts.update(self.totals)
+        return (('%04d-%02d-01' % divmod(month, 100),) +
+                tuple(int(counts[metric]) for metric in METRICS))
+
+    def _add_revisions(self, revs):
+        counts = self.counts
+        user = revs[:, 2]
+        registered = user > 0
+        humans = user[registered & ~np.isin(user, self.bots)]
+        counts['edits'] += len(revs)
+        counts['edits_reg'] += int(registered.sum())
+        counts['edits_nobots'] += len(humans)
+        if len(humans):
+            self.user_edits.append(np.unique(humans, return_counts=True))
+
+        page = revs[:, 1]
+        in_index = page < len(self.is_article)
+        is_article = np.zeros(len(revs), dtype=bool)
+        is_article[in_index] = self.is_article[page[in_index]]
+        revs = revs[is_article]
+        if not len(revs):
+            return
+        page, length = revs[:, 1], revs[:, 3]
+        redirect, fa = revs[:, 4] != 0, revs[:, 5] != 0
+
+        # First and last revision of each article in this month
+        pages, first = np.unique(page, return_index=True)
+        last = len(page) - 1 - np.unique(page[::-1], return_index=True)[1]
+
+        new_pages = self.touched[pages] != self.month
+        if new_pages.any():
+            saved = pages[new_pages]
+            self.undo.append((saved, self.seen[saved], self.length[saved],
+                              self.redirect[saved], self.fa[saved],
+                              self.ever_fa[saved]))
+            self.touched[saved] = self.month
+
+        seen = self.seen[pages]
+        first_redirect = redirect[first][~seen]
+        counts['new_articles'] += int((~first_redirect).sum())
+        counts['new_redirects'] += int(first_redirect.sum())
+
+        fa_pages = np.unique(page[fa])
+        new_fa = fa_pages[~self.ever_fa[fa_pages]]
+        counts['new_fa'] += len(new_fa)
+        self.ever_fa[new_fa] = True
+
+        # Replace contribution of previous state of articles to totals
+        old_redirect, old_fa = self.redirect[pages], self.fa[pages]
+        old_article = seen & ~old_redirect
+        last_redirect, last_fa = redirect[last], fa[last]
+        last_length = length[last]
+        totals = self.totals
+        totals['articles'] += int((~last_redirect).sum() - old_article.sum())
+        totals['redirects'] += int(last_redirect.sum() -
+                                   (seen & old_redirect).sum())
+        totals['fa_articles'] += int(last_fa.sum() - (seen & old_fa).sum())
+        totals['total_length'] += int(
+            last_length[~last_redirect].sum() -
+            self.length[pages][old_article].sum())
+
+        self.seen[pages] = True
+        self.length[pages] = last_length
+        self.redirect[pages] = last_redirect
+        self.fa[pages] = last_fa
+
+
+def read_column(con, query, chunk_rows=1000000):
+    """
+    Return array (int64) with values of the first column of query results
+    """
+    values = [np.array(rows, dtype=np.int64)[:, 0]
+              for rows in con.iter_query(query, chunk_rows)]
+    return np.concatenate(values) if values else np.zeros(0, dtype=np.int64)
+
+
+def save_state(con, pages, engine):
+    """
+    Replace table monthly_metrics_pages with state of articles, with a
+    single data load
+    """
+    con.send_query(bs.drop_monthly_metrics_pages)
+    con.send_query(bs.create_monthly_metrics_pages.format(
+        engine=load_profile(engine)['engine']))
+    fd, path = tempfile.mkstemp(suffix='_monthly_metrics_pages.csv')
+    os.close(fd)
+    loader = BulkLoader(con)
+    try:
+        data_file = loader.open(path)
+        writer = TSVWriter(data_file, 'monthly_metrics_pages')
+        for row in pages.tolist():
+            writer.writerow(row)
+        data_file.close()
+        loader.load(load_pages % path, path)
+    finally:
+        loader.close()
+        os.remove(path)
+
+
+def compute_metrics(con, engine='ARIA', full=False, chunk_rows=1000000):
+    """
+    Compute monthly metrics of the DB in con (MySQLDB object), resuming
+    from the last month in table monthly_metrics unless full is True.
+    Return number of months computed
+    """
+    last = None
+    if (not full and con.table_exists('monthly_metrics') and
+            con.table_exists('monthly_metrics_pages')):
+        last = con.execute_query("SELECT EXTRACT(YEAR_MONTH FROM "
+                                 "MAX(month)) FROM monthly_metrics")[0][0]
+
+    max_page_id = con.execute_query("SELECT MAX(page_id) FROM page")[0][0]
+    articles = read_column(con, "SELECT page_id FROM page "
+                                "WHERE page_namespace = 0", chunk_rows)
+    bots = sysops = ()
+    if con.table_exists('user_groups'):
+        bots = read_column(con, query_group.format(group='bot'))
+        sysops = read_column(con, query_group.format(group='sysop'))
+    metrics = MonthlyMetrics(max_page_id or 0, articles, bots, sysops)
+
+    if last is None:
+        print("Computing monthly metrics for the whole revision history...")
+        con.send_query(bs.drop_monthly_metrics)
+        con.send_query(bs.create_monthly_metrics.format(
+            engine=load_profile(engine)['engine']))
+        where = ''
+    else:
+        print("Computing monthly metrics from month %s..." % last)
+        metrics.restore(np.concatenate(
+            [np.array(rows, dtype=np.int64) for rows in con.iter_query(
+                "SELECT page_id, page_len, page_is_redirect, page_is_fa, "
+                "page_ever_fa FROM monthly_metrics_pages", chunk_rows)] or
+            [np.zeros((0, 5), dtype=np.int64)]))
+        where = "WHERE rev_timestamp >= '%04d-%02d-01'" % divmod(last, 100)
+
+    for rows in con.iter_query(query_revisions.format(where=where),
+                               chunk_rows):
+        metrics.update(np.array(rows, dtype=np.int64))
+    rows = metrics.finish()
+
+    if last is not None:
+        con.send_query("DELETE FROM monthly_metrics WHERE month >= "
+                       "'%04d-%02d-01'" % divmod(last, 100))
+    con.insert_many(bs.insert_monthly_metrics, rows)
+    save_state(con, metrics.state(), engine)
+    if last is None:
+        con.create_keys(['monthly_metrics', 'monthly_metrics_pages'],
+                        engine=engine)
+    else:
+        con.create_keys(['monthly_metrics_pages'], engine=engine)
+    return len(rows)
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if arg != '--full']
+    db_name = args[0]
+    db_user = args[1]
+    db_pass = args[2]
+    db_engine = args[3] if len(args) > 3 else 'ARIA'
+
+    con = MySQLDB(host='localhost', user=db_user, passwd=db_pass, db=db_name)
+    con.connect()
+    months = compute_metrics(con, engine=db_engine,
+                             full='--full' in sys.argv)
+    con.close()
+    print("%s months of activity metrics stored in table monthly_metrics %s"
+          % (months, time.strftime("%Y-%m-%d %H:%M:%S %Z", time.localtime())))
@@ -1,42 +1,135 @@
 '''
-Create table of country contributions for each wiki page.
+Create table of country contributions for each wiki page: share of its
+revisions made from each country (country of the IP address of anonymous
+revisions), or from 'Unknown' (registered users and unknown addresses).
+
+If table IP_country has been populated by the ETL, shares are computed
+entirely in SQL. Otherwise, revisions and their IP addresses are read in
+chunks, addresses are resolved in bulk and revisions are counted for each
+(page, country) with a vectorized groupby. In both cases, table
+country_contrib is rebuilt with a single statement or data load.
+
+Usage (from the wikidat folder):
+    python -m analytics.ip_countries.country_contributions db_name db_user
+    db_pass [db_engine]
 
 @author: carlosm
 '''
 
+import os
 import sys
-import MySQLdb as db
-from pandas import DataFrame
-from pandas.io.sql import read_sql
-from wikidat.utils.ipresolver import getCountryCode 
+import tempfile
+import numpy as np
+import pandas as pd
+from utils.dbutils import MySQLDB, BulkLoader, load_profile
+from utils.ipresolver import lookup_many
+from retrieval.db import base_schema as bs
+from retrieval.tsv import TSVWriter, LOAD_FIELDS
+
+UNKNOWN = 'Unknown'
+
+# Revisions of each page and country, and total revisions of each page
+query_contrib = """INSERT INTO country_contrib
+                   SELECT revs.page_id, revs.country,
+                   revs.revs / pages.revs
+                   FROM (SELECT rev_page AS page_id,
+                         COALESCE(IP_country.country, '{unknown!s}')
+                         AS country, COUNT(*) AS revs
+                         FROM revision
+                         INNER JOIN page ON page.page_id = revision.rev_page
+                         LEFT JOIN revision_IP
+                         ON revision_IP.rev_id = revision.rev_id
+                         LEFT JOIN IP_country
+                         ON IP_country.ip = revision_IP.ip
+                         GROUP BY rev_page, IP_country.country) AS revs
+                   INNER JOIN (SELECT rev_page AS page_id, COUNT(*) AS revs
+                               FROM revision
+                               INNER JOIN page
+                               ON page.page_id = revision.rev_page
+                               GROUP BY rev_page) AS pages
+                   ON pages.page_id = revs.page_id
+                   """
+
+query_revs = """SELECT rev_page, revision_IP.ip FROM revision
+                INNER JOIN page ON page.page_id = revision.rev_page
+                LEFT JOIN revision_IP ON revision_IP.rev_id = revision.rev_id
+                """
+
+load_contrib = ("LOAD DATA LOCAL INFILE '%s' INTO TABLE country_contrib " +
+                LOAD_FIELDS)
+
+
+def has_rows(con, table):
+    '''
+    Whether table exists in DB and has any row
+    '''
+    return (con.table_exists(table) and
+            con.execute_query("SELECT 1 FROM %s LIMIT 1" % table) is not None)
+
+
+def count_revisions(con, chunk_rows=1000000, max_chunks=16):
+    '''
+    Return Series with number of revisions of each (page_id, country),
+    reading revisions in chunks of chunk_rows and resolving their IP
+    addresses with ipresolver. Counts of every max_chunks chunks are added
+    up, to bound memory
+    '''
+    counts = []
+    for rows in con.iter_query(query_revs, chunk_rows):
+        chunk = pd.DataFrame(rows, columns=['page_id', 'ip'])
+        ips = chunk['ip'].fillna(-1).to_numpy(dtype=np.int64)
+        chunk['country'] = lookup_many(ips, default=UNKNOWN)
+        counts.append(chunk.groupby(['page_id', 'country']).size())
+        if len(counts) >= max_chunks:
+            counts = [pd.concat(counts).groupby(level=[0, 1]).sum()]
+    if not counts:
+        return pd.Series([], dtype=np.int64)
+    return pd.concat(counts).groupby(level=[0, 1]).sum()
+
+
+def load_contributions(con, counts):
+    '''
+    Load share of revisions of each (page_id, country) in table
+    country_contrib, with a single data load
+    '''
+    shares = counts / counts.groupby(level=0).transform('sum')
+    fd, path = tempfile.mkstemp(suffix='_country_contrib.csv')
+    os.close(fd)
+    loader = BulkLoader(con)
+    try:
+        data_file = loader.open(path)
+        writer = TSVWriter(data_file, 'country_contrib')
+        for row in zip(shares.index.get_level_values(0).tolist(),
+                       shares.index.get_level_values(1).tolist(),
+                       shares.tolist()):
+            writer.writerow(row)
+        data_file.close()
+        loader.load(load_contrib % path, path)
+    finally:
+        loader.close()
+        os.remove(path)
+
 
 if __name__ == '__main__':
     db_name = sys.argv[1]
     db_user = sys.argv[2]
     db_pass = sys.argv[3]
+    db_engine = sys.argv[4] if len(sys.argv) > 4 else 'ARIA'
 
-    # Load data for each page
-    con = db.connect('localhost',db_user,db_pass,db_name)
-    query = 'SELECT rev_user, rev_ip, page_id, page_namespace, name FROM revision ' + \
-        'INNER JOIN page ON page.page_id=revision.rev_page ' + \
-        'INNER JOIN namespaces ON page.page_namespace=namespaces.code'
-    data     = read_sql(query, con)
-    con.close()
+    con = MySQLDB(host='localhost', user=db_user, passwd=db_pass, db=db_name)
+    con.connect()
+    con.send_query(bs.drop_country_contrib)
+    con.send_query(bs.create_country_contrib.format(
+        engine=load_profile(db_engine)['engine']))
+
+    if has_rows(con, 'IP_country') or not has_rows(con, 'revision_IP'):
+        print("Computing country contributions in DB...")
+        con.send_query(query_contrib.format(unknown=UNKNOWN),
+                       raise_errors=True)
+    else:
+        # Database loaded without countries of IP addresses
+        print("Resolving countries of revisions...")
+        load_contributions(con, count_revisions(con))
 
-    # Map IP addresses to country codes
-    data['country'] = data['rev_ip'].apply(lambda ip: getCountryCode(ip))
-    data['country'] = data['country'].fillna('Unknown')
-
-    # Create country contributions for each page
-    con = db.connect('localhost',db_user,db_pass,db_name)
-    for page_id, page_revs in data.groupby('page_id'):
-        nRevs = len(page_revs)
-        cRevs = page_revs.groupby('country').size() / nRevs
-    
-        # Insert into country_contrib
-        # Values: page_id, country (cRevs.keys()), contributions(cRevs.keys())
-        df = DataFrame(cRevs, columns=['contribution'] )
-        df['page_id'] = page_id
-        df.to_sql(con=con, name='country_contrib', if_exists='append', flavor='mysql')
-    
+    con.create_keys(['country_contrib'], engine=db_engine)
     con.close()
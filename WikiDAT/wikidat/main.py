@@ -16,10 +16,13 @@ http://blog.vwelch.com/2011/04/combining-configparser-and-argparse.html
 import argparse
 import configparser
 import codecs
+import os
 import sys
 import time
 import json
 from tasks import tasks
+from tasks.batch import BatchTask
+from tasks.download import DumpCatalog
 
 
 def get_config(filename='config.ini'):
@@ -63,10 +66,23 @@ def get_config(filename='config.ini'):
         opts['download_files'] = config.getboolean('General', 'download_files')
     if config.has_option('General', 'debug'):
         opts['debug'] = config.getboolean('General', 'debug')
+    if config.has_option('General', 'offline'):
+        opts['offline'] = config.getboolean('General', 'offline')
+    if config.has_option('General', 'ttl'):
+        opts['ttl'] = config.getint('General', 'ttl')
+    if config.has_option('General', 'parquet_row_group'):
+        opts['parquet_row_group'] = config.getint('General',
+                                                  'parquet_row_group')
 
     opts_database = dict(config.items('Database'))
     if config.has_option('Database', 'port'):
         opts_database['port'] = config.getint('Database', 'port')
+    if config.has_option('Database', 'fifo_load'):
+        opts_database['fifo_load'] = config.getboolean('Database',
+                                                       'fifo_load')
+    if config.has_option('Database', 'index_workers'):
+        opts_database['index_workers'] = config.getint('Database',
+                                                       'index_workers')
     opts.update(opts_database)
 
     if config.has_section('ETL:RevHistory'):
@@ -92,8 +108,56 @@ def get_config(filename='config.ini'):
             opts_etl_revhist['detect_FLIST'] = config.getboolean(sec, 'detect_FLIST')
         if config.has_option(sec, 'detect_GA'):
             opts_etl_revhist['detect_GA'] = config.getboolean(sec, 'detect_GA')
+        if config.has_option(sec, 'expand_templates'):
+            opts_etl_revhist['expand_templates'] = config.getboolean(sec, 'expand_templates')
+        if config.has_option(sec, 'clean_workers'):
+            opts_etl_revhist['clean_workers'] = config.getint(sec, 'clean_workers')
+        if config.has_option(sec, 'clean_chunksize'):
+            opts_etl_revhist['clean_chunksize'] = config.getint(sec, 'clean_chunksize')
+        if config.has_option(sec, 'filter_namespaces'):
+            opts_etl_revhist['filter_namespaces'] = json.loads(config.get(sec, 'filter_namespaces'))
+        if config.has_option(sec, 'filter_redirects'):
+            opts_etl_revhist['filter_redirects'] = config.getboolean(sec, 'filter_redirects')
+        if config.has_option(sec, 'filter_min_size'):
+            opts_etl_revhist['filter_min_size'] = config.getint(sec, 'filter_min_size')
+        if config.has_option(sec, 'filter_max_size'):
+            opts_etl_revhist['filter_max_size'] = config.getint(sec, 'filter_max_size')
+        if config.has_option(sec, 'filter_titles'):
+            opts_etl_revhist['filter_titles'] = config.get(sec, 'filter_titles')
+        if config.has_option(sec, 'quality_window'):
+            opts_etl_revhist['quality_window'] = config.getint(sec, 'quality_window')
+        if config.has_option(sec, 'quality_fallback'):
+            opts_etl_revhist['quality_fallback'] = config.getboolean(sec, 'quality_fallback')
+        if config.has_option(sec, 'resume'):
+            opts_etl_revhist['resume'] = config.getboolean(sec, 'resume')
+        if config.has_option(sec, 'incremental'):
+            opts_etl_revhist['incremental'] = config.getboolean(sec, 'incremental')
+        if config.has_option(sec, 'load_workers'):
+            opts_etl_revhist['load_workers'] = config.getint(sec, 'load_workers')
         opts.update(opts_etl_revhist)
 
+    if config.has_section('ETL:RevMeta'):
+        opts_etl_revmeta = dict()
+        sec = 'ETL:RevMeta'
+        if config.has_option(sec, 'etl_lines'):
+            opts_etl_revmeta['meta_etl_lines'] = config.getint(sec, 'etl_lines')
+        if config.has_option(sec, 'meta_cache_size'):
+            opts_etl_revmeta['meta_cache_size'] = config.getint(sec, 'meta_cache_size')
+        if config.has_option(sec, 'load_workers'):
+            opts_etl_revmeta['meta_load_workers'] = config.getint(sec, 'load_workers')
+        opts.update(opts_etl_revmeta)
+
+    if config.has_section('ETL:SQLDumps'):
+        opts_etl_sql = dict()
+        sec = 'ETL:SQLDumps'
+        if config.has_option(sec, 'etl_lines'):
+            opts_etl_sql['sql_etl_lines'] = config.getint(sec, 'etl_lines')
+        if config.has_option(sec, 'chunk_rows'):
+            opts_etl_sql['sql_chunk_rows'] = config.getint(sec, 'chunk_rows')
+        if config.has_option(sec, 'load_workers'):
+            opts_etl_sql['sql_load_workers'] = config.getint(sec, 'load_workers')
+        opts.update(opts_etl_sql)
+
     if config.has_section('ETL:PagesLogging'):
         opts_etl_logging = dict()
         sec = 'ETL:PagesLogging'
@@ -103,13 +167,31 @@ def get_config(filename='config.ini'):
             opts_etl_logging['log_fan'] = config.getint(sec, 'log_fan')
         if config.has_option(sec, 'log_cache_size'):
             opts_etl_logging['log_cache_size'] = config.getint(sec, 'log_cache_size')
+        if config.has_option(sec, 'load_workers'):
+            opts_etl_logging['log_load_workers'] = config.getint(sec, 'load_workers')
         if config.has_option(sec, 'base_ports'):
             opts_etl_logging['base_ports'] = json.loads(config.get(sec, 'base_ports'))
         if config.has_option(sec, 'control_ports'):
             opts_etl_logging['control_ports'] = json.loads(config.get(sec, 'control_ports'))
         opts.update(opts_etl_logging)
 
-    opts['tool_secs'] = set(config.sections()) - set(mandatory_secs)
+    if config.has_section('Batch'):
+        opts_batch = dict()
+        sec = 'Batch'
+        if config.has_option(sec, 'langs'):
+            opts_batch['batch_langs'] = json.loads(config.get(sec, 'langs'))
+        if config.has_option(sec, 'tools'):
+            opts_batch['batch_tools'] = json.loads(config.get(sec, 'tools'))
+        if config.has_option(sec, 'db_name'):
+            opts_batch['batch_db_name'] = config.get(sec, 'db_name', raw=True)
+        if config.has_option(sec, 'max_procs'):
+            opts_batch['max_procs'] = config.getint(sec, 'max_procs')
+        if config.has_option(sec, 'max_connections'):
+            opts_batch['max_connections'] = config.getint(sec, 'max_connections')
+        opts.update(opts_batch)
+
+    opts['tool_secs'] = (set(config.sections()) - set(mandatory_secs) -
+                         set(['Batch']))
     return opts
 
 if __name__ == '__main__':
@@ -140,6 +222,12 @@ if __name__ == '__main__':
             'download_files': True,
             'dumps_dir': None,
             'debug': False,
+            'offline': False,
+            'ttl': 3600,
+            'cache_dir': os.path.join('data', 'catalog'),
+            'sink': 'db',
+            'parquet_dir': None,
+            'parquet_row_group': 100000,
             'etl_lines': 1,
             'page_fan': 1,
             'rev_fan': 1,
@@ -147,14 +235,41 @@ if __name__ == '__main__':
             'page_cache_size': 200000,
             'rev_cache_size': 1000000,
             'log_cache_size': 1000000,
+            'load_workers': 1,
+            'log_load_workers': 1,
+            'meta_etl_lines': 1,
+            'meta_cache_size': 1000000,
+            'meta_load_workers': 1,
+            'sql_etl_lines': 1,
+            'sql_chunk_rows': 1000000,
+            'sql_load_workers': 2,
             'db_user': 'auser',
             'db_passw': 'apassw',
             'db_engine': 'ARIA',
+            'fifo_load': False,
+            'index_workers': 4,
             'base_ports': 10000,
             'control_ports': 11000,
             'detect_FA': True,
             'detect_FLIST': True,
-            'detect_GA': True
+            'detect_GA': True,
+            'expand_templates': False,
+            'clean_workers': 1,
+            'clean_chunksize': 64,
+            'filter_namespaces': None,
+            'filter_redirects': False,
+            'filter_min_size': None,
+            'filter_max_size': None,
+            'filter_titles': None,
+            'quality_window': None,
+            'quality_fallback': True,
+            'resume': False,
+            'incremental': False,
+            'batch_langs': None,
+            'batch_tools': None,
+            'batch_db_name': '{lang}_{date}',
+            'max_procs': None,
+            'max_connections': None
             }
     # If some options are overridden by config file, update them
     if args.conf_file:
@@ -202,6 +317,36 @@ if __name__ == '__main__':
     parser.add_argument('--no_download_files', dest='download_files',
                         action='store_false',
                         help=''.join(['Skip download of dump files.']))
+    parser.add_argument('--offline', dest='offline', action='store_true',
+                        help=''.join(['Read dump dates, files, checksums ',
+                                      'and sizes only from the catalog ',
+                                      'cache, without contacting the ',
+                                      'mirror.']))
+    parser.add_argument('--no_offline', dest='offline',
+                        action='store_false',
+                        help=''.join(['Refresh expired catalog entries ',
+                                      'from the mirror.']))
+    parser.add_argument('--ttl', type=int, metavar='SECONDS',
+                        help=''.join(['Seconds before cached catalog ',
+                                      'entries of dumps still in progress ',
+                                      'are retrieved again from the ',
+                                      'mirror.']))
+    parser.add_argument('--cache_dir', metavar='PATH',
+                        help=''.join(['Folder for the catalog cache of ',
+                                      'dump files available in each ',
+                                      'mirror.']))
+    parser.add_argument('--sink', choices=['db', 'parquet'],
+                        help=''.join(['Store pages, revisions, users and ',
+                                      'log items in local DB (db) or in ',
+                                      'Parquet files partitioned by ',
+                                      'namespace and year (parquet).']))
+    parser.add_argument('--parquet_dir', metavar='PATH',
+                        help=''.join(['Folder for Parquet files (default: ',
+                                      'parquet folder next to dump ',
+                                      'files).']))
+    parser.add_argument('--parquet_row_group', type=int, metavar='NUM_ROWS',
+                        help=''.join(['Num. of rows in each row group of ',
+                                      'Parquet files.']))
     parser.add_argument('--etl_lines', type=int, metavar='NUM_ETL_LINES',
                         help=''.join(['Number of ETL processing lines to be ',
                                       'executed. More lines could be added ',
@@ -235,6 +380,50 @@ if __name__ == '__main__':
                                       'data dir for page elements before ',
                                       'flushing data to local DB.'])
                         )
+    parser.add_argument('--load_workers', type=int, metavar='NUM_WORKERS',
+                        help=''.join(['Num. of tmp data files with page ',
+                                      'elements loaded in local DB at the ',
+                                      'same time, while the next one is ',
+                                      'written.'])
+                        )
+    parser.add_argument('--log_load_workers', type=int,
+                        metavar='NUM_WORKERS',
+                        help=''.join(['Num. of tmp data files with logging ',
+                                      'elements loaded in local DB at the ',
+                                      'same time, while the next one is ',
+                                      'written.'])
+                        )
+    parser.add_argument('--meta_etl_lines', type=int, metavar='ETL_LINES',
+                        help=''.join(['Num. of stub-meta-history files ',
+                                      'processed at the same time.'])
+                        )
+    parser.add_argument('--meta_cache_size', type=int, metavar='CACHE_SIZE',
+                        help=''.join(['Num. of revisions to accumulate in ',
+                                      'tmp data dir from stub-meta-history ',
+                                      'files before flushing data to ',
+                                      'local DB.'])
+                        )
+    parser.add_argument('--meta_load_workers', type=int,
+                        metavar='NUM_WORKERS',
+                        help=''.join(['Num. of tmp data files from ',
+                                      'stub-meta-history files loaded in ',
+                                      'local DB at the same time, while ',
+                                      'the next one is written.'])
+                        )
+    parser.add_argument('--sql_etl_lines', type=int, metavar='ETL_LINES',
+                        help=''.join(['Num. of SQL dump files loaded at ',
+                                      'the same time.'])
+                        )
+    parser.add_argument('--sql_chunk_rows', type=int, metavar='NUM_ROWS',
+                        help=''.join(['Num. of rows from SQL dump files ',
+                                      'in each tmp data file loaded in ',
+                                      'local DB.'])
+                        )
+    parser.add_argument('--sql_load_workers', type=int, metavar='NUM_WORKERS',
+                        help=''.join(['Num. of tmp data files from each ',
+                                      'SQL dump file loaded at the same ',
+                                      'time.'])
+                        )
     parser.add_argument('--db_name', type=str, metavar='DB_NAME',
                         help=''.join(['Name of local DB.'])
                         )
@@ -246,9 +435,23 @@ if __name__ == '__main__':
                         )
     parser.add_argument('--db_engine', metavar='DB_ENGINE',
                         help=''.join(['Specific DB engine to store data ',
-                                      'locally. Currently, only ARIA or ',
-                                      'MyISAM engines are supported.'])
+                                      'locally. Load profiles are defined ',
+                                      'for ARIA, MyISAM, InnoDB and ',
+                                      'ColumnStore engines.'])
                         )
+    parser.add_argument('--fifo_load', dest='fifo_load',
+                        action='store_true',
+                        help=''.join(['Stream data to local DB from memory ',
+                                      'through named pipes, instead of ',
+                                      'writing tmp data files to disk.']))
+    parser.add_argument('--no_fifo_load', dest='fifo_load',
+                        action='store_false',
+                        help=''.join(['Load data in local DB from tmp ',
+                                      'data files.']))
+    parser.add_argument('--index_workers', type=int,
+                        help=''.join(['Number of DB connections creating ',
+                                      'primary keys and indexes of tables ',
+                                      'in parallel, after data loads.']))
     parser.add_argument('--base_ports', nargs='+', type=int,
                         help=''.join(['List of base port numbers to be ',
                                       'used by each ETL line. Communication ',
@@ -288,6 +491,99 @@ if __name__ == '__main__':
                         action='store_false',
                         help=''.join(['Skip detection of revisions of ',
                                       'Good Articles.']))
+    parser.add_argument('--expand_templates', dest='expand_templates',
+                        action='store_true',
+                        help=''.join(['Expand templates when cleaning ',
+                                      'revision text, using template ',
+                                      'definitions found in the same dump.']))
+    parser.add_argument('--no_expand_templates', dest='expand_templates',
+                        action='store_false',
+                        help=''.join(['Drop templates when cleaning ',
+                                      'revision text.']))
+    parser.add_argument('--clean_workers', type=int,
+                        metavar='NUM_CLEAN_WORKERS',
+                        help=''.join(['Number of processes to clean ',
+                                      'revision text in each revision ',
+                                      'worker. Unlike rev_fan, it does not ',
+                                      'open more sockets or connections.']))
+    parser.add_argument('--clean_chunksize', type=int, metavar='CHUNK_SIZE',
+                        help=''.join(['Number of revisions sent to a ',
+                                      'cleaning process at a time.']))
+    parser.add_argument('--filter_namespaces', nargs='+', type=int,
+                        metavar='NS',
+                        help=''.join(['Only process pages in these ',
+                                      'namespaces (e.g. 0 for articles).']))
+    parser.add_argument('--filter_redirects', dest='filter_redirects',
+                        action='store_true',
+                        help=''.join(['Discard revisions of redirect pages ',
+                                      'before they are processed.']))
+    parser.add_argument('--no_filter_redirects', dest='filter_redirects',
+                        action='store_false',
+                        help=''.join(['Process revisions of redirect ',
+                                      'pages.']))
+    parser.add_argument('--filter_min_size', type=int, metavar='NUM_CHARS',
+                        help=''.join(['Discard revisions whose text is ',
+                                      'shorter than this.']))
+    parser.add_argument('--filter_max_size', type=int, metavar='NUM_CHARS',
+                        help=''.join(['Discard revisions whose text is ',
+                                      'longer than this.']))
+    parser.add_argument('--filter_titles', metavar='REGEXP',
+                        help=''.join(['Discard pages whose title matches ',
+                                      'this regular expression.']))
+    parser.add_argument('--quality_window', type=int, metavar='NUM_CHARS',
+                        help=''.join(['Only scan this number of characters ',
+                                      'at the top and bottom of revision ',
+                                      'text to detect FA, FLIST and GA.']))
+    parser.add_argument('--quality_fallback', dest='quality_fallback',
+                        action='store_true',
+                        help=''.join(['Scan the rest of revision text if ',
+                                      'any quality template is not found ',
+                                      'within quality_window.']))
+    parser.add_argument('--no_quality_fallback', dest='quality_fallback',
+                        action='store_false',
+                        help=''.join(['Only scan quality_window characters ',
+                                      'at each end of revision text ',
+                                      '(approximate, faster).']))
+    parser.add_argument('--resume', dest='resume', action='store_true',
+                        help=''.join(['Resume an interrupted run in the ',
+                                      'existing database, skipping dump ',
+                                      'files already processed and ',
+                                      'restarting partial ones from their ',
+                                      'last checkpoint.']))
+    parser.add_argument('--no_resume', dest='resume', action='store_false',
+                        help=''.join(['Create the database again and ',
+                                      'process all dump files from ',
+                                      'scratch.']))
+    parser.add_argument('--incremental', dest='incremental',
+                        action='store_true',
+                        help=''.join(['Only load revisions newer than the ',
+                                      'latest one stored in the existing ',
+                                      'database, from a new dump or ',
+                                      'adds-changes dump files.']))
+    parser.add_argument('--no_incremental', dest='incremental',
+                        action='store_false',
+                        help=''.join(['Load all revisions in dump files.']))
+    parser.add_argument('--batch_langs', nargs='+', metavar='LANG',
+                        help=''.join(['Run tools for all these languages ',
+                                      '(e.g. eswiki frwiki), scheduled ',
+                                      'across max_procs and ',
+                                      'max_connections, instead of lang.']))
+    parser.add_argument('--batch_tools', nargs='+', metavar='SECTION',
+                        help=''.join(['Tool sections to run for each ',
+                                      'language in batch mode (default: ',
+                                      'sections in config file).']))
+    parser.add_argument('--batch_db_name', metavar='DB_NAME',
+                        help=''.join(['Database name for each language in ',
+                                      'batch mode, with {lang} and {date} ',
+                                      'placeholders.']))
+    parser.add_argument('--max_procs', type=int, metavar='NUM_PROCS',
+                        help=''.join(['Maximum number of ETL processes ',
+                                      'running at the same time in batch ',
+                                      'mode (default: number of CPUs).']))
+    parser.add_argument('--max_connections', type=int, metavar='NUM_CONNS',
+                        help=''.join(['Maximum number of DB connections ',
+                                      'open at the same time in batch ',
+                                      'mode.']))
     # Finally, any option directly specified on the command-line will
     # override previous values assigned to any argument
     args = parser.parse_args(remain_args)
@@ -300,7 +596,21 @@ if __name__ == '__main__':
 
     # TODO: Control for incompatible combinations of command-line arguments
 
-    if 'ETL:RevHistory' in opts['tool_secs']:
+    # Catalog of dump files shared by all downloaders of this mirror
+    DumpCatalog.for_mirror(args.mirror, cache_dir=args.cache_dir,
+                           ttl=args.ttl, offline=args.offline)
+
+    tool_secs = opts['tool_secs']
+    if args.batch_langs:
+        batch = BatchTask(langs=args.batch_langs,
+                          tools=args.batch_tools or sorted(tool_secs),
+                          opts=vars(args), max_procs=args.max_procs,
+                          max_connections=args.max_connections)
+        batch.execute()
+        # All tools have been run for every language in the batch
+        tool_secs = set()
+
+    if 'ETL:RevHistory' in tool_secs:
         # Testing with default options:
         #   - lang: 'scowiki'
         #   - date: latest dump
@@ -319,12 +629,44 @@ if __name__ == '__main__':
                      base_ports=args.base_ports,
                      control_ports=args.control_ports,
                      dumps_dir=args.dumps_dir,
-                     debug=args.debug)
-
-    if 'ETL:RevMeta' in opts['tool_secs']:
-        pass
+                     debug=args.debug,
+                     expand_templates=args.expand_templates,
+                     clean_workers=args.clean_workers,
+                     clean_chunksize=args.clean_chunksize,
+                     filter_namespaces=args.filter_namespaces,
+                     filter_redirects=args.filter_redirects,
+                     filter_min_size=args.filter_min_size,
+                     filter_max_size=args.filter_max_size,
+                     filter_titles=args.filter_titles,
+                     quality_window=args.quality_window,
+                     quality_fallback=args.quality_fallback,
+                     resume=args.resume,
+                     incremental=args.incremental,
+                     sink=args.sink,
+                     parquet_dir=args.parquet_dir,
+                     parquet_row_group=args.parquet_row_group,
+                     load_workers=args.load_workers,
+                     fifo_load=args.fifo_load,
+                     index_workers=args.index_workers)
+
+    if 'ETL:RevMeta' in tool_secs:
+        task = tasks.RevMetaTask(lang=args.lang,
+                                 date=args.date,
+                                 etl_lines=args.meta_etl_lines,
+                                 host=args.host, port=args.port,
+                                 db_name=args.db_name, db_user=args.db_user,
+                                 db_passw=args.db_passw,
+                                 db_engine=args.db_engine)
+
+        task.execute(meta_cache_size=args.meta_cache_size,
+                     mirror=args.mirror, download_files=args.download_files,
+                     dumps_dir=args.dumps_dir,
+                     debug=args.debug,
+                     meta_load_workers=args.meta_load_workers,
+                     fifo_load=args.fifo_load,
+                     index_workers=args.index_workers)
 
-    if 'ETL:PagesLogging' in opts['tool_secs']:
+    if 'ETL:PagesLogging' in tool_secs:
         # Testing with default options:
         #   - lang: 'scowiki'
         #   - date: latest dump
@@ -343,19 +685,29 @@ if __name__ == '__main__':
                      base_ports=args.base_ports,
                      control_ports=args.control_ports,
                      dumps_dir=args.dumps_dir,
-                     debug=args.debug)
-
-    if 'ETL:SQLDumps' in opts['tool_secs']:
+                     debug=args.debug,
+                     sink=args.sink,
+                     parquet_dir=args.parquet_dir,
+                     parquet_row_group=args.parquet_row_group,
+                     log_load_workers=args.log_load_workers,
+                     fifo_load=args.fifo_load,
+                     index_workers=args.index_workers)
+
+    if 'ETL:SQLDumps' in tool_secs:
         task = tasks.SQLDumpsTask(lang=args.lang, date=args.date,
                                   host=args.host, port=args.port,
                                   db_name=args.db_name,
                                   db_user=args.db_user,
                                   db_passw=args.db_passw,
-                                  db_engine=args.db_engine)
+                                  db_engine=args.db_engine,
+                                  etl_lines=args.sql_etl_lines)
 
         task.execute(mirror=args.mirror, download_files=args.download_files,
                      dumps_dir=args.dumps_dir,
-                     debug=args.debug)
+                     debug=args.debug,
+                     chunk_rows=args.sql_chunk_rows,
+                     load_workers=args.sql_load_workers,
+                     fifo_load=args.fifo_load)
 
     print("Finish time is %s" % (time.strftime("%Y-%m-%d %H:%M:%S %Z",
                                                time.localtime())))
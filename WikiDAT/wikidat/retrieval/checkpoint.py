@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Progress checkpoints for ETL workflows processing dump files
+
+Each consumer (stage) of the ETL line records, for the dump file in
+process, the page id below which all items have been flushed to their
+target store (MySQL or Elasticsearch), as well as the highest page id sent
+to that store so far. A file is marked as done once all its stages have
+finished. Checkpoints are stored as small JSON files in the logs folder
+next to the dump file:
+
+    <dumps_dir>/logs/<dump_file>.<stage>.ckpt
+    <dumps_dir>/logs/<dump_file>.done
+
+Compressed dump files cannot be read from an arbitrary byte offset, so
+interrupted files are restarted from the beginning, skipping all pages
+below the last consistent page id.
+"""
+import os
+import json
+import glob
+import time
+
+# Stages (consumers) of the revision history ETL line
+REVHIST_STAGES = ('page', 'revision')
+
+
+def _logs_dir(path):
+    return os.path.join(os.path.split(path)[0], 'logs')
+
+
+def checkpoint_path(path, stage):
+    """
+    Path of checkpoint file for stage of dump file in path
+    """
+    return os.path.join(_logs_dir(path),
+                        '.'.join([os.path.split(path)[1], stage, 'ckpt']))
+
+
+def done_path(path):
+    """
+    Path of file marking dump file in path as completely processed
+    """
+    return os.path.join(_logs_dir(path), os.path.split(path)[1] + '.done')
+
+
+def save_checkpoint(ckpt_file, page_id=None, min_page_id=None,
+                    max_page_id=None, rows=0, complete=False):
+    """
+    Atomically replace contents of checkpoint file
+
+    Arguments:
+        - ckpt_file = Path of checkpoint file
+        - page_id = All items with lower page id are already stored
+        - min_page_id = Lowest page id of items sent to the store
+        - max_page_id = Highest page id of items sent to the store
+        - rows = Number of items stored so far
+        - complete = All items of this stage have been stored
+    """
+    data = {'page_id': page_id, 'min_page_id': min_page_id,
+            'max_page_id': max_page_id,
+            'rows': rows, 'complete': complete,
+            'time': time.strftime("%Y-%m-%d %H:%M:%S %Z", time.localtime())}
+    tmp_file = ckpt_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, ckpt_file)
+
+
+def load_checkpoint(ckpt_file):
+    """
+    Return dict with contents of checkpoint file, or None if there is no
+    checkpoint
+    """
+    try:
+        with open(ckpt_file) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def resume_point(path, stages=REVHIST_STAGES):
+    """
+    Return tuple (start_page_id, min_page_id, max_page_id) to restart
+    processing of dump file in path from the last point consistent for all
+    stages. start_page_id is None if the file must be processed from the
+    beginning. Items with page id in [min_page_id, max_page_id] may have been
+    stored (both are None if nothing has been stored yet).
+    """
+    start_ids = []
+    min_ids = []
+    max_ids = []
+    for stage in stages:
+        ckpt = load_checkpoint(checkpoint_path(path, stage))
+        if ckpt is None:
+            # Nothing was stored by this stage
+            start_ids.append(None)
+            continue
+        if ckpt['max_page_id'] is not None:
+            min_ids.append(ckpt['min_page_id'])
+            max_ids.append(ckpt['max_page_id'])
+        # Completed stages do not constrain the restart point
+        if not ckpt['complete']:
+            start_ids.append(ckpt['page_id'])
+    min_page_id = min(min_ids) if min_ids else None
+    max_page_id = max(max_ids) if max_ids else None
+    if None in start_ids:
+        return None, min_page_id, max_page_id
+    if not start_ids:
+        return (max_page_id + 1 if max_page_id is not None else None,
+                min_page_id, max_page_id)
+    return min(start_ids), min_page_id, max_page_id
+
+
+def is_complete(path, stages=REVHIST_STAGES):
+    """
+    Check whether all stages have stored every item from dump file in path
+    """
+    for stage in stages:
+        ckpt = load_checkpoint(checkpoint_path(path, stage))
+        if ckpt is None or not ckpt['complete']:
+            return False
+    return True
+
+
+def mark_done(path):
+    """
+    Mark dump file in path as completely processed
+    """
+    with open(done_path(path), 'w') as f:
+        f.write(time.strftime("%Y-%m-%d %H:%M:%S %Z", time.localtime()))
+
+
+def is_done(path):
+    """
+    Check whether dump file in path has been completely processed
+    """
+    return os.path.isfile(done_path(path))
+
+
+def clear_checkpoints(path):
+    """
+    Remove all checkpoints and done mark of dump file in path
+    """
+    base = os.path.join(_logs_dir(path), os.path.split(path)[1])
+    for ckpt_file in glob.glob(glob.escape(base) + '.*.ckpt'):
+        os.remove(ckpt_file)
+    if os.path.isfile(done_path(path)):
+        os.remove(done_path(path))
@@ -10,6 +10,7 @@ Subsequent implementations of this module will use SQLAlchemy to manage
 DB-related tasks
 """
 check_database = """SHOW DATABASES LIKE '{dbname!s}'"""
+check_table = """SHOW TABLES LIKE '{table!s}'"""
 
 drop_database = """DROP DATABASE IF EXISTS {dbname!s}"""
 create_database = """CREATE DATABASE {dbname!s}
@@ -281,19 +282,104 @@ create_IP_country = """CREATE TABLE IP_country (
                         country VARCHAR(3) NOT NULL
                         ) ENGINE {engine!s}
                         """
+
+# Share of revisions of each page from each country (analytics/ip_countries)
+drop_country_contrib = """DROP TABLE IF EXISTS country_contrib"""
+create_country_contrib = """CREATE TABLE country_contrib (
+                            page_id INT UNSIGNED NOT NULL,
+                            country VARCHAR(7) NOT NULL,
+                            contribution DOUBLE NOT NULL
+                            ) ENGINE {engine!s}
+                            """
+
+# Activity metrics of each month (analytics/activity/monthly_metrics)
+drop_monthly_metrics = """DROP TABLE IF EXISTS monthly_metrics"""
+create_monthly_metrics = """CREATE TABLE monthly_metrics (
+                            month DATE NOT NULL,
+                            edits INT UNSIGNED NOT NULL,
+                            edits_reg INT UNSIGNED NOT NULL,
+                            edits_nobots INT UNSIGNED NOT NULL,
+                            users INT UNSIGNED NOT NULL,
+                            active_users INT UNSIGNED NOT NULL,
+                            very_active_users INT UNSIGNED NOT NULL,
+                            sysops INT UNSIGNED NOT NULL,
+                            new_articles INT UNSIGNED NOT NULL,
+                            articles INT UNSIGNED NOT NULL,
+                            new_redirects INT UNSIGNED NOT NULL,
+                            redirects INT UNSIGNED NOT NULL,
+                            new_fa INT UNSIGNED NOT NULL,
+                            fa_articles INT UNSIGNED NOT NULL,
+                            total_length BIGINT UNSIGNED NOT NULL
+                            ) ENGINE {engine!s}
+                            """
+insert_monthly_metrics = ("INSERT INTO monthly_metrics VALUES(%s" +
+                          ", %s" * 14 + ")")
+
+# State of articles at the start of the last month in monthly_metrics
+drop_monthly_metrics_pages = """DROP TABLE IF EXISTS
+                                monthly_metrics_pages"""
+create_monthly_metrics_pages = """CREATE TABLE monthly_metrics_pages (
+                               page_id INT UNSIGNED NOT NULL,
+                               page_len INT UNSIGNED NOT NULL,
+                               page_is_redirect TINYINT(1) UNSIGNED NOT NULL,
+                               page_is_fa TINYINT(1) UNSIGNED NOT NULL,
+                               page_ever_fa TINYINT(1) UNSIGNED NOT NULL
+                               ) ENGINE {engine!s}
+                               """
 insert_namespaces = """INSERT INTO namespaces VALUES(%s, %s)"""
 
-pk_page = """ALTER TABLE page ADD PRIMARY KEY page_id(page_id)"""
-pk_revision = """ALTER TABLE revision ADD PRIMARY KEY rev_id(rev_id)"""
-pk_namespaces = """ALTER TABLE namespaces ADD PRIMARY KEY code(code)"""
-pk_user = """ALTER TABLE user ADD PRIMARY KEY user_id(user_id)"""
-pk_logging = """ALTER TABLE logging ADD PRIMARY KEY log_id(log_id)"""
-pk_block = """ALTER TABLE block ADD PRIMARY KEY block_id(block_id)"""
-pk_user_new = """ALTER TABLE user_new ADD PRIMARY KEY
-                 user_log_id(user_log_id)"""
-pk_user_level = """ALTER TABLE user_level ADD PRIMARY KEY
-                   level_log_id(level_log_id)"""
-pk_revision_IP = """ALTER TABLE revision_IP ADD PRIMARY KEY rev_id(rev_id)"""
-pk_revision_user_zero = """ALTER TABLE revision_user_zero
-                           ADD PRIMARY KEY rev_id(rev_id)"""
-pk_IP_country = """ALTER TABLE IP_country ADD PRIMARY KEY ip(ip)"""
+# Primary and secondary keys of each table, created after data loads. All
+# keys of a table are added with a single ALTER TABLE statement, so that
+# data of every table is sorted and rebuilt only once
+keys = {
+    'page': ['PRIMARY KEY page_id(page_id)'],
+    'revision': ['PRIMARY KEY rev_id(rev_id)',
+                 'INDEX rev_page(rev_page)',
+                 'INDEX rev_user(rev_user)',
+                 'INDEX rev_timestamp(rev_timestamp)'],
+    'revision_hash': ['PRIMARY KEY rev_id(rev_id)'],
+    'namespaces': ['PRIMARY KEY code(code)'],
+    'user': ['PRIMARY KEY user_id(user_id)'],
+    'revision_IP': ['PRIMARY KEY rev_id(rev_id)'],
+    'revision_user_zero': ['PRIMARY KEY rev_id(rev_id)'],
+    'IP_country': ['PRIMARY KEY ip(ip)'],
+    'country_contrib': ['PRIMARY KEY page_country(page_id, country)'],
+    'monthly_metrics': ['PRIMARY KEY month(month)'],
+    'monthly_metrics_pages': ['PRIMARY KEY page_id(page_id)'],
+    'logging': ['PRIMARY KEY log_id(log_id)'],
+    'block': ['PRIMARY KEY block_id(block_id)'],
+    'user_new': ['PRIMARY KEY user_log_id(user_log_id)'],
+    'user_level': ['PRIMARY KEY level_log_id(level_log_id)'],
+}
+add_keys = """ALTER TABLE {table!s} ADD {keys!s}"""
+
+# Tables of each schema, largest ones first
+tables_revhist = ('revision', 'revision_hash', 'page', 'user', 'revision_IP',
+                  'revision_user_zero', 'IP_country', 'namespaces')
+tables_logitem = ('logging', 'block', 'user_new', 'user_level')
+
+# Session settings of connections loading data: tables are created without
+# keys, and uniqueness/foreign key checks are disabled
+load_session = ["SET SESSION unique_checks = 0",
+                "SET SESSION foreign_key_checks = 0"]
+
+# Session settings of connections loading data applied only if the DB account
+# is allowed to: binary logging is disabled (requires SUPER or BINLOG ADMIN)
+load_session_optional = ["SET SESSION sql_log_bin = 0"]
+
+# Load profiles for each DB engine (key: lowercase engine name)
+#   - engine: Engine name in CREATE TABLE statements
+#   - keys: Whether the engine supports the keys created after data loads
+#   - index_session: Session settings of connections creating keys
+load_profiles = {
+    'aria': {'engine': 'Aria', 'keys': True,
+             'index_session': ["SET SESSION aria_sort_buffer_size = "
+                               "268435456"]},
+    'myisam': {'engine': 'MyISAM', 'keys': True,
+               'index_session': ["SET SESSION myisam_sort_buffer_size = "
+                                 "268435456"]},
+    'innodb': {'engine': 'InnoDB', 'keys': True, 'index_session': []},
+    # Columnar engine, without indexes
+    'columnstore': {'engine': 'ColumnStore', 'keys': False,
+                    'index_session': []},
+}
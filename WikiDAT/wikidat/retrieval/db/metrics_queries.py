@@ -13,6 +13,9 @@ activity metrics.
 
 Template strings will be used to facilitate the subsequent substitution
 of required fields to complete the query.
+
+Monthly series of these metrics are computed in a single pass over table
+revision, and updated incrementally, by analytics/activity/monthly_metrics.py
 """
 
 """
@@ -7,10 +7,14 @@ Created on Sat Mar 29 22:13:19 2014
 from lxml import etree
 import subprocess
 import os
+import re
 from .page import Page
-from .revision import Revision
+from .revision import Revision, is_redirect
 from .logitem import LogItem
 from utils import maps
+from wikiextractor.wikiextractor.clean import (define_template,
+                                               set_template_namespace,
+                                               save_templates)
 
 
 class DumpFile(object):
@@ -55,9 +59,122 @@ class DumpFile(object):
                 return ns_dict
 
 
-def process_xml(dump_file=None):
+class ItemFilter(object):
+    """
+    Pre-filter for pages and revisions extracted from dump files. Items
+    rejected by the filter are discarded in process_xml, before they are
+    built and sent downstream to workers.
+    """
+    def __init__(self, namespaces=None, skip_redirects=False, min_size=None,
+                 max_size=None, exclude_titles=None):
+        """
+        Arguments:
+            - namespaces: list of namespace codes to retain (None for all)
+            - skip_redirects: Discard revisions of redirect pages
+            - min_size: Discard revisions with shorter text (in chars)
+            - max_size: Discard revisions with longer text (in chars)
+            - exclude_titles: Regular expression, pages whose title
+            matches it are discarded
+        """
+        self.namespaces = (set(str(ns) for ns in namespaces)
+                           if namespaces is not None else None)
+        self.skip_redirects = skip_redirects
+        self.min_size = min_size
+        self.max_size = max_size
+        self.exclude_titles = (re.compile(exclude_titles)
+                               if exclude_titles else None)
+
+    def accept_page(self, page_dict):
+        """
+        Check namespace and title of a page (dict {tag:text})
+        """
+        if (self.namespaces is not None and
+                page_dict['ns'] not in self.namespaces):
+            return False
+        if (self.exclude_titles is not None and page_dict['title'] and
+                self.exclude_titles.search(page_dict['title'])):
+            return False
+        return True
+
+    def accept_revision(self, rev_dict):
+        """
+        Check text of a revision (dict {tag:text})
+        """
+        text = rev_dict.get('text') or ''
+        if self.skip_redirects and is_redirect(text):
+            return False
+        if self.min_size is not None and len(text) < self.min_size:
+            return False
+        if self.max_size is not None and len(text) > self.max_size:
+            return False
+        return True
+
+
+def process_stub_xml(dump_file=None):
+    """
+    Lean parser for stub-meta-history dump files, which have metadata of
+    every page and revision but no text. Only page and revision elements are
+    reported by the XML parser. Yields Revision objects (with text length in
+    'len_text' and 'sha1' from the dump) and then the Page they belong to.
+    """
+    page_dict = None
+    rev_parent_id = None
+
+    in_stream = dump_file.open_dump()
+    for event, elem in etree.iterparse(in_stream, tag=('{*}page',
+                                                       '{*}revision'),
+                                       recover=True, huge_tree=True):
+        if elem.tag.endswith('revision'):
+            if page_dict is None:
+                page_dict = {x.tag.split('}')[1]: x.text
+                             for x in elem.getparent()}
+            rev_dict = {}
+            contrib_dict = {}
+            for x in elem:
+                tag = x.tag.split('}')[1]
+                if tag == 'contributor':
+                    contrib_dict = {c.tag.split('}')[1]: c.text for c in x}
+                elif tag == 'text':
+                    rev_dict['len_text'] = x.get('bytes')
+                else:
+                    rev_dict[tag] = x.text
+            rev_dict['page_id'] = page_dict['id']
+            rev_dict['ns'] = page_dict['ns']
+            rev_dict['contrib_dict'] = contrib_dict
+            # Recent dumps include parentid, otherwise use previous revision
+            rev_dict['rev_parent_id'] = rev_dict.get('parentid', rev_parent_id)
+            rev_dict['item_type'] = 'revision'
+            yield Revision(rev_dict)
+
+            rev_parent_id = rev_dict['id']
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+        else:
+            if page_dict is not None:
+                page_dict['item_type'] = 'page'
+                yield Page(page_dict)
+            page_dict = None
+            rev_parent_id = None
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+
+def process_xml(dump_file=None, item_filter=None, start_page_id=None,
+                min_rev_id=None):
+    """
+    Extract pages, revisions and logged actions from dump_file. Items
+    rejected by item_filter are discarded. If start_page_id is given, all
+    pages with lower page id are skipped (to resume an interrupted run).
+    If min_rev_id is given, only revisions with higher rev id are extracted,
+    as well as pages with at least one of them (incremental loads).
+    """
     rev_parent_id = None
     page_dict = None
+    skip_page = False
+    new_revs = 0
 
     in_stream = dump_file.open_dump()
     for event, elem in etree.iterparse(in_stream, recover=True,
@@ -86,9 +203,42 @@ def process_xml(dump_file=None):
                 # Build dict {tag:text} for all children of page
                 # above first revision tag
                 page_dict = {x.tag.split('}')[1]: x.text for x in page}
+                skip_page = ((start_page_id is not None and
+                              int(page_dict['id']) < start_page_id) or
+                             (item_filter is not None and
+                              not item_filter.accept_page(page_dict)))
+
+            # Discard all revisions of filtered pages right away
+            if skip_page:
+                contrib_dict = None
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+                continue
+
+            # Discard revisions already stored, reading only their id
+            if min_rev_id is not None:
+                rev_id = elem.findtext('{*}id')
+                if int(rev_id) <= min_rev_id:
+                    rev_parent_id = rev_id
+                    contrib_dict = None
+                    elem.clear()
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+                    continue
 
             # Build dict {tag:text} for all children of revision
             rev_dict = {x.tag.split('}')[1]: x.text for x in elem}
+
+            if (item_filter is not None and
+                    not item_filter.accept_revision(rev_dict)):
+                rev_parent_id = rev_dict['id']
+                rev_dict = None
+                contrib_dict = None
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+                continue
             # Embed page_id, contrib_dict and return item
             rev_dict['page_id'] = page_dict['id']
             # To skip pattern matching for non-articles
@@ -98,6 +248,7 @@ def process_xml(dump_file=None):
 
             rev_dict['item_type'] = 'revision'
             yield Revision(rev_dict)
+            new_revs += 1
 
             # Save rev_id (rev_parent_id of the next revision item)
             rev_parent_id = rev_dict['id']
@@ -110,10 +261,13 @@ def process_xml(dump_file=None):
                 del elem.getparent()[0]
 
         if tag == 'page':
-            page_dict['item_type'] = 'page'
-            yield Page(page_dict)
+            if not skip_page and (min_rev_id is None or new_revs > 0):
+                page_dict['item_type'] = 'page'
+                yield Page(page_dict)
             # Clear memory
             page_dict = None
+            skip_page = False
+            new_revs = 0
             rev_parent_id = None
             elem.clear()
             while elem.getprevious() is not None:
@@ -139,3 +293,31 @@ def process_xml(dump_file=None):
             elem.clear()
             while elem.getprevious() is not None:
                 del elem.getparent()[0]
+
+
+def process_templates(dump_files=None, templates_file=None):
+    """
+    Build a persisted index of template definitions (pages in namespace 10)
+    found in a set of dump files, to expand templates while cleaning
+    revision text. Only the latest revision of every template is retained.
+
+    Returns the number of templates saved in templates_file
+    """
+    ns_dict = dump_files[0].get_namespaces()
+    set_template_namespace(ns_dict[10])
+
+    # Skip revisions of all pages out of the template namespace
+    item_filter = ItemFilter(namespaces=[10])
+
+    for dump_file in dump_files:
+        text = None
+        for item in process_xml(dump_file=dump_file, item_filter=item_filter):
+            if item['item_type'] == 'revision':
+                # Revisions of a page are sorted by timestamp in dump files
+                text = item['text']
+            elif item['item_type'] == 'page':
+                if text is not None:
+                    define_template(item['title'], [text])
+                text = None
+
+    return save_templates(templates_file)
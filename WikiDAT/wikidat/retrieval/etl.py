@@ -9,13 +9,19 @@ import sys
 import os
 import time
 import multiprocessing as mp
-import subprocess
+import logging
+import redis
 from .processors import Producer, Processor, Consumer
-from .dump import DumpFile, process_xml
-from .page import pages_to_file, pages_file_to_db
-from .revision import revs_to_file, revs_file_to_db
+from .dump import DumpFile, process_xml, process_stub_xml
+from .page import Page, pages_to_file, pages_file_to_db, page_id_of
+from .revision import (revs_to_file, revs_file_to_db, rev_page_id,
+                       rev_meta_rows)
+from . import checkpoint
 from .logitem import logitem_to_file, logitem_file_to_db
-from utils.dbutils import MySQLDB
+from .sqldump import parse_sql_dump, LOAD_TSV
+from .tsv import TSVWriter, LOAD_FIELDS
+from .parquet_sink import items_to_parquet
+from utils.dbutils import MySQLDB, BulkLoader
 from elasticsearch import Elasticsearch, helpers
 
 
@@ -51,9 +57,30 @@ class RevisionHistoryETL(ETL):
                  kwargs=None, paths_queue=None, lang=None, page_fan=1,
                  rev_fan=3, page_cache_size=1000000, rev_cache_size=1000000,
                  db_name=None, db_user=None, db_passw=None,
-                 base_port=None, control_port=None):
+                 base_port=None, control_port=None, templates_file=None,
+                 clean_workers=1, clean_chunksize=64, item_filter=None,
+                 quality_window=None, quality_fallback=True, resume=False,
+                 checkpoint_every=1000, min_rev_id=None, sink='db',
+                 parquet_dir=None, parquet_row_group=100000,
+                 load_workers=1, fifo=False):
         """
         Initialize new PageRevision workflow
+
+        If resume is True, dump files already processed in a previous run
+        are skipped, and interrupted files are restarted from the last page
+        consistently stored by all stages. Workers report their progress
+        every checkpoint_every items.
+
+        If min_rev_id is given, only revisions with higher rev id are loaded,
+        and rows of their pages already stored are replaced.
+
+        If sink is 'parquet', pages and revisions are written to Parquet
+        files in parquet_dir (row groups of parquet_row_group rows) instead
+        of being loaded in MySQL and Elasticsearch.
+
+        Page data loads run in load_workers background threads. If fifo is
+        True, page data is streamed from memory through named pipes instead
+        of temp files.
         """
         super(RevisionHistoryETL,
               self).__init__(group=None, target=None, name=name, args=None,
@@ -66,6 +93,20 @@ class RevisionHistoryETL(ETL):
         self.rev_cache_size = rev_cache_size
         self.base_port = base_port
         self.control_port = control_port
+        self.templates_file = templates_file
+        self.clean_workers = clean_workers
+        self.clean_chunksize = clean_chunksize
+        self.item_filter = item_filter
+        self.quality_window = quality_window
+        self.quality_fallback = quality_fallback
+        self.resume = resume
+        self.checkpoint_every = checkpoint_every
+        self.min_rev_id = min_rev_id
+        self.sink = sink
+        self.parquet_dir = parquet_dir
+        self.parquet_row_group = parquet_row_group
+        self.load_workers = load_workers
+        self.fifo = fifo
 
     def run(self):
         """
@@ -110,12 +151,40 @@ class RevisionHistoryETL(ETL):
         rev_insert_name = '-'.join([self.name, 'insert_revision'])
 
         for path in iter(self.paths_queue.get, 'STOP'):
+            start_page_id = None
+            if self.resume:
+                if (checkpoint.is_done(path) or
+                        checkpoint.is_complete(path)):
+                    print(self.name, "Skipping already processed file:")
+                    print(path)
+                    checkpoint.mark_done(path)
+                    self.paths_queue.task_done()
+                    continue
+                start_page_id, min_id, max_id = checkpoint.resume_point(path)
+                if (max_id is not None and self.min_rev_id is None and
+                        self.sink == 'db'):
+                    # Undo page rows stored after the last consistent point
+                    # Revision docs in Elasticsearch are simply overwritten,
+                    # as well as page rows in incremental loads
+                    db_ns.send_query("DELETE FROM page WHERE page_id >= %d "
+                                     "AND page_id <= %d" % (
+                                         start_page_id or min_id, max_id))
+                if start_page_id is not None:
+                    print(self.name, "Resuming from page id %d file:" % (
+                          start_page_id))
+                    print(path)
+            else:
+                checkpoint.clear_checkpoints(path)
+
             # Start subprocess to extract elements from revision dump file
             dump_file = DumpFile(path)
             xml_reader = Producer(name=xml_reader_name,
                                   target=process_xml,
                                   kwargs=dict(
-                                      dump_file=dump_file),
+                                      dump_file=dump_file,
+                                      item_filter=self.item_filter,
+                                      start_page_id=start_page_id,
+                                      min_rev_id=self.min_rev_id),
                                   consumers=self.page_fan + self.rev_fan,
                                   push_pages_port=self.base_port,
                                   push_revs_port=self.base_port+1,
@@ -136,7 +205,9 @@ class RevisionHistoryETL(ETL):
                                          producers=1, consumers=1,
                                          pull_port=self.base_port,
                                          push_port=self.base_port+2,
-                                         control_port=self.control_port)
+                                         control_port=self.control_port,
+                                         checkpoint_key=page_id_of,
+                                         checkpoint_every=self.checkpoint_every)
                 process_page.start()
                 workers.append(process_page)
                 print(page_worker_name, "started")
@@ -153,11 +224,18 @@ class RevisionHistoryETL(ETL):
                 process_revision = Processor(name=rev_worker_name,
                                              target=revs_to_file,
                                              kwargs=dict(
-                                                 lang=self.lang),
+                                                 lang=self.lang,
+                                                 templates_file=self.templates_file,
+                                                 clean_workers=self.clean_workers,
+                                                 clean_chunksize=self.clean_chunksize,
+                                                 quality_window=self.quality_window,
+                                                 quality_fallback=self.quality_fallback),
                                              producers=1, consumers=1,
                                              pull_port=self.base_port+1,
                                              push_port=self.base_port+3,
-                                             control_port=self.control_port)
+                                             control_port=self.control_port,
+                                             checkpoint_key=rev_page_id,
+                                             checkpoint_every=self.checkpoint_every)
                 process_revision.start()
                 workers.append(process_revision)
                 db_workers_revs.append(db_wrev)
@@ -174,26 +252,47 @@ class RevisionHistoryETL(ETL):
                 os.makedirs(tmp_dir)
             log_file = os.path.join(log_dir, file_name + '.log')
 
+            if self.sink == 'parquet':
+                page_target = rev_target = items_to_parquet
+                page_kwargs = dict(table='page', parquet_dir=self.parquet_dir,
+                                   file_name=file_name,
+                                   row_group_size=self.parquet_row_group,
+                                   max_rows=self.page_cache_size,
+                                   log_file=log_file)
+                rev_kwargs = dict(page_kwargs, table='revision',
+                                  max_rows=self.rev_cache_size)
+            else:
+                page_target = pages_file_to_db
+                page_kwargs = dict(con=db_pages, log_file=log_file,
+                                   tmp_dir=tmp_dir,
+                                   file_rows=self.page_cache_size,
+                                   etl_prefix=self.name,
+                                   replace=self.min_rev_id is not None,
+                                   load_workers=self.load_workers,
+                                   fifo=self.fifo)
+                rev_target = revs_file_to_db
+                rev_kwargs = dict(con=db_revs, es_con=es_revs,
+                                  log_file=log_file, tmp_dir=tmp_dir,
+                                  file_rows=self.rev_cache_size,
+                                  etl_prefix=self.name, lang=self.lang)
+
             page_insert_db = Consumer(name=page_insert_name,
-                                      target=pages_file_to_db,
-                                      kwargs=dict(con=db_pages,
-                                                  log_file=log_file,
-                                                  tmp_dir=tmp_dir,
-                                                  file_rows=self.page_cache_size,
-                                                  etl_prefix=self.name),
+                                      target=page_target,
+                                      kwargs=page_kwargs,
                                       producers=self.page_fan,
-                                      pull_port=self.base_port+2)
+                                      pull_port=self.base_port+2,
+                                      checkpoint_file=checkpoint.checkpoint_path(
+                                          path, 'page'),
+                                      checkpoint_key=page_id_of)
 
             rev_insert_db = Consumer(name=rev_insert_name,
-                                     target=revs_file_to_db,
-                                     kwargs=dict(con=db_revs,
-                                                 es_con=es_revs,
-                                                 log_file=log_file,
-                                                 tmp_dir=tmp_dir,
-                                                 file_rows=self.rev_cache_size,
-                                                 etl_prefix=self.name),
+                                     target=rev_target,
+                                     kwargs=rev_kwargs,
                                      producers=self.rev_fan,
-                                     pull_port=self.base_port+3)
+                                     pull_port=self.base_port+3,
+                                     checkpoint_file=checkpoint.checkpoint_path(
+                                         path, 'revision'),
+                                     checkpoint_key=rev_page_id)
 
             page_insert_db.start()
             print(page_insert_name, "started")
@@ -209,6 +308,8 @@ class RevisionHistoryETL(ETL):
             rev_insert_db.join()
 
             # Mark this path as done
+            if checkpoint.is_complete(path):
+                checkpoint.mark_done(path)
             self.paths_queue.task_done()
 
         # Mark STOP message as processed and finish
@@ -228,8 +329,143 @@ class RevisionMetaETL(ETL):
     """
     Implements workflow to extract and store metadata for pages and
     revisions (stub-meta-history.xml files)
+
+    Stub files have no revision text, so there is nothing to clean or
+    analyze in worker processes. Each ETL line parses its dump files with a
+    lean parser and writes rows straight to temp files, which are bulk
+    loaded in tables page, revision and revision_hash every cache_size
+    revisions. Parallelism comes from running several ETL lines, one for
+    each stub file at a time. Data loads run in load_workers background
+    threads while the next temp files are written (or streamed from memory
+    through named pipes, if fifo is True).
     """
-    pass
+    def __init__(self, group=None, target=None, name=None, args=None,
+                 kwargs=None, paths_queue=None, lang=None,
+                 cache_size=1000000, db_name=None, db_user=None,
+                 db_passw=None, load_workers=1, fifo=False):
+        """
+        Initialize new RevisionMeta workflow
+        """
+        super(RevisionMetaETL,
+              self).__init__(group=None, target=None, name=name, args=None,
+                             kwargs=None, lang=lang, db_name=db_name,
+                             db_user=db_user, db_passw=db_passw)
+        self.paths_queue = paths_queue
+        self.cache_size = cache_size
+        self.load_workers = load_workers
+        self.fifo = fifo
+
+    def run(self):
+        """
+        Execute workflow to import page and revision metadata from stub
+        dump files
+        """
+        start = time.time()
+        print(self.name, "Starting RevisionMetaETL workflow at %s" % (
+              time.strftime("%Y-%m-%d %H:%M:%S %Z", time.localtime())))
+
+        db_meta = MySQLDB(host='localhost', port=5306, user=self.db_user,
+                          passwd=self.db_passw, db=self.db_name)
+        db_meta.connect()
+        loader = BulkLoader(db_meta, workers=self.load_workers,
+                            fifo=self.fifo)
+        redis_cache = redis.Redis(host='localhost')
+
+        insert_data = ("LOAD DATA LOCAL INFILE '%s' INTO TABLE %s " +
+                       LOAD_FIELDS)
+        tables = ('page', 'revision', 'revision_hash')
+
+        for path in iter(self.paths_queue.get, 'STOP'):
+            print(self.name, "Extracting data from XML stub-meta file:")
+            print(path)
+            log_dir = os.path.join(os.path.split(path)[0], 'logs')
+            tmp_dir = os.path.join(os.getcwd(), os.path.split(path)[0], 'tmp')
+            file_name = os.path.split(path)[1]
+            if not os.path.exists(log_dir):
+                os.makedirs(log_dir)
+            if not os.path.exists(tmp_dir):
+                os.makedirs(tmp_dir)
+            logging.basicConfig(filename=os.path.join(log_dir,
+                                                      file_name + '.log'),
+                                level=logging.DEBUG)
+            # Loads of previous tmp files may still be running, so file
+            # names are rotated
+            n_files = 0
+            tmp_paths = [os.path.join(tmp_dir, '%s_%s_0.csv' % (self.name,
+                                                                table))
+                         for table in tables]
+            used_paths = set(tmp_paths)
+
+            insert_rows = 0
+            total_revs = 0
+            total_pages = 0
+            tmp_files = [loader.open(tmp_path) for tmp_path in tmp_paths]
+            page_writer, rev_writer, hash_writer = [
+                TSVWriter(f, table) for f, table in zip(tmp_files, tables)]
+
+            for item in process_stub_xml(DumpFile(path)):
+                if isinstance(item, Page):
+                    page_writer.writerow(
+                        (item['id'], item['ns'], item['title'],
+                         item.get('restrictions') or u''))
+                    total_pages += 1
+                    continue
+
+                rev_insert, rev_hash_insert = rev_meta_rows(
+                    item, redis_cache=redis_cache, lang=self.lang)
+                rev_writer.writerow(rev_insert)
+                hash_writer.writerow(rev_hash_insert)
+                insert_rows += 1
+                total_revs += 1
+
+                # Load data from tmp files and empty them
+                if insert_rows == self.cache_size:
+                    for f, tmp_path, table in zip(tmp_files, tmp_paths,
+                                                  tables):
+                        f.close()
+                        loader.load(insert_data % (tmp_path, table),
+                                    tmp_path)
+                    n_files += 1
+                    tmp_paths = [os.path.join(tmp_dir, '%s_%s_%d.csv' % (
+                                     self.name, table,
+                                     n_files % (self.load_workers + 1)))
+                                 for table in tables]
+                    used_paths.update(tmp_paths)
+                    tmp_files = [loader.open(tmp_path)
+                                 for tmp_path in tmp_paths]
+                    page_writer, rev_writer, hash_writer = [
+                        TSVWriter(f, table)
+                        for f, table in zip(tmp_files, tables)]
+                    insert_rows = 0
+                    logging.info("%s revisions %s." % (
+                                 total_revs,
+                                 time.strftime("%Y-%m-%d %H:%M:%S %Z",
+                                               time.localtime())))
+
+            for f, tmp_path, table in zip(tmp_files, tmp_paths, tables):
+                f.close()
+                loader.load(insert_data % (tmp_path, table), tmp_path)
+            # Wait for all data of this file before reporting it
+            loader.wait()
+            for tmp_path in used_paths:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+            logging.info("COMPLETED: %s pages and %s revisions %s." % (
+                         total_pages, total_revs,
+                         time.strftime("%Y-%m-%d %H:%M:%S %Z",
+                                       time.localtime())))
+            print(self.name, "%s pages and %s revisions loaded from %s" % (
+                  total_pages, total_revs, file_name))
+            self.paths_queue.task_done()
+
+        # Mark STOP message as processed and finish
+        self.paths_queue.task_done()
+        loader.close()
+        db_meta.close()
+        end = time.time()
+        print(self.name, ": All tasks done in %.4f sec." % ((end-start)/1.))
+        print()
 
 
 class LoggingETL(ETL):
@@ -242,9 +478,16 @@ class LoggingETL(ETL):
                  kwargs=None, path=None, lang=None, log_fan=1,
                  log_cache_size=1000000,
                  db_name=None, db_user=None, db_passw=None,
-                 base_port=None, control_port=None):
+                 base_port=None, control_port=None, sink='db',
+                 parquet_dir=None, parquet_row_group=100000,
+                 load_workers=1, fifo=False):
         """
         Initialize new PageRevision workflow
+
+        If sink is 'parquet', log items are written to Parquet files in
+        parquet_dir instead of being loaded in DB. Otherwise, data loads
+        run in load_workers background threads, streaming data from memory
+        through named pipes if fifo is True.
         """
         super(LoggingETL,
               self).__init__(group=None, target=None, name=name, args=None,
@@ -256,6 +499,11 @@ class LoggingETL(ETL):
         self.log_cache_size = log_cache_size
         self.base_port = base_port
         self.control_port = control_port
+        self.sink = sink
+        self.parquet_dir = parquet_dir
+        self.parquet_row_group = parquet_row_group
+        self.load_workers = load_workers
+        self.fifo = fifo
 
     def run(self):
         """
@@ -323,14 +571,25 @@ class LoggingETL(ETL):
 
         db_log = MySQLDB(host='localhost', port=5306, user=self.db_user,
                          passwd=self.db_passw, db=self.db_name)
-        db_log.connect()
+        if self.sink == 'parquet':
+            log_target = items_to_parquet
+            log_kwargs = dict(table='logging', parquet_dir=self.parquet_dir,
+                              file_name=file_name,
+                              row_group_size=self.parquet_row_group,
+                              max_rows=self.log_cache_size,
+                              log_file=log_file)
+        else:
+            db_log.connect()
+            log_target = logitem_file_to_db
+            log_kwargs = dict(con=db_log, log_file=log_file,
+                              tmp_dir=tmp_dir,
+                              file_rows=self.log_cache_size,
+                              etl_prefix=self.name,
+                              load_workers=self.load_workers,
+                              fifo=self.fifo)
         logitem_insert_db = Consumer(name=logitem_insert_name,
-                                     target=logitem_file_to_db,
-                                     kwargs=dict(con=db_log,
-                                                 log_file=log_file,
-                                                 tmp_dir=tmp_dir,
-                                                 file_rows=self.log_cache_size,
-                                                 etl_prefix=self.name),
+                                     target=log_target,
+                                     kwargs=log_kwargs,
                                      producers=self.log_fan,
                                      pull_port=self.base_port+2)
 
@@ -355,43 +614,111 @@ class SQLDumpsETL(ETL):
     """
     Implements workflow to load native SQL dump files, created with
     mysqldump and published in compressed format (gzip file)
+
+    Instead of piping SQL statements to a MySQL client, tuples in INSERT
+    statements are converted to TSV chunk files of chunk_rows rows by a
+    streaming parser, while load_workers threads (BulkLoader) bulk load
+    finished chunks with LOAD DATA, each one with its own DB connection. Tables are created
+    with the CREATE TABLE statement found in each dump file.
     """
     def __init__(self, group=None, target=None, name=None, args=None,
-                 kwargs=None, path=None, lang=None,
-                 db_name=None, db_user=None, db_passw=None):
+                 kwargs=None, paths_queue=None, lang=None,
+                 db_name=None, db_user=None, db_passw=None,
+                 chunk_rows=1000000, load_workers=2, fifo=False):
         """
-        Initialize new PageRevision workflow
+        Initialize new SQLDumps workflow
+
+        If fifo is True, chunks are kept in memory and streamed to MySQL
+        through named pipes instead of being written to disk.
         """
         super(SQLDumpsETL,
               self).__init__(group=None, target=None, name=name, args=None,
                              kwargs=None, lang=lang, db_name=db_name,
                              db_user=db_user, db_passw=db_passw)
-        self.path = path
+        self.paths_queue = paths_queue
+        self.chunk_rows = chunk_rows
+        self.load_workers = load_workers
+        self.fifo = fifo
 
     def run(self):
         """
-        Docstring
+        Load every SQL dump file in paths queue
         """
-        # TODO: Create Popen o similar subprocessing strategy w/ shell
-        # gzip -cd file | mysql [params]
-        # or in case the file is already uncompressed
-        # cat sql | mysql [params]
-        for path in self.path:
-            if '.gz' in path:
-                command = "gzip -cd {0} | mysql -u {1} -p{2} {3}"
-            else:
-                command = "cat {0} | mysql -u {1} -p{2} {3}"
-            print("Processing file ", os.path.split(path)[1])
-            p = subprocess.Popen(command.format(path, self.db_user,
-                                                self.db_passw, self.db_name),
-                                 shell=True,
-                                 stdout=subprocess.PIPE,
-                                 stderr=open(os.devnull, "w")
-                                 )
-        # sys.stderr.write(p.stdout.read(1000))
-        # return False
-        return p.stdout
+        start = time.time()
+        for path in iter(self.paths_queue.get, 'STOP'):
+            self.load_file(path)
+            self.paths_queue.task_done()
+
+        # Mark STOP message as processed and finish
+        self.paths_queue.task_done()
+        end = time.time()
+        print(self.name, ": All tasks done in %.4f sec." % ((end-start)/1.))
+        print()
 
+    def load_file(self, path):
+        """
+        Parse SQL dump file in path and load its tables in DB
+        """
+        file_name = os.path.split(path)[1]
+        tmp_dir = os.path.join(os.getcwd(), os.path.split(path)[0], 'tmp')
+        if not os.path.exists(tmp_dir):
+            os.makedirs(tmp_dir)
+        print(self.name, "Processing file", file_name)
+
+        db_schema = MySQLDB(host='localhost', port=5306, user=self.db_user,
+                            passwd=self.db_passw, db=self.db_name)
+        db_schema.connect()
+
+        # Parsing never gets more than load_workers chunks ahead of loading
+        # (so disk space for chunk files is limited). Tables in SQL dumps
+        # are created with InnoDB engine, loads are committed by the loader
+        loader = BulkLoader(db_schema, workers=self.load_workers,
+                            remove_files=True, fifo=self.fifo)
+
+        chunk = chunk_path = chunk_table = None
+        n_chunks = 0
+        total_rows = 0
+        try:
+            in_stream = DumpFile(path).open_dump()
+            for kind, table, data in parse_sql_dump(in_stream):
+                if kind == 'create':
+                    db_schema.send_query("DROP TABLE IF EXISTS `%s`" % table)
+                    db_schema.send_query(data)
+                    continue
+
+                if chunk is not None and table != chunk_table:
+                    chunk.close()
+                    loader.load(LOAD_TSV % (chunk_path, chunk_table),
+                                chunk_path)
+                    chunk = None
+                    n_chunks += 1
+
+                if chunk is None:
+                    chunk_path = os.path.join(tmp_dir, '%s_%s_%d.tsv' % (
+                        self.name, table, n_chunks))
+                    chunk = loader.open(chunk_path, 'wb')
+                    chunk_table = table
+                    chunk_rows = 0
+                chunk.write(data)
+                rows = data.count(b'\n')
+                chunk_rows += rows
+                total_rows += rows
+                if chunk_rows >= self.chunk_rows:
+                    chunk.close()
+                    loader.load(LOAD_TSV % (chunk_path, table), chunk_path)
+                    chunk = None
+                    n_chunks += 1
+
+            if chunk is not None:
+                chunk.close()
+                loader.load(LOAD_TSV % (chunk_path, table), chunk_path)
+                n_chunks += 1
+        finally:
+            loader.close()
+            db_schema.close()
+
+        print(self.name, "%s rows loaded from %s in %d chunks" % (
+              total_rows, file_name, n_chunks))
 
 if __name__ == '__main__':
     path = sys.argv[1]
@@ -10,9 +10,10 @@ import ipaddress
 import datetime
 import re
 import os
-import csv
 import time
 import logging
+from utils.dbutils import BulkLoader
+from .tsv import TSVWriter, LOAD_FIELDS
 
 
 class LogItem(DataItem):
@@ -323,9 +324,14 @@ def logitem_to_file(log_iter):
 
 
 def logitem_file_to_db(log_iter, con=None, log_file=None,
-                       tmp_dir=None, file_rows=1000000, etl_prefix=None):
+                       tmp_dir=None, file_rows=1000000, etl_prefix=None,
+                       load_workers=1, fifo=False):
     """
     Store processed logitems in DB from intermediate tmp data files
+    Data loads run in load_workers background threads (with their own
+    connections) while the next tmp files are written, rotating file names.
+    If fifo is True, tmp files are kept in memory and streamed to MySQL
+    through named pipes instead.
     """
     insert_rows = 0
     total_logs = 0
@@ -338,39 +344,20 @@ def logitem_file_to_db(log_iter, con=None, log_file=None,
                  time.strftime("%Y-%m-%d %H:%M:%S %Z",
                                time.localtime())))
 
-    insert_logitem = """LOAD DATA INFILE '%s' INTO TABLE logging
-                        FIELDS OPTIONALLY ENCLOSED BY '"'
-                        TERMINATED BY '\t' ESCAPED BY '"'
-                        LINES TERMINATED BY '\n'"""
-
-    insert_block = """LOAD DATA INFILE '%s' INTO TABLE block
-                      FIELDS OPTIONALLY ENCLOSED BY '"'
-                      TERMINATED BY '\t' ESCAPED BY '"'
-                      LINES TERMINATED BY '\n'"""
-
-    insert_newuser = """LOAD DATA INFILE '%s' INTO TABLE user_new
-                        FIELDS OPTIONALLY ENCLOSED BY '"'
-                        TERMINATED BY '\t' ESCAPED BY '"'
-                        LINES TERMINATED BY '\n'"""
-
-    insert_rights = """LOAD DATA INFILE '%s' INTO TABLE user_level
-                       FIELDS OPTIONALLY ENCLOSED BY '"'
-                       TERMINATED BY '\t' ESCAPED BY '"'
-                       LINES TERMINATED BY '\n'"""
-
-    path_file_logitem = os.path.join(tmp_dir, etl_prefix + '_logging.csv')
-    path_file_block = os.path.join(tmp_dir, etl_prefix + '_block.csv')
-    path_file_newuser = os.path.join(tmp_dir, etl_prefix + '_user_new.csv')
-    path_file_rights = os.path.join(tmp_dir, etl_prefix + '_user_level.csv')
-    # Delete previous versions of tmp files if present
-    if os.path.isfile(path_file_logitem):
-        os.remove(path_file_logitem)
-    if os.path.isfile(path_file_block):
-        os.remove(path_file_block)
-    if os.path.isfile(path_file_newuser):
-        os.remove(path_file_newuser)
-    if os.path.isfile(path_file_rights):
-        os.remove(path_file_rights)
+    insert_logitem = ("LOAD DATA LOCAL INFILE '%s' INTO TABLE logging " +
+                      LOAD_FIELDS)
+
+    insert_block = ("LOAD DATA LOCAL INFILE '%s' INTO TABLE block " +
+                    LOAD_FIELDS)
+
+    insert_newuser = ("LOAD DATA LOCAL INFILE '%s' INTO TABLE user_new " +
+                      LOAD_FIELDS)
+
+    insert_rights = ("LOAD DATA LOCAL INFILE '%s' INTO TABLE user_level " +
+                     LOAD_FIELDS)
+
+    loader = BulkLoader(con, workers=load_workers, fifo=fifo)
+    n_files = 0
 
     for logdict in log_iter:
         total_logs += 1
@@ -385,31 +372,34 @@ def logitem_file_to_db(log_iter, con=None, log_file=None,
             # In this case, buffer size to trigger data load only tracks
             # num. of logitems already processed. We take the same mark to
             # load data for all associated tables
-            file_logitem = open(path_file_logitem, 'w')
-            writer = csv.writer(file_logitem, dialect='excel-tab',
-                                lineterminator='\n')
-            file_block = open(path_file_block, 'w')
-            writer_block = csv.writer(file_block, dialect='excel-tab',
-                                      lineterminator='\n')
-            file_newuser = open(path_file_newuser, 'w')
-            writer_new = csv.writer(file_newuser, dialect='excel-tab',
-                                    lineterminator='\n')
-            file_rights = open(path_file_rights, 'w')
-            writer_rights = csv.writer(file_rights, dialect='excel-tab',
-                                       lineterminator='\n')
+            # Loads of previous files may still be running
+            suffix = '_%d.csv' % (n_files % (load_workers + 1))
+            n_files += 1
+            path_file_logitem = os.path.join(tmp_dir,
+                                             etl_prefix + '_logging' + suffix)
+            path_file_block = os.path.join(tmp_dir,
+                                           etl_prefix + '_block' + suffix)
+            path_file_newuser = os.path.join(tmp_dir,
+                                             etl_prefix + '_user_new' + suffix)
+            path_file_rights = os.path.join(tmp_dir,
+                                            etl_prefix + '_user_level' + suffix)
+            file_logitem = loader.open(path_file_logitem)
+            writer = TSVWriter(file_logitem, 'logging')
+            file_block = loader.open(path_file_block)
+            writer_block = TSVWriter(file_block, 'block')
+            file_newuser = loader.open(path_file_newuser)
+            writer_new = TSVWriter(file_newuser, 'user_new')
+            file_rights = loader.open(path_file_rights)
+            writer_rights = TSVWriter(file_rights, 'user_level')
         # Write data to tmp file
         try:
-            writer.writerow([s if isinstance(s, str)
-                             else str(s) for s in logitem])
+            writer.writerow(logitem)
             if block:
-                writer_block.writerow([s if isinstance(s, str)
-                                       else str(s) for s in block])
+                writer_block.writerow(block)
             if newuser:
-                writer_new.writerow([s if isinstance(s, str)
-                                     else str(s) for s in newuser])
+                writer_new.writerow(newuser)
             if rights:
-                writer_rights.writerow([s if isinstance(s, str)
-                                        else str(s) for s in rights])
+                writer_rights.writerow(rights)
         except Exception as e:
             print("Error writing logitem temp files...")
             print(e)
@@ -420,14 +410,14 @@ def logitem_file_to_db(log_iter, con=None, log_file=None,
         # Call MySQL to load data from file and reset rows counter
         if insert_rows == file_rows:
             file_logitem.close()
-            con.send_query(insert_logitem % path_file_logitem)
+            loader.load(insert_logitem % path_file_logitem, path_file_logitem)
 
             file_block.close()
-            con.send_query(insert_block % path_file_block)
+            loader.load(insert_block % path_file_block, path_file_block)
             file_newuser.close()
-            con.send_query(insert_newuser % path_file_newuser)
+            loader.load(insert_newuser % path_file_newuser, path_file_newuser)
             file_rights.close()
-            con.send_query(insert_rights % path_file_rights)
+            loader.load(insert_rights % path_file_rights, path_file_rights)
 
             logging.info("%s logitems %s." % (
                          total_logs,
@@ -439,15 +429,17 @@ def logitem_file_to_db(log_iter, con=None, log_file=None,
             # open them again for writing
 
     # Load remaining entries in last tmp files into DB
-    file_logitem.close()
-    file_block.close()
-    file_newuser.close()
-    file_rights.close()
-
-    con.send_query(insert_logitem % path_file_logitem)
-    con.send_query(insert_block % path_file_block)
-    con.send_query(insert_newuser % path_file_newuser)
-    con.send_query(insert_rights % path_file_rights)
+    if insert_rows > 0:
+        file_logitem.close()
+        file_block.close()
+        file_newuser.close()
+        file_rights.close()
+
+        loader.load(insert_logitem % path_file_logitem, path_file_logitem)
+        loader.load(insert_block % path_file_block, path_file_block)
+        loader.load(insert_newuser % path_file_newuser, path_file_newuser)
+        loader.load(insert_rights % path_file_rights, path_file_rights)
+    loader.close()
     # TODO: Clean tmp files, uncomment the following lines
     # os.remove(path_file_logitem)
 
@@ -7,8 +7,9 @@ Created on Sat Mar 29 22:14:09 2014
 import time
 from .data_item import DataItem
 import logging
-import csv
 import os
+from utils.dbutils import BulkLoader
+from .tsv import TSVWriter, LOAD_FIELDS
 
 
 class Page(DataItem):
@@ -63,16 +64,32 @@ def pages_to_file(pages_iter):
         page_insert = (int(page['id']), int(page['ns']),
                        page['title'],
                        (page['restrictions'] if 'restrictions' in page
-                        else u'NULL'),
+                        else u''),
                        )
         yield page_insert
 
 
+def page_id_of(page_insert):
+    """
+    Page id of a tuple yielded by pages_to_file (checkpoint key)
+    """
+    return int(page_insert[0])
+
+
 def pages_file_to_db(pages_iter, con=None, log_file=None,
-                     tmp_dir=None, file_rows=1000000, etl_prefix=None):
+                     tmp_dir=None, file_rows=1000000, etl_prefix=None,
+                     checkpoint=None, replace=False, load_workers=1,
+                     fifo=False):
     """
     Process page insert items received from iterator. Page inserts are stored
     in a temp file, then a bulk data load is triggered in MySQL.
+    Data loads run in load_workers background threads (with their own
+    connections) while the next temp file is written, rotating file names.
+    If fifo is True, temp files are kept in memory and streamed to MySQL
+    through named pipes instead.
+    If given, checkpoint is called to record progress around each data load.
+    If replace is True, rows of pages already stored are replaced (requires
+    primary key on table page, as in incremental loads).
     """
     insert_rows = 0
     total_pages = 0
@@ -85,27 +102,33 @@ def pages_file_to_db(pages_iter, con=None, log_file=None,
                  time.strftime("%Y-%m-%d %H:%M:%S %Z",
                                time.localtime())))
 
-    insert_pages = """LOAD DATA LOCAL INFILE '%s' INTO TABLE page
-                      FIELDS OPTIONALLY ENCLOSED BY '"'
-                      TERMINATED BY '\t' ESCAPED BY '"'
-                      LINES TERMINATED BY '\n'"""
+    insert_pages = ("LOAD DATA LOCAL INFILE '%s' INTO TABLE page " +
+                    LOAD_FIELDS)
+    if replace:
+        insert_pages = insert_pages.replace('INTO TABLE',
+                                            'REPLACE INTO TABLE', 1)
+
+    loader = BulkLoader(con, workers=load_workers, fifo=fifo)
+    n_files = 0
 
-    path_file_page = os.path.join(tmp_dir, etl_prefix + '_page.csv')
-    # Delete previous versions of tmp files if present
-    if os.path.isfile(path_file_page):
-        os.remove(path_file_page)
+    def load_file(path):
+        mark = checkpoint(pending=True) if checkpoint is not None else None
+        for page_id in loader.load(insert_pages % path, path, mark=mark):
+            checkpoint(page_id=page_id)
 
     for page in pages_iter:
         total_pages += 1
 
         if insert_rows == 0:
-            file_page = open(path_file_page, 'w')
-            writer = csv.writer(file_page, dialect='excel-tab',
-                                lineterminator='\n')
+            # Loads of previous files may still be running
+            path_file_page = os.path.join(tmp_dir, '%s_page_%d.csv' % (
+                etl_prefix, n_files % (load_workers + 1)))
+            n_files += 1
+            file_page = loader.open(path_file_page)
+            writer = TSVWriter(file_page, 'page')
         # Write data to tmp file
         try:
-            writer.writerow([s if isinstance(s, str)
-                             else str(s) for s in page])
+            writer.writerow(page)
         except Exception as e:
             print(e)
             print(page)
@@ -116,13 +139,19 @@ def pages_file_to_db(pages_iter, con=None, log_file=None,
         if insert_rows == file_rows:
             # Insert in DB
             file_page.close()
-            con.send_query(insert_pages % path_file_page)
+            load_file(path_file_page)
             insert_rows = 0
             # No need to delete tmp files, as they are empty each time we
             # open them again for writing
 
-    file_page.close()
-    con.send_query(insert_pages % path_file_page)
+    # Load remaining rows, if any (e.g. no pages left when resuming)
+    if insert_rows > 0:
+        file_page.close()
+        load_file(path_file_page)
+    for page_id in loader.close():
+        checkpoint(page_id=page_id)
+    if checkpoint is not None:
+        checkpoint()
     # Clean tmp files
 #    os.remove(path_file_page)
 
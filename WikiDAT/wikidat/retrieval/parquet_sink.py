@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar output of ETL workflows in Parquet files, as an alternative to
+loading pages, revisions, users and log items in MySQL and Elasticsearch
+
+Each table is written to its own folder, partitioned (Hive style) by
+namespace and by year of the item timestamp, if it has one:
+
+    <parquet_dir>/<table>/namespace=<ns>/year=<year>/<dump_file>.parquet
+
+Thus, analyses can read only the columns and partitions they need, e.g.
+pandas.read_parquet(path, columns=[...], filters=[('year', '>=', 2010)]).
+Every ETL line writes its own file in each partition for every dump file,
+so no locking is needed between them.
+
+Requires pyarrow.
+"""
+import os
+import glob
+import time
+import logging
+import ipaddress
+import redis
+from .revision import ip_countries
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+"""
+Columns and types (pyarrow aliases) of each table, named as in MySQL
+"""
+COLUMNS = {
+    'page': [('page_id', 'uint32'), ('page_namespace', 'int16'),
+             ('page_title', 'string'), ('page_restrictions', 'string')],
+    'revision': [('rev_id', 'uint32'), ('rev_page', 'uint32'),
+                 ('rev_timestamp', 'timestamp[s]'),
+                 ('rev_parent_id', 'uint32'), ('rev_comment', 'string'),
+                 ('rev_text', 'string')],
+    'logging': [('log_id', 'uint32'), ('log_type', 'string'),
+                ('log_action', 'string'), ('log_timestamp', 'timestamp[s]'),
+                ('log_user', 'int32'), ('log_username', 'string'),
+                ('log_namespace', 'int32'), ('log_title', 'string'),
+                ('log_comment', 'string'), ('log_params', 'string'),
+                ('log_new_flag', 'uint32'), ('log_old_flag', 'uint32')],
+    'user': [('user_id', 'int32'), ('user_name', 'string')],
+    'revision_IP': [('rev_id', 'uint32'), ('ip', 'uint32'),
+                    ('ipv6', 'string')],
+    'IP_country': [('ip', 'uint32'), ('country', 'string')],
+}
+
+
+def user_row(user_id, user_name):
+    """
+    Row of a user cached in Redis by revision workers
+    """
+    return (int(user_id), user_name)
+
+
+def revision_ip_row(rev_id, ip):
+    """
+    Row of the IP address (integer) of an anonymous revision cached in
+    Redis by revision workers. IPv4 addresses are stored in column ip, as
+    integers (same as in table revision_IP of the DB), and IPv6 addresses
+    in column ipv6, as text
+    """
+    ip = int(ip)
+    if ip <= 0xFFFFFFFF:
+        return (int(rev_id), ip, None)
+    return (int(rev_id), None, str(ipaddress.ip_address(ip)))
+
+
+def page_row(page):
+    """
+    Partition and row of a tuple yielded by pages_to_file
+    """
+    page_id, ns, title, restrictions = page
+    return ((('namespace', ns),),
+            (page_id, ns, title, restrictions or None))
+
+
+def revision_row(rev):
+    """
+    Partition and row of a document yielded by revs_to_file
+    """
+    return ((('namespace', rev['namespace']),
+             ('year', int(rev['timestamp'][:4]))),
+            (rev['rev_id'], rev['page_id'], rev['timestamp'],
+             rev['parent_id'] if rev['parent_id'] >= 0 else None,
+             None if rev['comment'] == u'NULL' else rev['comment'],
+             rev['content']))
+
+
+def logging_row(logdict):
+    """
+    Partition and row of the logitem tuple in a dict yielded by
+    logitem_to_file
+    """
+    logitem = list(logdict['logitem'])
+    logitem[6] = int(logitem[6])
+    return ((('namespace', logitem[6]), ('year', int(logitem[3][:4]))),
+            logitem)
+
+
+ROWS = {'page': page_row, 'revision': revision_row, 'logging': logging_row}
+
+
+class PartitionedWriter(object):
+    """
+    Writes rows of a table in Parquet files, one for each partition. Rows
+    are buffered per partition and written in row groups of row_group_size
+    rows. To bound memory when there are many partitions, the largest
+    buffer is written early once max_rows rows are buffered.
+    """
+
+    def __init__(self, parquet_dir, table, file_name, row_group_size=100000,
+                 max_rows=1000000):
+        """
+        Arguments:
+            - parquet_dir = Base folder for Parquet files of all tables
+            - table = Name of table (key in COLUMNS)
+            - file_name = Name of Parquet file in each partition folder
+            - row_group_size = Number of rows in each row group
+            - max_rows = Maximum number of rows buffered for all partitions
+        """
+        if pq is None:
+            raise RuntimeError('Writing Parquet files requires pyarrow')
+        self.base_dir = os.path.join(parquet_dir, table)
+        self.file_name = file_name + '.parquet'
+        self.schema = pa.schema([(name, pa.type_for_alias(alias))
+                                 for name, alias in COLUMNS[table]])
+        self.row_group_size = row_group_size
+        self.max_rows = max(max_rows, row_group_size)
+        self.buffers = {}  # partition --> list of rows
+        self.writers = {}  # partition --> pq.ParquetWriter
+        self.buffered = 0
+
+    def clear(self):
+        """
+        Remove files written for this table and file name by a previous run
+        """
+        for path in glob.glob(os.path.join(glob.escape(self.base_dir), '**',
+                                           glob.escape(self.file_name)),
+                              recursive=True):
+            os.remove(path)
+
+    def append(self, partition, row):
+        """
+        Add row to partition, a tuple of (column, value) pairs
+        """
+        rows = self.buffers.setdefault(partition, [])
+        rows.append(row)
+        self.buffered += 1
+        if len(rows) == self.row_group_size:
+            self.flush(partition)
+        elif self.buffered >= self.max_rows:
+            self.flush(max(self.buffers,
+                           key=lambda part: len(self.buffers[part])))
+
+    def flush(self, partition):
+        """
+        Write buffered rows of partition as a new row group
+        """
+        rows = self.buffers.pop(partition)
+        self.buffered -= len(rows)
+        arrays = []
+        for field, values in zip(self.schema, zip(*rows)):
+            if pa.types.is_timestamp(field.type):
+                # Parse 'YYYY-MM-DD HH:MM:SS' strings in a single pass
+                arrays.append(pa.array(values, type=pa.string())
+                              .cast(field.type))
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        writer = self.writers.get(partition)
+        if writer is None:
+            part_dir = os.path.join(self.base_dir,
+                                    *['%s=%s' % part for part in partition])
+            os.makedirs(part_dir, exist_ok=True)
+            writer = pq.ParquetWriter(os.path.join(part_dir, self.file_name),
+                                      self.schema)
+            self.writers[partition] = writer
+        writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema),
+                           row_group_size=self.row_group_size)
+
+    def close(self):
+        """
+        Write remaining rows and close all files. Return number of files
+        """
+        for partition in list(self.buffers):
+            self.flush(partition)
+        for writer in self.writers.values():
+            writer.close()
+        return len(self.writers)
+
+
+def items_to_parquet(items_iter, table=None, parquet_dir=None,
+                     file_name=None, row_group_size=100000,
+                     max_rows=1000000, log_file=None, checkpoint=None):
+    """
+    Consumer target to write items from iterator in Parquet files of table
+    (page, revision or logging), instead of loading them in DB.
+
+    Parquet files can only be read once they are closed, so checkpoint (if
+    given) is only called after all items have been written. Files written
+    by a previous run for the same dump file are removed first.
+    """
+    logging.basicConfig(filename=log_file, level=logging.DEBUG)
+    print("Starting %s data writing at %s." % (
+          table, time.strftime("%Y-%m-%d %H:%M:%S %Z", time.localtime())))
+    row_of = ROWS[table]
+    writer = PartitionedWriter(parquet_dir, table, file_name,
+                               row_group_size=row_group_size,
+                               max_rows=max_rows)
+    writer.clear()
+    total_items = 0
+    for item in items_iter:
+        partition, row = row_of(item)
+        writer.append(partition, row)
+        total_items += 1
+    n_files = writer.close()
+    if checkpoint is not None:
+        checkpoint()
+
+    logging.info("COMPLETED: %s %s items written in %s Parquet files %s." % (
+                 total_items, table, n_files,
+                 time.strftime("%Y-%m-%d %H:%M:%S %Z", time.localtime())))
+    print("END: %s %s items written in %s Parquet files %s." % (
+          total_items, table, n_files,
+          time.strftime("%Y-%m-%d %H:%M:%S %Z", time.localtime())))
+
+
+def users_to_parquet(lang=None, parquet_dir=None, row_group_size=100000):
+    """
+    Write info about users cached in Redis by revision workers to Parquet
+    files of tables user, revision_IP and IP_country (not partitioned)
+    """
+    redis_cache = redis.Redis(host='localhost', decode_responses=True)
+    redis_cache.hset(lang + ':users', 0, 'Anonymous user')
+    redis_cache.hset(lang + ':users', -1, 'NA')
+    redis_cache.hset(lang + ':users', -2, 'Missing ID')
+
+    for table, key, to_row in (('user', ':users', user_row),
+                               ('revision_IP', ':revsanon', revision_ip_row)):
+        writer = PartitionedWriter(parquet_dir, table, lang,
+                                   row_group_size=row_group_size)
+        total_rows = 0
+        for item_id, value in redis_cache.hscan_iter(lang + key,
+                                                     count=1000):
+            writer.append((), to_row(item_id, value))
+            total_rows += 1
+        writer.close()
+        print("%s rows written in Parquet file of table %s" % (total_rows,
+                                                               table))
+
+    writer = PartitionedWriter(parquet_dir, 'IP_country', lang,
+                               row_group_size=row_group_size)
+    list_ip_country = ip_countries(
+        int(ip) for rev_id, ip in redis_cache.hscan_iter(lang + ':revsanon',
+                                                         count=1000))
+    for ip_country in list_ip_country:
+        writer.append((), ip_country)
+    writer.close()
+    print("%s rows written in Parquet file of table IP_country" % (
+          len(list_ip_country)))
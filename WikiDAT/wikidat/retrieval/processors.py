@@ -26,6 +26,7 @@ from utils.comutils import send_ujson, recv_ujson
 from .page import Page
 from .revision import Revision
 from .logitem import LogItem
+from .checkpoint import save_checkpoint, load_checkpoint
 # from user import User
 
 
@@ -115,9 +116,17 @@ class Consumer(mp.Process):
 
     The "target" must be a function which expects an iterable as it's
     only argument.  Therefore, the args value is not used here.
+
+    If checkpoint_file is given, the target also receives a "checkpoint"
+    keyword argument: a function that must be called right after each flush
+    of items to the store, to record progress in checkpoint_file (with
+    pending=True, right before the flush). Progress is tracked with the
+    checkpoint messages sent by Processors, and with checkpoint_key, a
+    function returning the page id of an item.
     """
     def __init__(self, group=None, target=None, name=None, args=None,
-                 kwargs=None, producers=0, pull_port=None):
+                 kwargs=None, producers=0, pull_port=None,
+                 checkpoint_file=None, checkpoint_key=None):
 
         super(Consumer, self).__init__(name=name)
         self.target = target
@@ -125,6 +134,14 @@ class Consumer(mp.Process):
         self.kwargs = kwargs if kwargs is not None else {}
         self.producers = producers
         self.pull_port = pull_port
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_key = checkpoint_key
+        # Last page id reported by each Processor, None once it has finished
+        self.watermarks = {}
+        self.page_id = None
+        self.min_page_id = None
+        self.max_page_id = None
+        self.rows = 0
 
     def items(self):
         context = zmq.Context()
@@ -139,14 +156,67 @@ class Consumer(mp.Process):
                 item = recv_ujson(data_recv)
                 if item == 'STOP':
                     break
+                if isinstance(item, dict) and 'checkpoint' in item:
+                    self.watermarks[item['checkpoint']] = item['page_id']
+                    continue
+                if self.checkpoint_key is not None:
+                    page_id = self.checkpoint_key(item)
+                    if self.max_page_id is None:
+                        self.min_page_id = self.max_page_id = page_id
+                    elif page_id > self.max_page_id:
+                        self.max_page_id = page_id
+                    elif page_id < self.min_page_id:
+                        self.min_page_id = page_id
+                    self.rows += 1
                 yield item
             self.producers -= 1
 
         time.sleep(1)
         #data_recv.close()
 
+    def checkpoint(self, pending=False, page_id=None):
+        """
+        Record progress of items already flushed by the target. All items
+        with page id lower than the smallest page id reported by Processors
+        still running have been stored. If pending, only the highest page id
+        about to be stored is updated, so that an interrupted flush can be
+        undone when resuming.
+
+        Returns the page id below which all items received so far are
+        included in the flush. If flushes run in background while more
+        items are received, the value returned with pending=True must be
+        passed as page_id once that flush (and all previous ones) finish.
+        """
+        if self.checkpoint_file is None:
+            return None
+        complete = self.producers == 0
+        mark = self.page_id
+        running = [wm for wm in self.watermarks.values() if wm is not None]
+        # Wait for all Processors to report progress at least once
+        if running and len(self.watermarks) == self.total_producers:
+            mark = min(running)
+        if page_id is not None:
+            self.page_id = page_id
+        elif not pending and not complete:
+            self.page_id = mark
+        save_checkpoint(self.checkpoint_file, page_id=self.page_id,
+                        min_page_id=self.min_page_id,
+                        max_page_id=self.max_page_id, rows=self.rows,
+                        complete=complete and not pending and page_id is None)
+        return mark
+
     def run(self):
         target = self.target
+        self.total_producers = self.producers
+        if self.checkpoint_file is not None:
+            # Keep progress recorded by a previous run, if any
+            last = load_checkpoint(self.checkpoint_file)
+            if last is not None:
+                self.page_id = last['page_id']
+                self.min_page_id = last['min_page_id']
+                self.max_page_id = last['max_page_id']
+                self.rows = last['rows']
+            self.kwargs['checkpoint'] = self.checkpoint
         target(self.items(), **self.kwargs)
 
 
@@ -158,10 +228,16 @@ class Processor(mp.Process):
     The "target" must be a generator function which yields
     pickable items derived from DataItems and which expects an iterable as its
     only argument.  Therefore, the args value is not used here.
+
+    If checkpoint_key is given (function returning the page id of an output
+    item), every checkpoint_every items the page id of the last item is
+    reported to the Consumer. Items are processed in page order, so all items
+    sent before by this Processor belong to pages with lower or equal id.
     """
     def __init__(self, group=None, target=None, name=None, args=None,
                  kwargs=None, producers=0, consumers=0,
-                 pull_port=None, push_port=None, control_port=None):
+                 pull_port=None, push_port=None, control_port=None,
+                 checkpoint_key=None, checkpoint_every=1000):
         super(Processor, self).__init__(name=name)
         self.target = target  # String with method name, not method itself
         self.args = args if args is not None else []
@@ -171,6 +247,8 @@ class Processor(mp.Process):
         self.pull_port = pull_port
         self.push_port = push_port
         self.control_port = control_port
+        self.checkpoint_key = checkpoint_key
+        self.checkpoint_every = checkpoint_every
 
     def items(self):
         context = zmq.Context()
@@ -217,8 +295,21 @@ class Processor(mp.Process):
         # Wait a second to wake up and connect
         time.sleep(1)
 
+        sent = 0
         for item in target(self.items(), **self.kwargs):
             send_ujson(channel_send, item)
+            if self.checkpoint_key is not None:
+                sent += 1
+                if sent % self.checkpoint_every == 0:
+                    send_ujson(channel_send,
+                               {'checkpoint': self.name,
+                                'page_id': self.checkpoint_key(item)})
+
+        if self.checkpoint_key is not None:
+            # Nothing pending from this Processor
+            for x in range(self.consumers):
+                send_ujson(channel_send, {'checkpoint': self.name,
+                                          'page_id': None})
 
         for x in range(self.consumers):
             send_ujson(channel_send, 'STOP')
@@ -7,15 +7,29 @@ Created on Sat Mar 29 22:13:42 2014
 import hashlib
 import time
 from utils import maps
+from utils.dbutils import BulkLoader
+from utils.ipresolver import lookup_many
 from .data_item import DataItem
-import csv
+from .tsv import TSVWriter, LOAD_FIELDS
 import os
 import redis
 import ipaddress
 import logging
 import json
-from elasticsearch import Elasticsearch, helpers
-from wikiextractor.wikiextractor.clean import clean_markup
+import itertools
+import numpy as np
+from elasticsearch import Elasticsearch, helpers, ElasticsearchException
+from wikiextractor.wikiextractor.clean import (clean_markup,
+                                               clean_markup_many,
+                                               load_templates)
+
+
+def history_index(lang):
+    """
+    Name of the Elasticsearch index storing text and metadata of revisions
+    of wiki lang
+    """
+    return '%s_history' % lang
 
 
 class Revision(DataItem):
@@ -50,11 +64,9 @@ def process_revs(rev_iter, con=None, lang=None):
     # Get tags to identify Featured Articles, Featured Lists and
     # Good Articles
 
-    if ((lang in maps.FA_RE) and (lang in maps.FLIST_RE) and
-            (lang in maps.GA_RE)):
-        fa_pat = maps.FA_RE[lang]
-        flist_pat = maps.FLIST_RE[lang]
-        ga_pat = maps.GA_RE[lang]
+    # All of them are detected in a single scan of the revision text
+    if lang in maps.QUALITY_RE:
+        quality_pat = maps.QUALITY_RE[lang]
     else:
         raise RuntimeError('Unsupported language ' + lang)
 
@@ -87,30 +99,8 @@ def process_revs(rev_iter, con=None, lang=None):
             # We only enter pattern matching for revisions of pages in
             # main namespace
             if rev['ns'] == '0':
-                if fa_pat is not None:
-                    mfa = fa_pat.search(rev['text'])
-                    # Case of standard language, one type of FA template
-                    if (mfa is not None and len(mfa.groups()) == 1):
-                        rev['is_fa'] = '1'
-                    # Case of fawiki or cawiki, 2 types of FA templates
-                    # Possible matches: (A, None) or (None, B)
-                    if lang == 'fawiki' or lang == 'cawiki':
-                        if (mfa is not None and len(mfa.groups()) == 2 and
-                                (mfa.groups()[1] is None or
-                                 mfa.groups()[0] is None)):
-                                    rev['is_fa'] = '1'
-
-                # Check if FLIST is supported in this language, detect if so
-                if flist_pat is not None:
-                    mflist = flist_pat.search(rev['text'])
-                    if mflist is not None and len(mflist.groups()) == 1:
-                        rev['is_flist'] = '1'
-
-                # Check if GA is supported in this language, detect if so
-                if ga_pat is not None:
-                    mga = ga_pat.search(rev['text'])
-                    if mga is not None and len(mga.groups()) == 1:
-                        rev['is_ga'] = '1'
+                for name in maps.find_quality(quality_pat, rev['text']):
+                    rev['is_' + name] = '1'
         # Compute hash for empty text here instead of in default block above
         # This way, we avoid computing the hash twice for revisions with text
         else:
@@ -256,29 +246,109 @@ def process_revs(rev_iter, con=None, lang=None):
         text_hash = None
 
 
-def revs_to_file(rev_iter, lang=None):
+def is_redirect(text):
+    """
+    Check whether a revision text is a redirect to another page
+    """
+    return text is not None and text[0:9].upper() == '#REDIRECT'
+
+
+def store_contributor(redis_cache, lang, rev_id, contrib_dict):
+    """
+    Cache info about the author of a revision in Redis, to be loaded later
+    by users_file_to_db, and return user id to be stored with the revision
+    :Parameters:
+        - redis_cache: connection to Redis
+        - lang: identifier of Wikipedia language edition
+        - rev_id: identifier of the revision
+        - contrib_dict: dict {tag:text} with contributor info from dump
+    """
+    # Case of known user
+    if contrib_dict:
+        # Anonymous user
+        if 'ip' in contrib_dict:
+            user = 0
+            ip = str(contrib_dict['ip'])
+            redis_cache.hset(lang + ':revsanon', int(rev_id),
+                             int(ipaddress.ip_address(ip)))
+        # Registered user
+        else:
+            user = int(contrib_dict['id'])
+            username = contrib_dict['username']
+            # Case of missing user id but w/ username
+            # The username is probably invalid now,
+            # insert in separate table
+            if user == 0:
+                user = -2  # Special value for case: (NULL, username)
+                redis_cache.hset(lang + ':userzero', int(rev_id),
+                                 username)
+            # Username is known
+            if username is not None:
+                redis_cache.hset(lang + ':users', user, username)
+            # Handle strange cases of user ID w/o username
+            else:
+                stored_name = redis_cache.hget(lang + ':users', user)
+                # If user is not known, then insert entry w/o username
+                # Otherwise, skip and wait for other entry w/ username
+                if not stored_name:
+                    redis_cache.hset(lang + ':users', user, '')
+    # Case of unknown user: neither user_id nor user_name
+    else:
+        user = -1  # Special value
+    return user
+
+
+def revs_to_file(rev_iter, lang=None, templates_file=None, clean_workers=1,
+                 clean_chunksize=64, quality_window=None,
+                 quality_fallback=True):
     """
     Process iterator of Revision objects extracted from dump files
     :Parameters:
         - rev_iter: iterator of Revision objects
         - lang: identifier of Wikipedia language edition from which this
         element comes from (e.g. frwiki, eswiki, dewiki...)
+        - templates_file: index of template definitions created with
+        process_templates. If given, templates are expanded when cleaning
+        revision text instead of being dropped
+        - clean_workers: number of processes to clean revision text. If
+        greater than 1, texts are cleaned in a process pool, in chunks of
+        clean_chunksize revisions
+        - quality_window: if given, detect FA, FLIST and GA templates only
+        in the first and last quality_window characters of revision text
+        - quality_fallback: scan the rest of revision text when no quality
+        template is found in those windows
     """
     # Initialize connections to Redis DBs
     redis_cache = redis.Redis(host='localhost')
 
+    # Load template definitions once for this worker
+    expand_templates = templates_file is not None
+    if expand_templates:
+        load_templates(templates_file)
+
+    # Clean texts ahead in a process pool, results keep revisions order
+    cleaned = None
+    if clean_workers > 1:
+        rev_iter, rev_texts = itertools.tee(rev_iter)
+        cleaned = clean_markup_many(('' if is_redirect(rev['text'])
+                                     else rev['text'] or ''
+                                     for rev in rev_texts),
+                                    workers=clean_workers,
+                                    chunksize=clean_chunksize,
+                                    expand_templates=expand_templates,
+                                    templates_file=templates_file)
+
     # Get tags to identify Featured Articles, Featured Lists and
     # Good Articles
-    if ((lang in maps.FA_RE) and (lang in maps.FLIST_RE) and
-            (lang in maps.GA_RE)):
-        fa_pat = maps.FA_RE[lang]
-        flist_pat = maps.FLIST_RE[lang]
-        ga_pat = maps.GA_RE[lang]
+    # All of them are detected in a single scan of the revision text
+    if lang in maps.QUALITY_RE:
+        quality_pat = maps.QUALITY_RE[lang]
     else:
         raise RuntimeError('Unsupported language ' + lang)
 
     for rev in rev_iter:
         contrib_dict = rev['contrib_dict']
+        text = next(cleaned) if cleaned is not None else None
 
         # ### TEXT-RELATED OPERATIONS ###
         # Calculate SHA-256 hash, length of revision text and check
@@ -293,43 +363,26 @@ def revs_to_file(rev_iter, lang=None):
         rev['is_ga'] = '0'
 
         if rev['text'] is not None:
-            text = clean_markup(rev['text'])
-            text_hash = text
-            rev['len_text'] = str(len(text))
-
             # Detect pattern for redirect pages
-            if rev['text'][0:9].upper() == '#REDIRECT':
+            # Redirects are not stored, so skip cleaning their text
+            if is_redirect(rev['text']):
                 rev['redirect'] = '1'
+                text = ''
+            elif cleaned is None:
+                text = clean_markup(rev['text'],
+                                    expand_templates=expand_templates)
+            text_hash = text
+            rev['len_text'] = str(len(text))
 
             # FA and FList detection
             # Currently 39 languages are supported regarding FA detection
             # We only enter pattern matching for revisions of pages in
             # main namespace
             if rev['ns'] == '0':
-                if fa_pat is not None:
-                    mfa = fa_pat.search(rev['text'])
-                    # Case of standard language, one type of FA template
-                    if (mfa is not None and len(mfa.groups()) == 1):
-                        rev['is_fa'] = '1'
-                    # Case of fawiki or cawiki, 2 types of FA templates
-                    # Possible matches: (A, None) or (None, B)
-                    if lang == 'fawiki' or lang == 'cawiki':
-                        if (mfa is not None and len(mfa.groups()) == 2 and
-                                (mfa.groups()[1] is None or
-                                 mfa.groups()[0] is None)):
-                                    rev['is_fa'] = '1'
-
-                # Check if FLIST is supported in this language, detect if so
-                if flist_pat is not None:
-                    mflist = flist_pat.search(rev['text'])
-                    if mflist is not None and len(mflist.groups()) == 1:
-                        rev['is_flist'] = '1'
-
-                # Check if GA is supported in this language, detect if so
-                if ga_pat is not None:
-                    mga = ga_pat.search(rev['text'])
-                    if mga is not None and len(mga.groups()) == 1:
-                        rev['is_ga'] = '1'
+                for name in maps.find_quality(quality_pat, rev['text'],
+                                              window=quality_window,
+                                              fallback=quality_fallback):
+                    rev['is_' + name] = '1'
         # Compute hash for empty text here instead of in default block above
         # This way, we avoid computing the hash twice for revisions with text
         else:
@@ -337,38 +390,7 @@ def revs_to_file(rev_iter, lang=None):
             text_hash = ''
 
         # USER PROCESSING
-        # Case of known user
-        if len(contrib_dict) > 0:
-            # Anonymous user
-            if 'ip' in contrib_dict:
-                user = 0
-                ip = str(contrib_dict['ip'])
-                redis_cache.hset(lang + ':revsanon', int(rev['id']),
-                                 int(ipaddress.ip_address(ip)))
-            # Registered user
-            else:
-                user = int(contrib_dict['id'])
-                username = contrib_dict['username']
-                # Case of missing user id but w/ username
-                # The username is probably invalid now,
-                # insert in separate table
-                if user == 0:
-                    user = -2  # Special value for case: (NULL, username)
-                    redis_cache.hset(lang + ':userzero', int(rev['id']),
-                                     username)
-                # Username is known
-                if username is not None:
-                    redis_cache.hset(lang + ':users', user, username)
-                # Handle strange cases of user ID w/o username
-                else:
-                    stored_name = redis_cache.hget(lang + ':users', user)
-                    # If user is not known, then insert entry w/o username
-                    # Otherwise, skip and wait for other entry w/ username
-                    if not stored_name:
-                        redis_cache.hset(lang + ':users', user, '')
-        # Case of unknown user: neither user_id nor user_name
-        else:
-            user = -1  # Special value
+        store_contributor(redis_cache, lang, rev['id'], contrib_dict)
 
         # Tuple of revision values
         # rev_insert = (int(rev['id']), int(rev['page_id']), int(user),
@@ -388,9 +410,11 @@ def revs_to_file(rev_iter, lang=None):
         if int(rev['redirect']) == 0:
             rev_hash = {
                 '_id': int(rev['id']),
+                'rev_id': int(rev['id']),
                 'timestamp': rev['timestamp'].replace('Z', '').replace('T', ' '),
                 'parent_id': (int(rev['rev_parent_id']) if rev['rev_parent_id'] is not None else -1),
                 'page_id':  int(rev['page_id']),
+                'namespace': int(rev['ns']),
                 'comment': (rev['comment'] if 'comment' in rev and
                             rev['comment'] is not None else u'NULL'),
                 'content':   text_hash,
@@ -405,8 +429,72 @@ def revs_to_file(rev_iter, lang=None):
         # TODO: Handle disconnection of clients from Redis server??
 
 
+def max_stored_rev(con=None, es_con=None, lang=None):
+    """
+    Return tuple (rev_id, timestamp) of the latest revision already stored in
+    the revision table (con) or in the Elasticsearch index of wiki lang
+    (es_con), or (None, None) if no revision is stored yet
+    """
+    rev_id, timestamp = None, None
+    if con is not None:
+        try:
+            result = con.execute_query("""SELECT MAX(rev_id), MAX(rev_timestamp)
+                                          FROM revision""")
+        except Exception as e:
+            print("Could not read latest revision from DB: ", e)
+            result = None
+        if result and result[0][0] is not None:
+            rev_id = int(result[0][0])
+            timestamp = str(result[0][1])
+
+    if es_con is not None:
+        try:
+            result = es_con.search(index=history_index(lang),
+                                   body={'size': 1,
+                                         'sort': [{'rev_id': 'desc'}],
+                                         '_source': ['rev_id', 'timestamp']})
+            hits = result['hits']['hits']
+        except ElasticsearchException as e:
+            print("Could not read latest revision from index: ", e)
+            hits = []
+        if hits and (rev_id is None or
+                     hits[0]['_source']['rev_id'] > rev_id):
+            rev_id = hits[0]['_source']['rev_id']
+            timestamp = hits[0]['_source']['timestamp']
+    return rev_id, timestamp
+
+
+def rev_meta_rows(rev, redis_cache=None, lang=None):
+    """
+    Return tuple (rev_insert, rev_hash_insert) with values of a Revision
+    from stub-meta-history dumps (no text) for tables revision and
+    revision_hash. Text length and SHA-1 hash are taken from the dump.
+    Redirects and quality templates cannot be detected without text.
+    """
+    user = store_contributor(redis_cache, lang, rev['id'],
+                             rev['contrib_dict'])
+    rev_insert = (int(rev['id']), int(rev['page_id']), user,
+                  rev['timestamp'].replace('Z', '').replace('T', ' '),
+                  int(rev['len_text'] or 0),
+                  (int(rev['rev_parent_id'])
+                   if rev['rev_parent_id'] is not None else None),
+                  0, (1 if 'minor' in rev else 0), 0, 0, 0,
+                  rev.get('comment') or u'')
+    rev_hash_insert = (int(rev['id']), int(rev['page_id']), user,
+                       rev.get('sha1') or u'')
+    return rev_insert, rev_hash_insert
+
+
+def rev_page_id(rev_hash):
+    """
+    Page id of a document yielded by revs_to_file (checkpoint key)
+    """
+    return rev_hash['page_id']
+
+
 def revs_file_to_db(rev_iter, con=None, es_con=None, log_file=None,
-                    tmp_dir=None, file_rows=1000000, etl_prefix=None):
+                    tmp_dir=None, file_rows=1000000, etl_prefix=None,
+                    checkpoint=None, lang=None):
     """
     Processor to insert revision info in DB
 
@@ -420,9 +508,14 @@ def revs_file_to_db(rev_iter, con=None, es_con=None, log_file=None,
         - tmp_dir: Directory to store temporary data files
         - file_rows: Number of rows to store in each tmp file
         - etl_prefix: Identifies the ETL process for this worker
+        - checkpoint: If given, function called to record progress right
+        before (pending=True) and after each bulk load
+        - lang: Language of the wiki, revisions are indexed in the
+        Elasticsearch index of this wiki (see history_index)
     """
     insert_rows = 0
     total_revs = 0
+    es_index = history_index(lang)
 
     logging.basicConfig(filename=log_file, level=logging.DEBUG)
     print("Starting revision data loading at %s." % (
@@ -433,15 +526,12 @@ def revs_file_to_db(rev_iter, con=None, es_con=None, log_file=None,
                                time.localtime())))
 
     # LOAD REVISION DATA
-    insert_rev = """LOAD DATA LOCAL INFILE '%s' INTO TABLE revision
-                    FIELDS OPTIONALLY ENCLOSED BY '"'
-                    TERMINATED BY '\t' ESCAPED BY '"'
-                    LINES TERMINATED BY '\n'"""
+    insert_rev = ("LOAD DATA LOCAL INFILE '%s' INTO TABLE revision " +
+                  LOAD_FIELDS)
 
-    insert_rev_hash = """LOAD DATA LOCAL INFILE '%s' INTO TABLE revision_hash
-                         FIELDS OPTIONALLY ENCLOSED BY '"'
-                         TERMINATED BY '\t' ESCAPED BY '"'
-                         LINES TERMINATED BY '\n'"""
+    insert_rev_hash = ("LOAD DATA LOCAL INFILE '%s' "
+                       "INTO TABLE revision_hash " +
+                       LOAD_FIELDS)
 
     path_file_rev = os.path.join(tmp_dir, etl_prefix + '_revision.csv')
     path_file_rev_hash = os.path.join(tmp_dir,
@@ -486,7 +576,11 @@ def revs_file_to_db(rev_iter, con=None, es_con=None, log_file=None,
             # file_rev_hash.close()
             # con.send_query(insert_rev % path_file_rev)
             # con.send_query(insert_rev_hash % path_file_rev_hash)
-            helpers.bulk(es_con, rev_his, index='viwiki_history')
+            if checkpoint is not None:
+                checkpoint(pending=True)
+            helpers.bulk(es_con, rev_his, index=es_index)
+            if checkpoint is not None:
+                checkpoint()
 
             logging.info("%s revisions %s." % (
                          total_revs,
@@ -503,7 +597,12 @@ def revs_file_to_db(rev_iter, con=None, es_con=None, log_file=None,
 
     # con.send_query(insert_rev % path_file_rev)
     # con.send_query(insert_rev_hash % path_file_rev_hash)
-    helpers.bulk(es_con, rev_his, index='viwiki_history')
+    if insert_rows > 0:
+        if checkpoint is not None:
+            checkpoint(pending=True)
+        helpers.bulk(es_con, rev_his, index=es_index)
+    if checkpoint is not None:
+        checkpoint()
     # TODO: Clean tmp files, uncomment the following lines
 #    os.remove(path_file_rev)
 #    os.remove(path_file_rev_hash)
@@ -515,7 +614,22 @@ def revs_file_to_db(rev_iter, con=None, es_con=None, log_file=None,
                                time.localtime())))
 
 
-def users_file_to_db(con=None, lang=None, log_file=None, tmp_dir=None):
+def ip_countries(ips):
+    """
+    Resolve countries of distinct anonymous IPs (integers) in bulk, and
+    return list of rows (ip, country) for table IP_country. Its ip column
+    only holds IPv4 addresses, so IPv6 addresses are skipped, as well as
+    addresses with unknown country
+    """
+    ips = np.unique(np.fromiter((ip for ip in ips if 0 <= ip <= 0xFFFFFFFF),
+                                dtype=np.int64))
+    countries = lookup_many(ips)
+    known = countries != ''
+    return list(zip(ips[known].tolist(), countries[known].tolist()))
+
+
+def users_file_to_db(con=None, lang=None, log_file=None, tmp_dir=None,
+                     fifo=False):
     """
     Processor to insert revision info in DB
 
@@ -526,6 +640,8 @@ def users_file_to_db(con=None, lang=None, log_file=None, tmp_dir=None):
         - con: Connection to local DB
         - log_file: Log file to track progress of data loading operations
         - tmp_dir: Directory to store temporary data files
+        - fifo: Keep temp data in memory and stream it to MySQL through
+        named pipes
     """
     logging.basicConfig(filename=log_file, level=logging.DEBUG)
     # Initialize connections to Redis DBs
@@ -538,29 +654,29 @@ def users_file_to_db(con=None, lang=None, log_file=None, tmp_dir=None):
 
     # LOAD USERS DATA
     # Load user info from Redis cache into persistent DB storage
-    insert_anons = """LOAD DATA LOCAL INFILE '%s' INTO TABLE revision_IP
-                      FIELDS OPTIONALLY ENCLOSED BY '"'
-                      TERMINATED BY '\t' ESCAPED BY '"'
-                      LINES TERMINATED BY '\n'"""
-
-    insert_users = """LOAD DATA LOCAL INFILE '%s' INTO TABLE user
-                      FIELDS OPTIONALLY ENCLOSED BY '"'
-                      TERMINATED BY '\t' ESCAPED BY '"'
-                      LINES TERMINATED BY '\n'"""
-
-    insert_users_zero = """LOAD DATA LOCAL INFILE '%s' INTO TABLE revision_user_zero
-                           FIELDS OPTIONALLY ENCLOSED BY '"'
-                           TERMINATED BY '\t' ESCAPED BY '"'
-                           LINES TERMINATED BY '\n'"""
+    insert_anons = ("LOAD DATA LOCAL INFILE '%s' INTO TABLE revision_IP " +
+                    LOAD_FIELDS)
+
+    insert_users = ("LOAD DATA LOCAL INFILE '%s' INTO TABLE user " +
+                    LOAD_FIELDS)
+
+    insert_users_zero = ("LOAD DATA LOCAL INFILE '%s' "
+                         "INTO TABLE revision_user_zero " +
+                         LOAD_FIELDS)
+
+    # Countries already stored (incremental loads) are not inserted again
+    insert_ip_country = ("LOAD DATA LOCAL INFILE '%s' IGNORE "
+                         "INTO TABLE IP_country " +
+                         LOAD_FIELDS)
+    loader = BulkLoader(con, fifo=fifo)
     # Anonymous IPs
     path_file_anons = os.path.join(tmp_dir, lang + '_anon_IPs.csv')
     # Delete previous versions of tmp files if present
     if os.path.isfile(path_file_anons):
         os.remove(path_file_anons)
 
-    file_anons = open(path_file_anons, 'w')
-    writer_anons = csv.writer(file_anons, dialect='excel-tab',
-                              lineterminator='\n')
+    file_anons = loader.open(path_file_anons)
+    writer_anons = TSVWriter(file_anons, 'revision_IP')
 
     list_anons = []
     for rev_anon in redis_cache.hscan_iter(lang + ':revsanon', count=1000):
@@ -570,21 +686,35 @@ def users_file_to_db(con=None, lang=None, log_file=None, tmp_dir=None):
 
     for rev_anon in list_anons:  # Save list of anonymous revs to tmp file
         try:
-            writer_anons.writerow([s for s in rev_anon])
+            writer_anons.writerow(rev_anon)
         except Exception as e:
             print("Error writing CSV file for anonymous users...")
             print(e)
     file_anons.close()
+
+    # Countries of anonymous IPs
+    path_file_ip_country = os.path.join(tmp_dir, lang + '_IP_country.csv')
+    if os.path.isfile(path_file_ip_country):
+        os.remove(path_file_ip_country)
+    file_ip_country = loader.open(path_file_ip_country)
+    writer_ip_country = TSVWriter(file_ip_country, 'IP_country')
+
+    list_ip_country = ip_countries(int(ip) for rev_id, ip in list_anons)
     del list_anons
+    total_ip_country = len(list_ip_country)
+
+    for ip_country in list_ip_country:
+        writer_ip_country.writerow(ip_country)
+    file_ip_country.close()
+    del list_ip_country
 
     # Registered users
     path_file_users = os.path.join(tmp_dir, lang + '_users.csv')
     # Delete previous versions of tmp files if present
     if os.path.isfile(path_file_users):
         os.remove(path_file_users)
-    file_users = open(path_file_users, 'w')
-    writer_users = csv.writer(file_users, dialect='excel-tab',
-                              lineterminator='\n')
+    file_users = loader.open(path_file_users)
+    writer_users = TSVWriter(file_users, 'user')
 
     list_users = []
     for item_user in redis_cache.hscan_iter(lang + ':users', count=1000):
@@ -594,8 +724,7 @@ def users_file_to_db(con=None, lang=None, log_file=None, tmp_dir=None):
 
     for item_user in list_users:
         try:
-            writer_users.writerow([s if isinstance(s, str)
-                                   else str(s) for s in item_user])
+            writer_users.writerow(item_user)
         except Exception as e:
             print("Error writing CSV file for registered users...")
             print(e)
@@ -605,9 +734,8 @@ def users_file_to_db(con=None, lang=None, log_file=None, tmp_dir=None):
     # Users with ID = 0 in dump file
     path_file_users_zero = os.path.join(tmp_dir,
                                         lang + '_users_zero.csv')
-    file_users_zero = open(path_file_users_zero, 'w')
-    writer_users_zero = csv.writer(file_users_zero, dialect='excel-tab',
-                                   lineterminator='\n')
+    file_users_zero = loader.open(path_file_users_zero)
+    writer_users_zero = TSVWriter(file_users_zero, 'revision_user_zero')
 
     list_users_zero = []
     for item_user_zero in redis_cache.hscan_iter(lang + ':userzero',
@@ -618,8 +746,7 @@ def users_file_to_db(con=None, lang=None, log_file=None, tmp_dir=None):
 
     for item_user_zero in list_users_zero:
         try:
-            writer_users_zero.writerow([s if isinstance(s, str)
-                                        else str(s) for s in item_user_zero])
+            writer_users_zero.writerow(item_user_zero)
         except Exception as e:
             print(e)
 
@@ -627,12 +754,17 @@ def users_file_to_db(con=None, lang=None, log_file=None, tmp_dir=None):
     del list_users_zero
 
     print("Inserting anonymous revisions info in DB")
-    con.send_query(insert_anons % path_file_anons)
+    loader.load(insert_anons % path_file_anons, path_file_anons)
+    print("Inserting countries of anonymous IPs in DB")
+    loader.load(insert_ip_country % path_file_ip_country,
+                path_file_ip_country)
     print("Inserting users info in DB")
-    con.send_query(insert_users % path_file_users)
+    loader.load(insert_users % path_file_users, path_file_users)
     print("Inserting missing users info in DB")
     print()
-    con.send_query(insert_users_zero % path_file_users_zero)
+    loader.load(insert_users_zero % path_file_users_zero,
+                path_file_users_zero)
+    loader.close()
     # TODO: Clean tmp files, uncomment the following lines
     # os.remove(path_file_anons)
     # os.remove(path_file_users)
@@ -644,6 +776,10 @@ def users_file_to_db(con=None, lang=None, log_file=None, tmp_dir=None):
                  total_anons,
                  time.strftime("%Y-%m-%d %H:%M:%S %Z",
                                time.localtime())))
+    logging.info("COMPLETED: %s countries of anonymous IPs resolved %s." % (
+                 total_ip_country,
+                 time.strftime("%Y-%m-%d %H:%M:%S %Z",
+                               time.localtime())))
     logging.info("COMPLETED: %s registered users processed %s." % (
                  total_users,
                  time.strftime("%Y-%m-%d %H:%M:%S %Z",
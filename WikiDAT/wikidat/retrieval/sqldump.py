@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming parser for SQL dump files created with mysqldump (e.g. pagelinks,
+categorylinks, templatelinks, langlinks or externallinks tables)
+
+Wikimedia SQL dumps store each table as a CREATE TABLE statement followed by
+long INSERT INTO ... VALUES (...),(...); statements, one per line. Instead
+of running those statements through a MySQL client one by one, tuples are
+parsed and written to TSV chunk files, which are bulk loaded with LOAD DATA.
+
+Dumps are read and written as raw bytes. Quoted values keep the escape
+sequences of mysqldump, which are the same understood by LOAD DATA with the
+default ESCAPED BY '\\' clause, so they can be copied to TSV files almost
+verbatim (only literal tabs and newlines need to be escaped).
+"""
+import re
+
+"""
+A quoted string value in an INSERT statement, which may contain escaped
+quotes. Its contents (without quotes) are captured, so that splitting a
+statement with it alternates unquoted and quoted parts
+"""
+QUOTED_RE = re.compile(rb"'([^'\\]*(?:\\.[^'\\]*)*)'")
+
+INSERT_RE = re.compile(rb"INSERT INTO `([^`]+)` VALUES ")
+CREATE_RE = re.compile(rb"CREATE TABLE `([^`]+)`")
+
+"""
+Query to load TSV chunk files, keeping bytes as they are in the dump
+"""
+LOAD_TSV = """LOAD DATA LOCAL INFILE '%s' INTO TABLE `%s`
+              CHARACTER SET binary
+              FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+              LINES TERMINATED BY '\\n'"""
+
+
+def tsv_rows(values):
+    """
+    Return TSV lines (bytes) for all tuples in the VALUES part of an INSERT
+    statement, e.g. (1,'A',NULL),(2,'B',0);
+
+    Unquoted parts of the statement only have numbers, NULL values and
+    separators between values and tuples, which are replaced as a whole.
+    Quoted values are copied as they are, unless the statement has literal
+    tabs or newlines (very rarely).
+    """
+    parts = QUOTED_RE.split(values.rstrip()[1:-2])
+    parts[0::2] = [part.replace(b'),(', b'\n').replace(b',', b'\t')
+                   .replace(b'NULL', b'\\N') for part in parts[0::2]]
+    if b'\t' in values or b'\n' in values.rstrip():
+        parts[1::2] = [part.replace(b'\t', b'\\t').replace(b'\n', b'\\n')
+                       for part in parts[1::2]]
+    return b''.join(parts) + b'\n'
+
+
+def parse_sql_dump(in_stream):
+    """
+    Parse SQL dump from a binary file-like object. Yields tuples:
+        - ('create', table, statement) for each CREATE TABLE statement
+        - ('rows', table, rows) for each INSERT statement, where rows are
+        TSV lines (bytes) ready to be loaded with LOAD_TSV
+    """
+    create = None
+    for line in in_stream:
+        if create is None and line.startswith(b'CREATE TABLE'):
+            create = []
+        if create is not None:
+            create.append(line)
+            if line.rstrip().endswith(b';'):
+                statement = b''.join(create).rstrip().rstrip(b';')
+                yield ('create', CREATE_RE.search(statement).group(1).decode(),
+                       statement.decode('utf-8'))
+                create = None
+            continue
+
+        match = INSERT_RE.match(line)
+        if match:
+            yield ('rows', match.group(1).decode(),
+                   tsv_rows(line[match.end():]))
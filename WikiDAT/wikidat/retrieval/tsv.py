@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Encoding of rows in TSV temp data files for bulk data loads with LOAD DATA
+
+Rows of each known table are encoded by a function that applies the
+encoding of each of its columns, which escapes only backslashes, tabs and
+newlines in text values (the only characters with a special meaning for the
+FIELDS clause below) and writes None as \\N (SQL NULL). Unlike csv.writer,
+no value is quoted. Data files are opened with a large buffer (see
+BulkLoader.open), so lines are written to it as they are encoded.
+"""
+
+"""
+FIELDS and LINES clauses of LOAD DATA queries for files written by TSVWriter
+"""
+LOAD_FIELDS = """FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+                 LINES TERMINATED BY '\\n'"""
+
+"""
+Kinds of columns in rows of each table, in the same order as in the table:
+    - d = number (or string with a number), never None
+    - n = number or None
+    - s = text or None
+"""
+SCHEMAS = {
+    'page': 'ddss',
+    'revision': 'dddsdnddddds',
+    'revision_hash': 'ddds',
+    'logging': 'dsssdsdsssdd',
+    'block': 'dsdsssd',
+    'user_new': 'ddsss',
+    'user_level': 'ddssss',
+    'user': 'ds',
+    'revision_IP': 'dd',
+    'revision_user_zero': 'ds',
+    'IP_country': 'ds',
+    'country_contrib': 'dsd',
+    'monthly_metrics_pages': 'ddddd',
+}
+
+UNESCAPES = {'0': '\0', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t',
+             'Z': '\x1a'}
+
+
+def escape(text):
+    """
+    Return text value escaped for a TSV line (None is written as \\N)
+    """
+    if text is None:
+        return '\\N'
+    if '\\' in text or '\t' in text or '\n' in text:
+        return (text.replace('\\', '\\\\').replace('\t', '\\t')
+                .replace('\n', '\\n'))
+    return text
+
+
+def null(number):
+    """
+    Return number value for a TSV line (None is written as \\N)
+    """
+    return '\\N' if number is None else str(number)
+
+
+"""
+Encoding of values for each kind of column (see SCHEMAS)
+"""
+COLUMN_ENCODERS = {'d': str, 'n': null, 's': escape}
+
+
+def make_encoder(kinds):
+    """
+    Return a function encoding rows (sequences) with columns of the given
+    kinds (see SCHEMAS) as TSV lines. Numbers are formatted with str()
+    """
+    encoders = [COLUMN_ENCODERS[kind] for kind in kinds]
+
+    def encode(row):
+        return '\t'.join([encode_value(value) for encode_value, value
+                          in zip(encoders, row)]) + '\n'
+    return encode
+
+
+ENCODERS = {table: make_encoder(kinds) for table, kinds in SCHEMAS.items()}
+
+
+class TSVWriter(object):
+    """
+    Writes rows of a known table to a temp data file, in the format expected
+    by LOAD DATA queries with LOAD_FIELDS
+    """
+
+    def __init__(self, out_file, table):
+        """
+        Arguments:
+            - out_file = Data file opened for writing in text mode
+            - table = Name of table (key in SCHEMAS)
+        """
+        self.encode = ENCODERS[table]
+        self.write = out_file.write
+
+    def writerow(self, row):
+        self.write(self.encode(row))
+
+
+def decode_line(line):
+    """
+    Return list of values in a TSV line, as parsed by LOAD DATA with
+    LOAD_FIELDS (\\N is returned as None, other values as str)
+    """
+    values = []
+    chars = []
+    pos = 0
+    line = line[:-1] if line.endswith('\n') else line
+    while pos < len(line):
+        char = line[pos]
+        if char == '\\' and pos + 1 < len(line):
+            pos += 1
+            char = line[pos]
+            if char == 'N' and not chars and (
+                    pos + 1 == len(line) or line[pos + 1] == '\t'):
+                chars = None
+            else:
+                chars.append(UNESCAPES.get(char, char))
+        elif char == '\t':
+            values.append(chars if chars is None else ''.join(chars))
+            chars = []
+        else:
+            chars.append(char)
+        pos += 1
+    values.append(chars if chars is None else ''.join(chars))
+    return values
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+Batch execution of ETL tasks for many Wikipedia languages
+
+Each combination of language and tool section (e.g. ETL:RevHistory) is a
+job. The amount of work of every job is estimated from the size of its
+dump files, and jobs are started largest first, sharing a global budget of
+processes and database connections. Each job receives a number of ETL
+lines proportional to its share of the pending work, so small wikis fill
+in the remaining budget while large ones are still running.
+"""
+from .tasks import RevHistoryTask, PagesLoggingTask
+from .download import RevHistDownloader, LoggingDownloader, DumpCatalog
+from multiprocessing.connection import wait
+import multiprocessing as mp
+import os
+import glob
+import time
+
+"""
+Dump file downloader and pattern of local dump files for each tool
+section supported in batch mode
+"""
+TOOL_FILES = {
+    'ETL:RevHistory': (RevHistDownloader, ['*pages-meta-history*.7z',
+                                           '*pages-meta-history*.xml']),
+    'ETL:PagesLogging': (LoggingDownloader, ['*pages-logging*.gz']),
+}
+
+"""
+Options passed on to execute() for each type of task
+"""
+REVHIST_OPTS = ('page_fan', 'rev_fan', 'page_cache_size', 'rev_cache_size',
+                'mirror', 'download_files', 'dumps_dir', 'debug',
+                'expand_templates', 'clean_workers', 'clean_chunksize',
+                'filter_namespaces', 'filter_redirects', 'filter_min_size',
+                'filter_max_size', 'filter_titles', 'quality_window',
+                'quality_fallback', 'resume', 'incremental', 'sink',
+                'parquet_dir', 'parquet_row_group', 'load_workers',
+                'fifo_load', 'index_workers')
+LOGGING_OPTS = ('log_fan', 'log_cache_size', 'mirror', 'download_files',
+                'dumps_dir', 'debug', 'sink', 'parquet_dir',
+                'parquet_row_group', 'log_load_workers', 'fifo_load',
+                'index_workers')
+
+# Distance between ports of ETL lines running at the same time
+PORT_STEP = 10
+
+
+class BatchJob(object):
+    """
+    ETL task for one language and tool section, with estimated work
+    """
+
+    def __init__(self, lang, tool, sizes, opts):
+        """
+        Arguments:
+            - lang = Code of the Wikipedia language to be processed
+            - tool = Tool section (ETL:RevHistory or ETL:PagesLogging)
+            - sizes = List of sizes of dump files to be processed
+            - opts = Dict of options for the task
+        """
+        self.lang = lang
+        self.tool = tool
+        self.size = sum(sizes)
+        self.n_files = len(sizes)
+        if tool == 'ETL:RevHistory':
+            # Producer, page and revision workers and 2 consumers; one
+            # connection for each revision worker and page loader plus 3
+            # per line
+            self.proc_cost = opts['page_fan'] + opts['rev_fan'] + 3
+            self.conn_cost = opts['rev_fan'] + opts['load_workers'] + 3
+            self.max_lines = max(1, self.n_files)
+        else:
+            # Logging tasks always run a single ETL line
+            self.proc_cost = opts['log_fan'] + 2
+            self.conn_cost = 1 + opts['log_load_workers']
+            self.max_lines = 1
+
+    def __repr__(self):
+        return "<%s %s: %d files, %d bytes>" % (self.tool, self.lang,
+                                                self.n_files, self.size)
+
+
+def estimate_sizes(lang, tool, opts):
+    """
+    Return list of sizes of dump files for lang and tool, from the mirror
+    if files are to be downloaded or else from the local dumps folder
+    """
+    downloader_class, patterns = TOOL_FILES[tool]
+    if opts['download_files']:
+        downloader = downloader_class(opts['mirror'], lang, opts['dumps_dir'])
+        downloader.list_files(opts['date'])
+        return downloader.file_sizes()
+
+    if opts['dumps_dir']:
+        dumps_path = os.path.join(os.path.expanduser(opts['dumps_dir']),
+                                  lang + '_dumps', opts['date'])
+    else:
+        dumps_path = os.path.join("data", lang + '_dumps', opts['date'])
+    for pattern in patterns:
+        paths = glob.glob(os.path.join(dumps_path, pattern))
+        if paths:
+            return [os.path.getsize(path) for path in paths]
+    return []
+
+
+def run_job(job, opts, etl_lines, base_ports, control_ports):
+    """
+    Execute ETL task for job, in its own process
+    """
+    db_name = opts['batch_db_name'].format(lang=job.lang, date=opts['date'])
+    # Catalog options of the parent process are not inherited with spawn
+    DumpCatalog.for_mirror(opts['mirror'], cache_dir=opts['cache_dir'],
+                           ttl=opts['ttl'], offline=opts['offline'])
+    task_args = dict(lang=job.lang, date=opts['date'], etl_lines=etl_lines,
+                     host=opts['host'], port=opts['port'], db_name=db_name,
+                     db_user=opts['db_user'], db_passw=opts['db_passw'],
+                     db_engine=opts['db_engine'])
+    if job.tool == 'ETL:RevHistory':
+        task = RevHistoryTask(**task_args)
+        kwargs = dict((name, opts[name]) for name in REVHIST_OPTS)
+    else:
+        task = PagesLoggingTask(**task_args)
+        kwargs = dict((name, opts[name]) for name in LOGGING_OPTS)
+    task.execute(base_ports=base_ports, control_ports=control_ports,
+                 **kwargs)
+
+
+class BatchTask(object):
+    """
+    Runs ETL tasks for a list of languages, scheduling their ETL lines
+    across a global budget of processes and database connections
+    """
+
+    def __init__(self, langs, tools, opts, max_procs=None,
+                 max_connections=None):
+        """
+        Arguments:
+            - langs = List of codes of Wikipedia languages to be processed
+            - tools = List of tool sections to run for each language
+            - opts = Dict with options for all tasks, as read by main.py
+            - max_procs = Maximum number of processes running at the same
+            time (default: number of CPUs)
+            - max_connections = Maximum number of DB connections open at the
+            same time (default: no limit)
+        """
+        self.langs = langs
+        self.tools = [tool for tool in tools if tool in TOOL_FILES]
+        for tool in set(tools) - set(self.tools):
+            print("Tool %s is not supported in batch mode, skipped." % tool)
+        self.opts = opts
+        self.max_procs = max_procs or mp.cpu_count()
+        self.max_connections = max_connections
+        base_ports = opts['base_ports']
+        control_ports = opts['control_ports']
+        self.base_port = (base_ports[0] if isinstance(base_ports, list)
+                          else base_ports)
+        self.control_port = (control_ports[0]
+                             if isinstance(control_ports, list)
+                             else control_ports)
+        self.jobs = []
+
+    def plan(self):
+        """
+        Create one job for each language and tool, sorted by estimated
+        amount of work (largest first)
+        """
+        self.jobs = []
+        for lang in self.langs:
+            for tool in self.tools:
+                sizes = estimate_sizes(lang, tool, self.opts)
+                if not sizes:
+                    print("No dump files found for %s %s, skipped." % (
+                          tool, lang))
+                    continue
+                self.jobs.append(BatchJob(lang, tool, sizes, self.opts))
+        self.jobs.sort(key=lambda job: job.size, reverse=True)
+        return self.jobs
+
+    def lines_for(self, job, total_work, free_procs, free_conns):
+        """
+        Return number of ETL lines to start job with the free budget, or 0
+        if it does not fit. Each job gets lines in proportion to its share
+        of the work not finished yet
+        """
+        share = float(job.size) / total_work if total_work else 1.0
+        lines = int(share * self.max_procs / job.proc_cost)
+        lines = max(1, min(lines, job.max_lines))
+        while lines > 0 and (lines * job.proc_cost > free_procs or
+                             (free_conns is not None and
+                              lines * job.conn_cost > free_conns)):
+            lines -= 1
+        return lines
+
+    def _ports(self, base, slots, step):
+        """
+        List of ports for ETL lines in slots, compensating for the offset
+        of step * line added by tasks
+        """
+        return [base + PORT_STEP * slot - step * x
+                for x, slot in enumerate(slots)]
+
+    def execute(self):
+        """
+        Run all jobs, starting the largest ones first, as long as there
+        is free budget for them
+        """
+        pending = self.plan()
+        print("Batch of %d jobs, budget of %s processes and %s connections"
+              % (len(pending), self.max_procs, self.max_connections))
+        for job in pending:
+            print("  ", job)
+        running = {}  # job process sentinel --> (job, process, slots)
+        used_slots = set()
+        free_procs = self.max_procs
+        free_conns = self.max_connections
+        start = time.time()
+
+        while pending or running:
+            busy_langs = set(job.lang for job, p, slots in running.values())
+            total_work = sum(job.size for job in pending) + sum(
+                job.size for job, p, slots in running.values())
+            for job in list(pending):
+                # Jobs of the same language share the same database
+                if job.lang in busy_langs:
+                    continue
+                lines = self.lines_for(job, total_work, free_procs,
+                                       free_conns)
+                if lines == 0 and not running:
+                    # Job larger than the whole budget, run it alone
+                    lines = 1
+                if lines == 0:
+                    continue
+                slots = []
+                slot = 0
+                while len(slots) < lines:
+                    if slot not in used_slots:
+                        slots.append(slot)
+                    slot += 1
+                used_slots.update(slots)
+                # RevHistoryTask adds 20 * line to the port of each line,
+                # PagesLoggingTask adds 30 to the port of its only line
+                if job.tool == 'ETL:RevHistory':
+                    ports = (self._ports(self.base_port, slots, 20),
+                             self._ports(self.control_port, slots, 20))
+                else:
+                    ports = (self._ports(self.base_port - 30, slots, 0),
+                             self._ports(self.control_port - 30, slots, 0))
+                proc = mp.Process(target=run_job,
+                                  name="[Batch-%s-%s]" % (job.tool, job.lang),
+                                  args=(job, self.opts, lines) + ports)
+                proc.start()
+                print("Started %s %s with %d ETL lines" % (job.tool,
+                                                           job.lang, lines))
+                running[proc.sentinel] = (job, proc, slots)
+                pending.remove(job)
+                busy_langs.add(job.lang)
+                free_procs -= lines * job.proc_cost
+                if free_conns is not None:
+                    free_conns -= lines * job.conn_cost
+
+            # Wait for any job to finish and release its budget
+            for sentinel in wait(list(running)):
+                job, proc, slots = running.pop(sentinel)
+                proc.join()
+                used_slots.difference_update(slots)
+                free_procs += len(slots) * job.proc_cost
+                if free_conns is not None:
+                    free_conns += len(slots) * job.conn_cost
+                print("Finished %s %s (exit code %s) after %.2f mins." % (
+                      job.tool, job.lang, proc.exitcode,
+                      (time.time() - start) / 60.))
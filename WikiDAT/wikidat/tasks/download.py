@@ -7,12 +7,13 @@ Download manager for dump files
 @author: jfelipe
 """
 from bs4 import BeautifulSoup
-import multiprocessing as mp
-import itertools
+from multiprocessing.pool import ThreadPool
 import requests
 import re
 import os
 import sys
+import json
+import time
 import hashlib
 import logging
 from utils import misc
@@ -31,6 +32,210 @@ class DumpIntegrityError(Exception):
                     .format(file_path))
 
 
+class DumpDownloadError(Exception):
+    """Exception raised when some dump files could not be retrieved.
+
+    Attributes:
+        errors -- dict with the error of each failed file, by file path
+        msg  -- explanation of the error
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        self.msg = ("""Dump files not downloaded:\n {0}"""
+                    .format("\n ".join(sorted(errors))))
+        super(DumpDownloadError, self).__init__(self.msg)
+
+
+class DumpCatalog(object):
+    """
+    Catalog of dump files available in a mirror site, shared by all
+    downloaders of that mirror (see DumpCatalog.for_mirror)
+
+    Index of dump dates for each language and list of files, status and
+    checksums of each dump are retrieved once and stored in JSON files
+    under cache_dir. Cached entries are reused until they are older than
+    ttl seconds, except for completed dumps, which never change. If the
+    mirror cannot be reached, or offline is True, cached entries are used
+    regardless of their age.
+
+    The list of files and checksums is read from dumpstatus.json, if the
+    mirror provides it, or else scraped from the dump summary page.
+    """
+    # Catalogs already created, by mirror URL
+    _catalogs = {}
+
+    def __init__(self, mirror, cache_dir=os.path.join("data", "catalog"),
+                 ttl=3600, offline=False):
+        self.mirror = mirror
+        host = re.sub(r'[^\w.-]', '_',
+                      re.sub(r'^\w+://', '', mirror).strip('/'))
+        self.cache_dir = os.path.join(cache_dir, host)
+        self.ttl = ttl
+        self.offline = offline
+        self.entries = {}  # Entries already loaded, by cache file path
+
+    @classmethod
+    def for_mirror(cls, mirror, **options):
+        """
+        Return the shared catalog for this mirror. If options (cache_dir,
+        ttl, offline) are given, the shared catalog is created again with
+        them, to be used by all downloaders created afterwards
+        """
+        if options or mirror not in cls._catalogs:
+            cls._catalogs[mirror] = cls(mirror, **options)
+        return cls._catalogs[mirror]
+
+    def dates(self, language):
+        """
+        Return list of hyperlinks and list of timestamps of dumps for each
+        available date for this language
+        """
+        entry = self._entry(os.path.join(self.cache_dir, language,
+                                         "dates.json"),
+                            lambda: self._fetch_dates(language))
+        return entry['urldates'], entry['dates']
+
+    def dump(self, language, dump_date):
+        """
+        Return dict with status, list of file URLs and checksums (by file
+        name and hash algorithm) of dump for this language and date
+        """
+        return self._entry(self._dump_path(language, dump_date),
+                           lambda: self._fetch_dump(language, dump_date))
+
+    def add_sizes(self, language, dump_date, sizes):
+        """
+        Add sizes of dump files (in bytes, by file name) to the entry of
+        dump for this language and date, also in its cache file
+        """
+        entry = self.dump(language, dump_date)
+        entry.setdefault('sizes', {}).update(sizes)
+        self._save(self._dump_path(language, dump_date), entry)
+
+    def _dump_path(self, language, dump_date):
+        """
+        Return path to cache file of dump for language and dump_date
+        """
+        return os.path.join(self.cache_dir, language,
+                            dump_date.strip('/') + ".json")
+
+    def _entry(self, path, fetch):
+        """
+        Return catalog entry cached in path, calling fetch to retrieve it
+        from the mirror if it is missing or expired
+        """
+        entry = self.entries.get(path)
+        if entry is None and os.path.exists(path):
+            with open(path) as cache_file:
+                entry = json.load(cache_file)
+        if entry is not None and (self.offline or entry.get('complete') or
+                                  time.time() - entry['fetched'] < self.ttl):
+            self.entries[path] = entry
+            return entry
+        if self.offline:
+            raise IOError("Dump catalog entry %s not found in cache" % path)
+        try:
+            new_entry = fetch()
+        except requests.exceptions.RequestException as e:
+            if entry is None:
+                raise
+            print("Mirror %s not available (%s), using cached catalog."
+                  % (self.mirror, e))
+            # Do not wait for the mirror again in the next lookups
+            self.offline = True
+            self.entries[path] = entry
+            return entry
+        new_entry['fetched'] = time.time()
+        self._save(path, new_entry)
+        self.entries[path] = new_entry
+        return new_entry
+
+    @staticmethod
+    def _save(path, entry):
+        """
+        Write catalog entry to its cache file in path
+        """
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as cache_file:
+            json.dump(entry, cache_file)
+
+    def _get(self, url):
+        """
+        Retrieve url, raising HTTPError for error responses
+        """
+        resp = requests.get(url)
+        resp.raise_for_status()
+        return resp
+
+    def _fetch_dates(self, language):
+        """
+        Scrape index of dump dates for language from the mirror
+        """
+        soup_dates = BeautifulSoup(self._get("".join([self.mirror,
+                                                      language])).text,
+                                   "lxml")
+        # Get hyperlinks and timestamps of dumps for each available date
+        # Ignore first line with link to parent folder
+        return {'urldates': [link.get('href')
+                             for link in soup_dates.find_all('a')][1:],
+                'dates': [link.text
+                          for link in soup_dates.find_all('td', 'm')][1:]}
+
+    def _fetch_dump(self, language, dump_date):
+        """
+        Retrieve status, files and checksums of dump for language and
+        dump_date from the mirror
+        """
+        target_url = "".join([self.mirror, language, "/", dump_date])
+        try:
+            resp = self._get("".join([target_url.rstrip('/'),
+                                      "/dumpstatus.json"]))
+            return self._parse_dumpstatus(resp.json())
+        except (requests.exceptions.HTTPError, ValueError, KeyError):
+            pass
+
+        soup_dumps = BeautifulSoup(self._get(target_url).text, "lxml")
+        status = soup_dumps.find('p', class_='status').span.text
+        files = [link.get('href') for link in soup_dumps.find_all(href=True)]
+        checksums = {}
+        for link in soup_dumps.find('p', class_='checksum').find_all('a'):
+            href = link['href']
+            hash_name = 'sha1' if 'sha1' in href else 'md5'
+            codes = self._get("".join([self.mirror, href])).text
+            for fileitem in codes.split('\n'):
+                f = fileitem.split()
+                if len(f) > 0:
+                    # dict[fname][hash_name] = code
+                    checksums.setdefault(f[1], {})[hash_name] = f[0]
+        return {'status': status, 'complete': status == 'Dump complete',
+                'files': files, 'checksums': checksums}
+
+    @staticmethod
+    def _parse_dumpstatus(dumpstatus):
+        """
+        Build catalog entry from content of dumpstatus.json
+        """
+        files = []
+        checksums = {}
+        sizes = {}
+        complete = True
+        for job in dumpstatus['jobs'].values():
+            complete = complete and job['status'] in ('done', 'skipped')
+            for fname, info in job.get('files', {}).items():
+                if 'url' in info:
+                    files.append(info['url'])
+                if 'size' in info:
+                    sizes[fname] = info['size']
+                checksums[fname] = dict((name, info[name])
+                                        for name in ('md5', 'sha1')
+                                        if name in info)
+        return {'status': 'Dump complete' if complete else 'Dump in progress',
+                'complete': complete, 'files': files, 'checksums': checksums,
+                'sizes': sizes}
+
+
 class Downloader(object):
     """
     Download manager for any type of Wikipedia dump file
@@ -41,7 +246,22 @@ class Downloader(object):
     http://dumps.wikimedia.your.org, is configured as the default option,
     as it allows two parallel downloading processes and it hosts up-to-date
     files from WMF original dump site.
+
+    Files are downloaded to a .part file, renamed when complete. If a
+    transfer is interrupted, it is resumed from the end of the .part file
+    using HTTP Range requests, also across different runs.
+
+    Checksums published by the mirror (md5 and sha1) are computed while
+    data is received, and files already on disk with matching checksums
+    are not downloaded again.
     """
+    # Due to bandwith limitations in WMF mirror servers, you will not
+    # be allowed to download more than 2 dump files at the same time
+    max_downloads = 2
+    # Attempts to resume an interrupted transfer before giving up
+    max_retries = 5
+    # Seconds to wait for the server before the transfer is retried
+    timeout = 60
 
     def __init__(self, mirror="http://dumps.wikimedia.your.org/",
                  language='scowiki', dumps_dir=None):
@@ -49,15 +269,8 @@ class Downloader(object):
         self.mirror = mirror
         self.base_url = "".join([self.mirror, self.language])
         # print("Base URL is: %s" % (self.base_url))
-        html_dates = requests.get(self.base_url)
-        soup_dates = BeautifulSoup(html_dates.text, "lxml")
-
-        # Get hyperlinks and timestamps of dumps for each available date
-        # Ignore first line with link to parent folder
-        self.dump_urldate = [link.get('href')
-                             for link in soup_dates.find_all('a')][1:]
-        self.dump_dates = [link.text
-                           for link in soup_dates.find_all('td', 'm')][1:]
+        self.catalog = DumpCatalog.for_mirror(mirror)
+        self.dump_urldate, self.dump_dates = self.catalog.dates(language)
         # Stores re in subclass for type of dump file
         # To be filled in subclass with pattern for dump files
         self.match_pattern = ""
@@ -66,12 +279,19 @@ class Downloader(object):
         else:
             self.dump_basedir = os.path.join("data", language + "_dumps")
         self.dump_paths = []  # List of paths to dumps in local filesystem
+        self.dump_date = None  # Date of dump files in dump_paths
         self.md5_codes = {}  # Dict for md5 codes to verify dump files
+        # Dict of checksums to verify dump files, by file name and
+        # hash algorithm (e.g. checksums[fname]['sha1'] = sha1code)
+        self.checksums = {}
+        # Sizes of dump files published in the catalog, by file name
+        self.sizes = {}
 
-    def download(self, dump_date=None):
+    def list_files(self, dump_date=None):
         """
-        Download all dump files for a given language in their own folder
-        Return list of paths to dump files to be processed
+        Find all dump files for a given language and date on the mirror,
+        without downloading them, and create their local folder
+        Return list of local paths to dump files and dump date
 
         Default target dump_date is latest available dump (index -2, as the
         last item is the generic 'latest' date, not a real date)
@@ -81,12 +301,10 @@ class Downloader(object):
         # Obtain content for dump summary page on requested date
         self.target_url = "".join([self.base_url, "/", dump_date])
         print("Target URL is: %s" % (self.target_url))
-        html_dumps = requests.get(self.target_url)
-        soup_dumps = BeautifulSoup(html_dumps.text, "lxml")
+        dump_entry = self.catalog.dump(self.language, dump_date)
 
         # First of all, check that status of dump files is Done (ready)
-        status_dumps = soup_dumps.find('p', class_='status').span.text
-        if status_dumps != 'Dump complete':
+        if dump_entry['status'] != 'Dump complete':
             # TODO: Provide an alternative to the user (e.g. latest dump)
             print("Data dump for the selected date is not ready yet.")
             print("Please, provide a valid date for a completed dump process")
@@ -95,8 +313,8 @@ class Downloader(object):
             sys.exit()
 
         # Dump file(s) ready, proceed with list of files and download
-        self.dump_urls = [link.get('href') for link in (soup_dumps.
-                          find_all(href=re.compile(self.match_pattern)))]
+        self.dump_urls = [url for url in dump_entry['files']
+                          if re.search(self.match_pattern, url)]
         # Create directory for dump files if needed
         self.dump_dir = os.path.join(self.dump_basedir, dump_date)
         self.logs_dir = os.path.join(self.dump_basedir, dump_date, "logs")
@@ -105,45 +323,108 @@ class Downloader(object):
         if not os.path.exists(self.logs_dir):
             os.makedirs(self.logs_dir)
 
-        for url1, url2 in itertools.zip_longest(self.dump_urls[::2],
-                                                self.dump_urls[1::2],
-                                                fillvalue=None):
-            file_name1 = url1.split('/')[-1]
-            path_file1 = os.path.join(self.dump_dir, file_name1)
-            self.dump_paths.append(path_file1)
-
-            # Due to bandwith limitations in WMF mirror servers, you will not
-            # be allowed to download more than 2 dump files at the same time
-            proc_get1 = mp.Process(target=self._get_file,
-                                   args=(url1, path_file1,))
-            proc_get1.start()
-            # Control here for even number of dumps (last element is None)
-            if url2 is not None:
-                file_name2 = url2.split('/')[-1]
-                path_file2 = os.path.join(self.dump_dir, file_name2)
-                self.dump_paths.append(path_file2)
-                proc_get2 = mp.Process(target=self._get_file,
-                                       args=(url2, path_file2,))
-                proc_get2.start()
-                proc_get2.join()
-
-            # Wait until all downloads are finished
-            proc_get1.join()
+        self.dump_paths = [os.path.join(self.dump_dir, url.split('/')[-1])
+                           for url in self.dump_urls]
+        self.dump_date = dump_date
+        # Integrity of dump files is verified while they are downloaded
+        self._get_checksums(dump_entry)
+        self.sizes = dump_entry.get('sizes', {})
+        return self.dump_paths, dump_date
 
-        print("Paths in download: ", str(self.dump_paths))
-        # Verify integrity of downloaded dumps
-        try:
-            self._verify(self.target_url)
-        except DumpIntegrityError as e:
-            print(e.msg)
+    def file_sizes(self):
+        """
+        Return size in bytes of each dump file found with list_files, as
+        published in the dump catalog or else reported by the mirror
+
+        Sizes reported by the mirror are stored in the catalog, so that
+        they are also available offline
+        """
+        sizes = self.catalog.dump(self.language,
+                                  self.dump_date).get('sizes', {})
+        new_sizes = {}
+        for url in self.dump_urls:
+            file_name = url.split('/')[-1]
+            if file_name not in sizes:
+                if self.catalog.offline:
+                    raise IOError("Size of dump file %s not found in "
+                                  "catalog cache" % file_name)
+                resp = requests.head("".join([self.mirror, url]),
+                                     allow_redirects=True)
+                resp.raise_for_status()
+                new_sizes[file_name] = int(resp.headers.get('content-length',
+                                                            0))
+        if new_sizes:
+            self.catalog.add_sizes(self.language, self.dump_date, new_sizes)
+            sizes = dict(sizes, **new_sizes)
+        return [sizes[url.split('/')[-1]] for url in self.dump_urls]
+
+    def download(self, dump_date=None, paths_queue=None, skip=None):
+        """
+        Download all dump files for a given language in their own folder
+        Return list of paths to dump files to be processed
 
+        If paths_queue is given, the path to each dump file is put in it as
+        soon as the file is downloaded and verified, so that it can be
+        processed while the remaining files are still being downloaded.
+        Files with integrity errors are not put in paths_queue, nor files
+        whose path makes skip(path) true (e.g. already processed).
+
+        Raise DumpDownloadError after the remaining files are retrieved, if
+        any file had integrity errors or could not be downloaded.
+        """
+        # Dump files may have been listed already with list_files
+        if self.dump_date is None or dump_date not in (None, self.dump_date):
+            self.list_files(dump_date)
+        dump_date = self.dump_date
+
+        # Keep up to max_downloads files transferring at the same time. A
+        # new download starts as soon as any of them finishes
+        pool = ThreadPool(processes=max(1, min(self.max_downloads,
+                                               len(self.dump_urls))))
+        errors = {}
+        try:
+            for path_file, error in pool.imap_unordered(
+                    self._try_get_file, zip(self.dump_urls, self.dump_paths)):
+                if error is not None:
+                    print(getattr(error, 'msg', "Error downloading file %s: %s"
+                                  % (path_file, error)))
+                    errors[path_file] = error
+                elif paths_queue is not None:
+                    if skip is not None and skip(path_file):
+                        print("Skipping dump file already processed: %s"
+                              % path_file)
+                        continue
+                    paths_queue.put(path_file)
+        finally:
+            pool.close()
+            pool.join()
+        if errors:
+            raise DumpDownloadError(errors)
         print("File integrity checked, no errors found.")
+
+        print("Paths in download: ", str(self.dump_paths))
         # Return list of paths to dumpfiles for data extraction
         return self.dump_paths, dump_date
 
+    def _try_get_file(self, job):
+        """
+        Retrieve dump file for job (dump_url, path_file) with _get_file
+        Return path_file and DumpIntegrityError or requests exception
+        raised, if any, so that the other files are still retrieved
+        """
+        dump_url, path_file = job
+        try:
+            self._get_file(dump_url, path_file)
+        except (DumpIntegrityError,
+                requests.exceptions.RequestException) as e:
+            return path_file, e
+        return path_file, None
+
     def _get_file(self, dump_url, path_file):
         """
         Retrieve individual dump file from dump_url and save it in dump_dir
+        Data is stored in path_file + '.part' until the download completes,
+        so that it can be resumed with an HTTP Range request
         Progress bar taken from:
         http://stackoverflow.com/questions/15644964/
         python-progress-bar-and-downloads
@@ -151,63 +432,155 @@ class Downloader(object):
         local_dir = os.path.split(path_file)[0]
         file_name = os.path.split(path_file)[1]
         file_url = "".join([self.mirror, dump_url])
+        part_file = path_file + '.part'
+        checksums = self.checksums.get(file_name, {})
+
+        # Skip files already downloaded in a previous run
+        if checksums and os.path.exists(path_file):
+            hashes = self._new_hashes(checksums)
+            self._hash_file(path_file, hashes)
+            if self._check_hashes(checksums, hashes):
+                print("File %s already downloaded." % file_name)
+                return
         print("File URL is: %s" % (file_url))
 
-        # Setup log file
+        # Setup log file, one for each file downloaded in parallel
         log_file = os.path.join(local_dir, "logs", file_name + ".log")
-        logging.basicConfig(filename=log_file, level=logging.INFO)
-
-        resp_file = requests.get(file_url, stream=True)
-        meta_file_size = float(resp_file.headers.get('content-length'))
+        logger = logging.getLogger(file_name)
+        logger.setLevel(logging.INFO)
+        log_handler = logging.FileHandler(log_file)
+        logger.addHandler(log_handler)
+
+        # Hashes are updated as data is written to the .part file, so they
+        # always cover its current content
+        hashes = self._new_hashes(checksums)
+        if os.path.exists(part_file):
+            self._hash_file(part_file, hashes)
+
+        retries = 0
+        try:
+            while True:
+                try:
+                    self._get_part(file_url, path_file, logger, hashes)
+                    break
+                except (requests.exceptions.ConnectionError,
+                        requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.Timeout) as e:
+                    retries += 1
+                    if retries > self.max_retries:
+                        raise
+                    logger.warning("Download interrupted (%s), resuming..."
+                                   % e)
+            if not self._check_hashes(checksums, hashes):
+                # Discard corrupted data, it cannot be resumed
+                os.remove(part_file)
+                logger.error("Checksum error in file %s." % file_name)
+                raise DumpIntegrityError(path_file)
+            os.rename(part_file, path_file)
+            logger.info("File %s downloaded OK." % file_name)
+        finally:
+            logger.removeHandler(log_handler)
+            log_handler.close()
+
+    def _get_part(self, file_url, path_file, logger, hashes):
+        """
+        Append to path_file + '.part' the remaining content of file_url,
+        starting at the current size of that file, and update hashes
+        with the new data
+        """
+        file_name = os.path.split(path_file)[1]
+        part_file = path_file + '.part'
+        part_len = 0
+        if os.path.exists(part_file):
+            part_len = os.path.getsize(part_file)
+        headers = {'Range': 'bytes=%d-' % part_len} if part_len else {}
+        resp_file = requests.get(file_url, stream=True, headers=headers,
+                                 timeout=self.timeout)
+        if resp_file.status_code == 416:
+            # Nothing left to download, .part file is already complete
+            resp_file.close()
+            return
+        resp_file.raise_for_status()
+        if resp_file.status_code != 206 and part_len:
+            # Server ignored Range header, start again from the beginning
+            part_len = 0
+            for name in hashes:
+                hashes[name] = hashlib.new(name)
+
+        # Chunked responses have no Content-Length, use the size in the
+        # catalog, if known, or else download until the server ends
+        if 'content-length' in resp_file.headers:
+            total_length = (part_len +
+                            int(resp_file.headers['content-length']))
+        else:
+            total_length = self.sizes.get(file_name)
         log_size_msg = "Downloading: {0} - [Size: {1}]"
-        print(log_size_msg.format(file_name, misc.hfile_size(meta_file_size)))
+        if part_len:
+            log_size_msg += " - [Resumed at: {2}]"
+        log_size_msg = log_size_msg.format(
+            file_name,
+            misc.hfile_size(total_length) if total_length else "unknown",
+            misc.hfile_size(part_len))
+        print(log_size_msg)
+        logger.info(log_size_msg)
+
+        completed = int(50 * part_len / total_length) if total_length else 50
+        with open(part_file, 'ab' if part_len else 'wb') as store_file:
+            for data in resp_file.iter_content(chunk_size=65536):
+                part_len += len(data)
+                store_file.write(data)
+                for hash_obj in hashes.values():
+                    hash_obj.update(data)
+                if not total_length:
+                    continue
+                done = int(50 * part_len / total_length)
+                if done > completed:
+                    # If there is progress to notify, log it
+                    completed = done
+                    logger.info("[%s%s] - [%3d %% completed]" % (
+                                '=' * done,
+                                ' ' * (50-done),
+                                round(100 * part_len / total_length, 2))
+                                )
+        if total_length and part_len < total_length:
+            raise requests.exceptions.ChunkedEncodingError(
+                "Connection closed at %s of %s bytes" % (part_len,
+                                                         total_length))
+
+    def _get_checksums(self, dump_entry):
+        """
+        Retrieve checksums of dump files (md5 and sha1, when available)
+        from the catalog entry of the dump
+        """
+        for fname, codes in dump_entry['checksums'].items():
+            self.checksums.setdefault(fname, {}).update(codes)
+            if 'md5' in codes:
+                self.md5_codes[fname] = codes['md5']
 
-        store_file = open(path_file, 'wb')
-        part_len = 0
-        completed = 0
-        total_length = int(meta_file_size)
-        logging.info(log_size_msg.format(file_name,
-                                         misc.hfile_size(meta_file_size)))
-        for data in resp_file.iter_content(chunk_size=65536):
-            part_len += len(data)
-            store_file.write(data)
-            done = int(50 * part_len / total_length)
-            if done > completed:
-                # If there is progress to notify, log it
-                completed = done
-                logging.info("[%s%s] - [%3d %% completed]" % (
-                             '=' * done,
-                             ' ' * (50-done),
-                             round(100 * part_len / total_length, 2))
-                             )
-        logging.info("File %s downloaded OK." % file_name)
-        store_file.close()
-
-    def _verify(self, target_url):
-        """
-        Verify integrity of downloaded dump files against MD5 checksums
-        """
-        html_dumps = requests.get(target_url)
-        soup_dumps = BeautifulSoup(html_dumps.text, "lxml")
-        md5_link = soup_dumps.find('p', class_='checksum').a['href']
-        md5_url = "".join([self.mirror, md5_link])
-        md5_codes = requests.get(md5_url).text
-        md5_codes = md5_codes.split('\n')
-
-        for fileitem in md5_codes:
-            f = fileitem.split()
-            if len(f) > 0:
-                self.md5_codes[f[1]] = f[0]  # dict[fname] = md5code
-
-        for path in self.dump_paths:
-            filename = os.path.split(path)[1]  # Get filename from path
-            with open(path, 'rb') as f:
-                file_md5 = hashlib.md5(f.read()).hexdigest()
-            original_md5 = self.md5_codes[filename]
-            # TODO: Compare md5 hash of retrieved file with original
-            if file_md5 != original_md5:
-                # Raise error if they do not match
-                raise DumpIntegrityError(path)
+    @staticmethod
+    def _new_hashes(checksums):
+        """
+        Create a new hash object for each algorithm in checksums
+        """
+        return dict((name, hashlib.new(name)) for name in checksums)
+
+    @staticmethod
+    def _hash_file(path, hashes):
+        """
+        Update hashes with the content of file in path, read in chunks
+        """
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(1048576), b''):
+                for hash_obj in hashes.values():
+                    hash_obj.update(data)
+
+    @staticmethod
+    def _check_hashes(checksums, hashes):
+        """
+        Verify that computed hashes match expected checksums
+        """
+        return all(hashes[name].hexdigest() == code
+                   for name, code in checksums.items())
 
 
 class RevHistDownloader(Downloader):
@@ -13,22 +13,32 @@ processes with Wikipedia data:
 @author: jfelipe
 """
 
-from retrieval.etl import RevisionHistoryETL, LoggingETL, SQLDumpsETL
-from retrieval.revision import users_file_to_db
-from retrieval.dump import DumpFile
-from .download import (RevHistDownloader, LoggingDownloader,
+from retrieval.etl import (RevisionHistoryETL, RevisionMetaETL, LoggingETL,
+                           SQLDumpsETL)
+from retrieval.revision import users_file_to_db, max_stored_rev
+from retrieval.parquet_sink import users_to_parquet
+from retrieval.dump import DumpFile, ItemFilter, process_templates
+from retrieval import checkpoint
+from .download import (RevHistDownloader, RevMetaDownloader,
+                       LoggingDownloader,
                        UserGroupsDownloader, IWLinksDownloader,
+                       LangLinksDownloader,
                        TemplateLinksDownloader, PageRestrDownloader,
                        CategoryDownloader, CatLinksDownloader,
                        ExtLinksDownloader, PagesLinksDownloader,
                        ImageLinksDownloader)
 from utils.dbutils import MySQLDB
+from elasticsearch import Elasticsearch
 import multiprocessing as mp
+import threading
 import os
 import sys
 import time
 import glob
 
+# Adds-changes dump files, with revisions created since the previous day
+INCR_FILES = '*pages-meta-hist-incr*.xml.bz2'
+
 
 class Task(object):
     """
@@ -95,11 +105,48 @@ class RevHistoryTask(Task):
         db_schema.create_schema_revhist(engine=self.db_engine)
         db_schema.close()
 
+    def insert_namespaces(self):
+        """
+        Insert namespace info in DB, read from the first dump file
+        """
+        dump = DumpFile(self.paths[0])
+        db_schema = MySQLDB(host=self.host, port=self.port, user=self.db_user,
+                            passwd=self.db_passw, db=self.db_name)
+        db_schema.connect()
+        # Namespaces may be already stored by an interrupted run
+        db_schema.send_query("DELETE FROM namespaces")
+        db_schema.insert_namespaces(nsdict=dump.get_namespaces())
+        db_schema.close()
+
+    def download_to_queue(self, paths_queue, resume=False):
+        """
+        Download dump files, putting each one in paths_queue as soon as it
+        is verified, and then a STOP flag for each ETL line. If resume is
+        True, files already processed are not put in paths_queue
+
+        Errors are kept in self.download_error, to be raised by execute
+        once the files already downloaded have been processed
+        """
+        try:
+            self.down.download(self.date, paths_queue=paths_queue,
+                               skip=checkpoint.is_done if resume else None)
+        except Exception as e:
+            self.download_error = e
+        finally:
+            for x in range(self.etl_lines):
+                paths_queue.put('STOP')
+
     # TODO: include args detect_FA, detect_FLIST, detect_GA
     # and implement flow control in process_revision
     def execute(self, page_fan, rev_fan, page_cache_size, rev_cache_size,
                 mirror, download_files, base_ports, control_ports,
-                dumps_dir=None, debug=False):
+                dumps_dir=None, debug=False, expand_templates=False,
+                clean_workers=1, clean_chunksize=64, filter_namespaces=None,
+                filter_redirects=False, filter_min_size=None,
+                filter_max_size=None, filter_titles=None, quality_window=None,
+                quality_fallback=True, resume=False, incremental=False,
+                sink='db', parquet_dir=None, parquet_row_group=100000,
+                load_workers=1, fifo_load=False, index_workers=1):
         """
         Run data retrieval and loading actions.
         Arguments:
@@ -108,6 +155,37 @@ class RevHistoryTask(Task):
             - db_user = User name to connect to local database
             - db_passw = Password for database user
             - mirror = Base URL of site hosting XML dumps
+            - expand_templates = Expand templates when cleaning revision text
+            - clean_workers = Number of processes to clean revision text in
+            each revision worker
+            - clean_chunksize = Number of revisions sent to a cleaning process
+            at a time
+            - filter_namespaces = List of namespaces to be retained
+            - filter_redirects = Discard revisions of redirect pages
+            - filter_min_size, filter_max_size = Discard revisions whose text
+            length is out of range
+            - filter_titles = Regexp to discard pages by title
+            - quality_window = Number of characters at the top and bottom of
+            revision text scanned for FA, FLIST and GA templates
+            - quality_fallback = Scan the rest of the text if any quality
+            template is not found in those windows
+            - resume = Keep data stored by a previous, interrupted run in an
+            existing database. Dump files already processed are skipped, and
+            partially processed files are restarted from their checkpoints
+            - incremental = Only load revisions newer than the latest one
+            already stored in the existing database (and ES index), e.g. to
+            refresh it with a new monthly dump or adds-changes dump files
+            - sink = Store pages, revisions and users in DB ('db') or in
+            Parquet files partitioned by namespace and year ('parquet')
+            - parquet_dir = Folder for Parquet files (default: parquet
+            folder next to dump files)
+            - parquet_row_group = Number of rows in each Parquet row group
+            - load_workers = Number of background threads (and DB
+            connections) loading page data in each ETL line
+            - fifo_load = Stream temp data from memory to DB through named
+            pipes, instead of writing temp files to disk
+            - index_workers = Number of DB connections creating keys of
+            tables in parallel, after all data are loaded
         """
         print("----------------------------------------------------------")
         print(("""Executing ETL:RevHistory on lang: {0} date: {1}"""
@@ -115,6 +193,9 @@ class RevHistoryTask(Task):
         print(("ETL lines = {0} page_fan = {1} rev_fan = {2}"
                .format(self.etl_lines, page_fan, rev_fan)))
         print("Download files =", download_files)
+        print("Resume previous run =", resume)
+        print("Incremental load =", incremental)
+        print("Output sink =", sink)
         print("Start time is {0}".format(time.strftime("%Y-%m-%d %H:%M:%S %Z",
                                                        time.localtime())))
         print("----------------------------------------------------------")
@@ -125,18 +206,28 @@ class RevHistoryTask(Task):
             print("Downloading new dump files from %s, for language %s" % (
                   mirror, self.lang))
             self.down = RevHistDownloader(mirror, self.lang, dumps_dir)
-            # Donwload latest set of dump files
-            self.paths, self.date = self.down.download(self.date)
+            # Find latest set of dump files
+            self.paths, self.date = self.down.list_files(self.date)
             if not self.paths:
                 print("Error: dump files with pages-logging info not found.")
                 print("Program will exit now.")
                 sys.exit()
 
-            print("Retrieved dump files for lang %s, date: %s" % (self.lang,
-                                                                  self.date))
+            # Unless the index of templates must be built from all dump
+            # files, each file is processed as soon as it is downloaded
+            stream_files = not expand_templates
+            if stream_files:
+                print("Dump files for lang %s, date: %s will be processed "
+                      "as soon as they are downloaded" % (self.lang,
+                                                          self.date))
+            else:
+                self.down.download(self.date)
+                print("Retrieved dump files for lang %s, date: %s" % (
+                      self.lang, self.date))
             print()
 
         else:
+            stream_files = False
             print("Looking for revision-history dump file(s) in data dir")
             # Case of dumps folder provided explicity
             if dumps_dir:
@@ -158,6 +249,9 @@ class RevHistoryTask(Task):
                     if not self.paths:
                         self.paths = glob.glob(os.path.join(dumps_path,
                                                             '*pages-meta-history*.xml'))
+                        if not self.paths and incremental:
+                            self.paths = glob.glob(os.path.join(dumps_path,
+                                                                INCR_FILES))
                         if not self.paths:
                             print("Directory %s does not contain any valid dump file." % dumps_path)
                             print("Program will exit now.")
@@ -178,6 +272,9 @@ class RevHistoryTask(Task):
                     if not self.paths:
                         self.paths = glob.glob(os.path.join(dumps_dir,
                                                             '*pages-meta-history*.xml'))
+                        if not self.paths and incremental:
+                            self.paths = glob.glob(os.path.join(dumps_dir,
+                                                                INCR_FILES))
                         if not self.paths:
                             print("Directory %s does not contain any valid dump file." % dumps_dir)
                             print("Program will exit now.")
@@ -193,26 +290,89 @@ class RevHistoryTask(Task):
         # TODO: Empty correspoding tables if DB already exists
         # or let the user select behaviour with config argument
         if self.DB_exists():
-            self.create_DB(complete=False)
+            if resume or incremental:
+                print("Resuming ETL:RevHistory in existing database %s" % (
+                      self.db_name))
+                print()
+            else:
+                self.create_DB(complete=False)
         else:
+            resume = incremental = False
             self.create_DB(complete=True)
 
-        # First insert namespace info in DB
-        dump = DumpFile(self.paths[0])
-        db_schema = MySQLDB(host=self.host, port=self.port, user=self.db_user,
-                            passwd=self.db_passw, db=self.db_name)
-        db_schema.connect()
-        db_schema.insert_namespaces(nsdict=dump.get_namespaces())
-        db_schema.close()
+        if sink == 'parquet' and parquet_dir is None:
+            parquet_dir = os.path.join(os.path.split(self.paths[0])[0],
+                                       'parquet')
+
+        # Watermark of revisions already stored for incremental loads
+        min_rev_id = None
+        if incremental:
+            db_rev = MySQLDB(host=self.host, port=self.port,
+                             user=self.db_user, passwd=self.db_passw,
+                             db=self.db_name)
+            db_rev.connect()
+            min_rev_id, max_timestamp = max_stored_rev(
+                con=db_rev, es_con=Elasticsearch(['localhost']),
+                lang=self.lang)
+            db_rev.close()
+            if min_rev_id is None:
+                print("No revisions stored yet, loading all revisions.")
+            else:
+                print("Loading revisions newer than rev_id %s (%s)." % (
+                      min_rev_id, max_timestamp))
+            print()
+
+        # First insert namespace info in DB, unless dump files are still
+        # to be downloaded
+        if not stream_files:
+            self.insert_namespaces()
+
+        # Index of template definitions, built from namespace 10 in the
+        # same dump files and reused if it already exists
+        templates_file = None
+        if expand_templates:
+            templates_file = os.path.join(os.path.split(self.paths[0])[0],
+                                          'templates.json')
+            if not os.path.isfile(templates_file):
+                print("Building index of templates for lang %s" % self.lang)
+                n_templates = process_templates(
+                    dump_files=[DumpFile(path) for path in self.paths],
+                    templates_file=templates_file)
+                print("%s templates stored in %s" % (n_templates,
+                                                     templates_file))
+                print()
+
+        # Discard unwanted pages and revisions before they are sent to
+        # workers
+        item_filter = None
+        if (filter_namespaces is not None or filter_redirects or
+                filter_min_size is not None or filter_max_size is not None or
+                filter_titles):
+            item_filter = ItemFilter(namespaces=filter_namespaces,
+                                     skip_redirects=filter_redirects,
+                                     min_size=filter_min_size,
+                                     max_size=filter_max_size,
+                                     exclude_titles=filter_titles)
 
         # Complete the queue of paths to be processed and STOP flags for
         # each ETL subprocess
         paths_queue = mp.JoinableQueue()
-        for path in self.paths:
-            paths_queue.put(path)
+        if stream_files:
+            # Downloads overlap with processing of files already retrieved.
+            # STOP flags are sent after the last file is downloaded
+            self.download_error = None
+            download_thread = threading.Thread(target=self.download_to_queue,
+                                               args=(paths_queue, resume))
+            download_thread.start()
+        else:
+            for path in self.paths:
+                if resume and checkpoint.is_done(path):
+                    print("Skipping dump file already processed: %s" % path)
+                    continue
+                paths_queue.put(path)
 
-        for x in range(self.etl_lines):
-            paths_queue.put('STOP')
+            for x in range(self.etl_lines):
+                paths_queue.put('STOP')
 
         for x in range(self.etl_lines):
             new_etl = RevisionHistoryETL(
@@ -224,7 +384,20 @@ class RevHistoryTask(Task):
                 db_name=self.db_name,
                 db_user=self.db_user, db_passw=self.db_passw,
                 base_port=base_ports[x]+(20*x),
-                control_port=control_ports[x]+(20*x)
+                control_port=control_ports[x]+(20*x),
+                templates_file=templates_file,
+                clean_workers=clean_workers,
+                clean_chunksize=clean_chunksize,
+                item_filter=item_filter,
+                quality_window=quality_window,
+                quality_fallback=quality_fallback,
+                resume=resume,
+                min_rev_id=min_rev_id,
+                sink=sink,
+                parquet_dir=parquet_dir,
+                parquet_row_group=parquet_row_group,
+                load_workers=load_workers,
+                fifo=fifo_load
                 )
             self.etl_list.append(new_etl)
 
@@ -241,16 +414,38 @@ class RevHistoryTask(Task):
         for etl in self.etl_list:
             etl.join()
 
+        if stream_files:
+            download_thread.join()
+            if self.download_error is not None:
+                raise self.download_error
+            print("Retrieved dump files for lang %s, date: %s" % (self.lang,
+                                                                  self.date))
+            self.insert_namespaces()
+
         # Insert user info after all ETL lines have finished
         # to ensure that all metadata are stored in Redis cache
         # disregarding of the execution order
+        if sink == 'parquet':
+            users_to_parquet(lang=self.lang, parquet_dir=parquet_dir,
+                             row_group_size=parquet_row_group)
+            print("ETL:RevHistory task finished for language %s and date %s"
+                  % (self.lang, self.date))
+            print("Parquet files written in %s" % parquet_dir)
+            print()
+            return
         data_dir = os.path.join(os.getcwd(), os.path.split(self.paths[0])[0])
         db_users = MySQLDB(host=self.host, port=self.port, user=self.db_user,
                            passwd=self.db_passw, db=self.db_name)
         db_users.connect()
+        if resume:
+            # Users are loaded again from the Redis cache
+            for table in ('user', 'revision_IP', 'revision_user_zero',
+                          'IP_country'):
+                db_users.send_query("DELETE FROM %s" % table)
         users_file_to_db(con=db_users, lang=self.lang,
                          log_file=os.path.join(data_dir, 'logs', 'users.log'),
-                         tmp_dir=os.path.join(data_dir, 'tmp')
+                         tmp_dir=os.path.join(data_dir, 'tmp'),
+                         fifo=fifo_load
                          )
         db_users.close()
         # TODO: logger; ETL step completed, proceeding with data
@@ -258,15 +453,180 @@ class RevHistoryTask(Task):
         print("ETL:RevHistory task finished for language %s and date %s" % (
               self.lang, self.date))
         print()
+        if incremental:
+            # Primary keys were created by the initial load
+            return
         # Create primary keys for all tables
         # TODO: This must also be tracked by main logging module
-        print("Now creating primary key indexes in database tables.")
+        print("Now creating primary keys and indexes in database tables.")
+        print("This may take a while...")
+        print()
+        db_pks = MySQLDB(host=self.host, port=self.port, user=self.db_user,
+                         passwd=self.db_passw, db=self.db_name)
+        db_pks.connect()
+        db_pks.create_pks_revhist(engine=self.db_engine, workers=index_workers)
+        db_pks.close()
+
+
+class RevMetaTask(Task):
+    """
+    A fast loader of page and revision metadata from stub-meta-history dump
+    files, which have no revision text
+    """
+
+    def __init__(self, host, port, db_name, db_user, db_passw, db_engine,
+                 lang='scowiki', date=None, etl_lines=1):
+        """
+        Builder method of class RevMetaTask.
+        Arguments:
+            - language: code of the Wikipedia language to be processed
+            - date: publication date of target dump files collection
+            - etl_lines: number of stub files processed at the same time
+        """
+        super(RevMetaTask, self).__init__(lang=lang, date=date, host=host,
+                                          port=port, db_name=db_name,
+                                          db_user=db_user,
+                                          db_passw=db_passw,
+                                          db_engine=db_engine)
+        self.etl_lines = etl_lines
+        self.etl_list = []
+
+    def create_DB(self, complete=False):
+        if complete:
+            db_create = MySQLDB(host=self.host, port=self.port,
+                                user=self.db_user, passwd=self.db_passw)
+            db_create.connect()
+            db_create.create_database(self.db_name)
+            db_create.close()
+        db_schema = MySQLDB(host=self.host, port=self.port, user=self.db_user,
+                            passwd=self.db_passw, db=self.db_name)
+        db_schema.connect()
+        db_schema.create_schema_revhist(engine=self.db_engine)
+        db_schema.close()
+
+    def execute(self, meta_cache_size, mirror, download_files,
+                dumps_dir=None, debug=False, meta_load_workers=1,
+                fifo_load=False, index_workers=1):
+        """
+        Run data retrieval and loading actions.
+        Arguments:
+            - meta_cache_size = Number of revisions loaded in DB at a time
+            - meta_load_workers = Number of background threads (and DB
+            connections) loading data in each ETL line
+            - fifo_load = Stream temp data from memory to DB through named
+            pipes, instead of writing temp files to disk
+            - index_workers = Number of DB connections creating keys of
+            tables in parallel, after all data are loaded
+            - mirror = Base URL of site hosting XML dumps
+            - download_files = Download stub files from mirror
+            - dumps_dir = Local folder with dump files
+        """
+        print("----------------------------------------------------------")
+        print("Executing ETL:RevMeta on lang: {0} date: {1}"
+              .format(self.lang, self.date))
+        print("ETL lines =", self.etl_lines)
+        print("Download files =", download_files)
+        print("Start time is {0}".format(time.strftime("%Y-%m-%d %H:%M:%S %Z",
+                                                       time.localtime())))
+        print("----------------------------------------------------------")
+        print()
+        if download_files:
+            print("Downloading new stub-meta-history dump files from %s, "
+                  "for language %s" % (mirror, self.lang))
+            self.down = RevMetaDownloader(mirror, self.lang, dumps_dir)
+            self.paths, self.date = self.down.download(self.date)
+            if not self.paths:
+                print("Error: dump files with stub-meta-history info not found.")
+                print("Program will exit now.")
+                sys.exit()
+            print("Got files for lang %s, date: %s" % (self.lang, self.date))
+
+        else:
+            print("Looking for stub-meta-history dump files in data dir")
+            if dumps_dir:
+                # Allow specifying relative paths, as well
+                dumps_path = os.path.join(os.path.expanduser(dumps_dir),
+                                          self.lang + '_dumps', self.date)
+            else:
+                dumps_path = os.path.join("data", self.lang + '_dumps',
+                                          self.date)
+            if not os.path.exists(dumps_path):
+                print("Directory %s containing dump files not found." % dumps_path)
+                print("Program will exit now.")
+                sys.exit()
+            self.paths = glob.glob(os.path.join(dumps_path,
+                                                '*stub-meta-history*.gz'))
+            if not self.paths:
+                self.paths = glob.glob(os.path.join(dumps_path,
+                                                    '*stub-meta-history*.xml'))
+                if not self.paths:
+                    print("Directory %s does not contain any valid dump file." % dumps_path)
+                    print("Program will exit now.")
+                    sys.exit()
+            print("Found stub-meta-history dump file(s) to process.")
+            print()
+        if debug:
+            print("paths: ", str(self.paths))
+            print()
+
+        if self.DB_exists():
+            self.create_DB(complete=False)
+        else:
+            self.create_DB(complete=True)
+
+        db_schema = MySQLDB(host=self.host, port=self.port, user=self.db_user,
+                            passwd=self.db_passw, db=self.db_name)
+        db_schema.connect()
+        db_schema.insert_namespaces(
+            nsdict=DumpFile(self.paths[0]).get_namespaces())
+        db_schema.close()
+
+        paths_queue = mp.JoinableQueue()
+        for path in self.paths:
+            paths_queue.put(path)
+        for x in range(self.etl_lines):
+            paths_queue.put('STOP')
+
+        for x in range(self.etl_lines):
+            new_etl = RevisionMetaETL(
+                name="[ETL:RevMeta-%s]" % x,
+                paths_queue=paths_queue, lang=self.lang,
+                cache_size=meta_cache_size,
+                db_name=self.db_name,
+                db_user=self.db_user, db_passw=self.db_passw,
+                load_workers=meta_load_workers,
+                fifo=fifo_load)
+            self.etl_list.append(new_etl)
+
+        print("ETL:RevMeta task defined OK.")
+        print("Proceeding with ETL workflows. This may take time...")
+        print()
+        for etl in self.etl_list:
+            etl.start()
+        for etl in self.etl_list:
+            etl.join()
+
+        # Insert user info after all ETL lines have finished
+        data_dir = os.path.join(os.getcwd(), os.path.split(self.paths[0])[0])
+        db_users = MySQLDB(host=self.host, port=self.port, user=self.db_user,
+                           passwd=self.db_passw, db=self.db_name)
+        db_users.connect()
+        users_file_to_db(con=db_users, lang=self.lang,
+                         log_file=os.path.join(data_dir, 'logs', 'users.log'),
+                         tmp_dir=os.path.join(data_dir, 'tmp'),
+                         fifo=fifo_load
+                         )
+        db_users.close()
+        print("ETL:RevMeta task finished for language %s and date %s" % (
+              self.lang, self.date))
+        print()
+        print("Now creating primary keys and indexes in database tables.")
         print("This may take a while...")
         print()
-        db_pks = MySQLDB(host='localhost', port=5306, user=self.db_user,
-                         passwd=self.db_passw, db=self.db_name, local_infile=True)
+        db_pks = MySQLDB(host=self.host, port=self.port, user=self.db_user,
+                         passwd=self.db_passw, db=self.db_name)
         db_pks.connect()
-        db_pks.create_pks_revhist()
+        db_pks.create_pks_revhist(engine=self.db_engine, workers=index_workers)
         db_pks.close()
 
 
@@ -299,14 +659,16 @@ class PagesLoggingTask(Task):
             db_create.create_database(self.db_name)
             db_create.close()
         db_schema = MySQLDB(host=self.host, port=self.port, user=self.db_user,
-                            passwd=self.db_passw, db=self.db_name, local_infile=True)
+                            passwd=self.db_passw, db=self.db_name)
         db_schema.connect()
         db_schema.create_schema_logitem(engine=self.db_engine)
         db_schema.close()
 
     def execute(self, log_fan, log_cache_size,
                 mirror, download_files, base_ports, control_ports,
-                dumps_dir=None, debug=False):
+                dumps_dir=None, debug=False, sink='db', parquet_dir=None,
+                parquet_row_group=100000, log_load_workers=1,
+                fifo_load=False, index_workers=1):
         """
         Run data retrieval and loading actions.
         Arguments:
@@ -314,6 +676,17 @@ class PagesLoggingTask(Task):
             - db_user = User name to connect to local database
             - db_passw = Password for database user
             - mirror = Base URL of site hosting XML dumps
+            - sink = Store log items in DB ('db') or in Parquet files
+            partitioned by namespace and year ('parquet')
+            - parquet_dir = Folder for Parquet files (default: parquet
+            folder next to dump files)
+            - parquet_row_group = Number of rows in each Parquet row group
+            - log_load_workers = Number of background threads (and DB
+            connections) loading log data
+            - fifo_load = Stream temp data from memory to DB through named
+            pipes, instead of writing temp files to disk
+            - index_workers = Number of DB connections creating keys of
+            tables in parallel, after all data are loaded
         """
         print("----------------------------------------------------------")
         print("Executing ETL:PagesLogging on lang: {0} date: {1}"
@@ -394,7 +767,11 @@ class PagesLoggingTask(Task):
 
         # Create database if it does not exist
         # empty logging table otherwise
-        if self.DB_exists():
+        if sink == 'parquet':
+            if parquet_dir is None:
+                parquet_dir = os.path.join(os.path.split(self.paths[0])[0],
+                                           'parquet')
+        elif self.DB_exists():
             self.create_DB(complete=False)
         else:
             self.create_DB(complete=True)
@@ -406,7 +783,11 @@ class PagesLoggingTask(Task):
                              db_name=self.db_name,
                              db_user=self.db_user, db_passw=self.db_passw,
                              base_port=base_ports[0]+(30),
-                             control_port=control_ports[0]+(30)
+                             control_port=control_ports[0]+(30),
+                             sink=sink, parquet_dir=parquet_dir,
+                             parquet_row_group=parquet_row_group,
+                             load_workers=log_load_workers,
+                             fifo=fifo_load
                              )
         print("ETL:Logging task for administrative records defined OK.")
         print("Proceeding with ETL workflow. This may take time...")
@@ -420,15 +801,19 @@ class PagesLoggingTask(Task):
         print("ETL:Logging task finished for lang %s and date %s" % (
               self.lang, self.date))
         print()
+        if sink == 'parquet':
+            print("Parquet files written in %s" % parquet_dir)
+            print()
+            return
         # Create primary keys for all tables
         # TODO: This must also be tracked by official logging module
-        print("Now creating primary key indexes in database tables.")
+        print("Now creating primary keys and indexes in database tables.")
         print("This may take a while...")
         print()
-        db_pks = MySQLDB(host='localhost', port=5306, user=self.db_user,
-                         passwd=self.db_passw, db=self.db_name, local_infile=True)
+        db_pks = MySQLDB(host=self.host, port=self.port, user=self.db_user,
+                         passwd=self.db_passw, db=self.db_name)
         db_pks.connect()
-        db_pks.create_pks_logitem()
+        db_pks.create_pks_logitem(engine=self.db_engine, workers=index_workers)
         db_pks.close()
 
 
@@ -437,34 +822,43 @@ class SQLDumpsTask(Task):
     Class docstring
     """
     def __init__(self, host, port, db_name, db_user, db_passw, db_engine,
-                 lang='scowiki', date=None):
+                 lang='scowiki', date=None, etl_lines=1):
         """
         Builder method of class SQLDumpsTask.
         Arguments:
             - language: code of the Wikipedia language to be processed
             - date: publication date of target dump files collection
+            - etl_lines: number of SQL dump files loaded at the same time
         """
         super(SQLDumpsTask, self).__init__(lang=lang, date=date, host=host,
                                            port=port, db_name=db_name,
                                            db_user=db_user,
                                            db_passw=db_passw,
                                            db_engine=db_engine)
+        self.etl_lines = etl_lines
+        self.etl_list = []
 
     def createDB(self):
         """
         Creates new DB to load SQL dump files if required
         """
         db_create = MySQLDB(host=self.host, port=self.port,
-                            user=self.db_user, passwd=self.db_passw, local_infile=True)
+                            user=self.db_user, passwd=self.db_passw)
         db_create.connect()
         db_create.create_database(self.db_name)
         db_create.close()
 
-    def execute(self, mirror, download_files, dumps_dir=None, debug=False):
+    def execute(self, mirror, download_files, dumps_dir=None, debug=False,
+                chunk_rows=1000000, load_workers=2, fifo_load=False):
         """
         Run data retrieval and loading actions.
         Arguments:
             - mirror = Base URL of site hosting XML dumps
+            - chunk_rows = Number of rows in each TSV file loaded in DB
+            - load_workers = Number of chunks loaded at the same time in
+            each ETL line
+            - fifo_load = Stream temp data from memory to DB through named
+            pipes, instead of writing temp files to disk
         """
         print("----------------------------------------------------------")
         print("Executing ETL:SQLDumps on lang: {0} date: {1}"
@@ -485,6 +879,7 @@ class SQLDumpsTask(Task):
                          PageRestrDownloader(mirror, self.lang, dumps_dir),
                          CategoryDownloader(mirror, self.lang, dumps_dir),
                          CatLinksDownloader(mirror, self.lang, dumps_dir),
+                         LangLinksDownloader(mirror, self.lang, dumps_dir),
                          ExtLinksDownloader(mirror, self.lang, dumps_dir),
                          PagesLinksDownloader(mirror, self.lang, dumps_dir),
                          ImageLinksDownloader(mirror, self.lang, dumps_dir)
@@ -564,18 +959,31 @@ class SQLDumpsTask(Task):
         # Primary keys and indexes are also defined by default
         # TODO: Explore possible options to load data into PostgreSQL
         # and other different DB backends
-        new_etl = SQLDumpsETL(name="[ETL:SQLDumps-0]",
-                              path=self.paths, lang=self.lang,
-                              db_name=self.db_name,
-                              db_user=self.db_user, db_passw=self.db_passw,
-                              )
+        # Largest files first, so that they do not delay the end of the task
+        paths_queue = mp.JoinableQueue()
+        for path in sorted(self.paths, key=os.path.getsize, reverse=True):
+            paths_queue.put(path)
+        for x in range(self.etl_lines):
+            paths_queue.put('STOP')
+
+        for x in range(self.etl_lines):
+            new_etl = SQLDumpsETL(name="[ETL:SQLDumps-%s]" % x,
+                                  paths_queue=paths_queue, lang=self.lang,
+                                  db_name=self.db_name,
+                                  db_user=self.db_user, db_passw=self.db_passw,
+                                  chunk_rows=chunk_rows,
+                                  load_workers=load_workers,
+                                  fifo=fifo_load)
+            self.etl_list.append(new_etl)
         print("ETL:SQLDumps task defined OK.")
         print("Proceeding with ETL workflow. This may take time...")
         print()
         # Extract, process and load information in local DB
-        new_etl.start()
-        # Wait for ETL line to finish
-        new_etl.join()
+        for etl in self.etl_list:
+            etl.start()
+        # Wait for ETL lines to finish
+        for etl in self.etl_list:
+            etl.join()
         # TODO: logger; ETL step completed, proceeding with data
         # analysis and visualization
         print("ETL:SQLDumps task finished for lang %s and date %s" % (
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for download manager of dump files, against a local HTTP server
+
+Run from the wikidat folder:
+    python -m unittest tests.test_download
+"""
+import hashlib
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import requests
+from tasks.download import (Downloader, DumpCatalog, DumpDownloadError,
+                            DumpIntegrityError)
+
+LANGUAGE = 'testwiki'
+DUMP_DATE = '20140101/'
+
+
+class DumpHandler(BaseHTTPRequestHandler):
+    """
+    Serve content of server.files, by URL path, with support for HTTP
+    Range requests. Range headers received are stored in server.ranges,
+    and paths of HEAD requests in server.heads. Files whose path is in
+    server.no_length are sent without Content-Length, until the
+    connection is closed
+    """
+
+    def do_HEAD(self):
+        self.server.heads.append(self.path)
+        data = self.server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+
+    def do_GET(self):
+        data = self.server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header:
+            self.server.ranges.append(range_header)
+            start = int(range_header.split('=')[1].rstrip('-'))
+            if start >= len(data):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (
+                             start, len(data) - 1, len(data)))
+        else:
+            self.send_response(200)
+        if self.path not in self.server.no_length:
+            self.send_header('Content-Length', str(len(data) - start))
+        self.end_headers()
+        self.wfile.write(data[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.server = HTTPServer(('127.0.0.1', 0), DumpHandler)
+        self.server.files = {}
+        self.server.ranges = []
+        self.server.heads = []
+        self.server.no_length = set()
+        self.server_thread = threading.Thread(
+            target=self.server.serve_forever)
+        self.server_thread.start()
+        self.mirror = 'http://127.0.0.1:%d/' % self.server.server_port
+        self.checksums = {}
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_thread.join()
+        DumpCatalog._catalogs.pop(self.mirror, None)
+        shutil.rmtree(self.tmp_dir)
+
+    def add_file(self, file_name, data, md5=None, served=True):
+        """
+        Publish dump file in the mirror, with its md5 checksum
+        """
+        url = '%s/%s%s' % (LANGUAGE, DUMP_DATE, file_name)
+        if served:
+            self.server.files['/' + url] = data
+        self.checksums[file_name] = {
+            'md5': md5 or hashlib.md5(data).hexdigest()}
+        return url
+
+    def downloader(self, urls, offline=True):
+        """
+        Return Downloader for dump files in urls, with a catalog already
+        in its cache (no mirror index pages needed)
+        """
+        catalog = DumpCatalog.for_mirror(
+            self.mirror, offline=offline,
+            cache_dir=os.path.join(self.tmp_dir, 'catalog'))
+        lang_dir = os.path.join(catalog.cache_dir, LANGUAGE)
+        if not os.path.exists(lang_dir):
+            os.makedirs(lang_dir)
+            with open(os.path.join(lang_dir, 'dates.json'), 'w') as f:
+                json.dump({'urldates': [DUMP_DATE, 'latest/'],
+                           'dates': ['01-Jan-2014 00:00', ''],
+                           'fetched': time.time()}, f)
+            with open(os.path.join(lang_dir, DUMP_DATE.strip('/') + '.json'),
+                      'w') as f:
+                json.dump({'status': 'Dump complete', 'complete': True,
+                           'files': urls, 'checksums': self.checksums,
+                           'fetched': time.time()}, f)
+
+        down = Downloader(mirror=self.mirror, language=LANGUAGE)
+        down.dump_basedir = os.path.join(self.tmp_dir, 'dumps')
+        down.list_files(DUMP_DATE)
+        return down
+
+    def test_resume_from_part_file(self):
+        data = os.urandom(300000)
+        down = self.downloader([self.add_file('dump1.xml.gz', data)])
+        path = down.dump_paths[0]
+        with open(path + '.part', 'wb') as f:
+            f.write(data[:100000])
+
+        paths, dump_date = down.download()
+        self.assertEqual(paths, [path])
+        self.assertEqual(self.server.ranges, ['bytes=100000-'])
+        self.assertFalse(os.path.exists(path + '.part'))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_no_content_length(self):
+        data = os.urandom(300000)
+        url = self.add_file('dump1.xml.gz', data)
+        self.server.no_length.add('/' + url)
+        down = self.downloader([url])
+        path = down.dump_paths[0]
+        with open(path + '.part', 'wb') as f:
+            f.write(data[:100000])
+
+        down.download()
+        self.assertEqual(self.server.ranges, ['bytes=100000-'])
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_checksum_mismatch(self):
+        data = os.urandom(1000)
+        down = self.downloader([self.add_file('dump1.xml.gz', data,
+                                              md5='0' * 32)])
+        path = down.dump_paths[0]
+
+        with self.assertRaises(DumpDownloadError) as cm:
+            down.download()
+        self.assertIsInstance(cm.exception.errors[path], DumpIntegrityError)
+        # Corrupted data is discarded
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(path + '.part'))
+
+    def test_http_error(self):
+        data = os.urandom(1000)
+        down = self.downloader([self.add_file('dump1.xml.gz', data),
+                                self.add_file('dump2.xml.gz', data,
+                                              served=False)])
+        good_path, missing_path = down.dump_paths
+        paths_queue = queue.Queue()
+
+        with self.assertRaises(DumpDownloadError) as cm:
+            down.download(paths_queue=paths_queue)
+        self.assertEqual(list(cm.exception.errors), [missing_path])
+        self.assertIsInstance(cm.exception.errors[missing_path],
+                              requests.exceptions.HTTPError)
+        # Other files are still downloaded and queued for processing
+        self.assertEqual(paths_queue.get_nowait(), good_path)
+        self.assertTrue(paths_queue.empty())
+        with open(good_path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_skip_processed_files(self):
+        data = os.urandom(1000)
+        down = self.downloader([self.add_file('dump1.xml.gz', data),
+                                self.add_file('dump2.xml.gz', data)])
+        done_path, new_path = down.dump_paths
+        paths_queue = queue.Queue()
+
+        down.download(paths_queue=paths_queue,
+                      skip=lambda path: path == done_path)
+        self.assertEqual(paths_queue.get_nowait(), new_path)
+        self.assertTrue(paths_queue.empty())
+
+    def test_file_sizes_cached(self):
+        urls = [self.add_file('dump1.xml.gz', os.urandom(1000)),
+                self.add_file('dump2.xml.gz', os.urandom(2000))]
+        down = self.downloader(urls, offline=False)
+        self.assertEqual(down.file_sizes(), [1000, 2000])
+        self.assertEqual(len(self.server.heads), 2)
+
+        # Sizes retrieved from the mirror are read offline in a new run
+        down = self.downloader(urls, offline=True)
+        self.assertEqual(down.file_sizes(), [1000, 2000])
+        self.assertEqual(len(self.server.heads), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the resolution of IP addresses to country codes
+
+Run from the wikidat folder:
+    python -m unittest tests.test_ipresolver
+"""
+import glob
+import ipaddress
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from utils import ipresolver
+
+# Small db-ip file, not sorted, with IPv4 and IPv6 ranges
+DBIP = """"145.100.0.0","145.100.255.255","NL"
+"74.125.0.0","74.125.255.255","US"
+"144.173.0.0","144.173.255.255","GB"
+"2001:610::","2001:610:ffff:ffff:ffff:ffff:ffff:ffff","NL"
+"2a00:1450::","2a00:1450:ffff:ffff:ffff:ffff:ffff:ffff","IE"
+"""
+
+
+class IPResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dbip = os.path.join(self.tmp, 'dbip-country.csv')
+        with open(self.dbip, 'w') as fout:
+            fout.write(DBIP)
+        # Absolute path, kept as is when joined to the folder of the module
+        self.dbip_file = ipresolver.__DBIP_FILE__
+        ipresolver.__DBIP_FILE__ = self.dbip
+        ipresolver.__INDEX__ = None
+
+    def tearDown(self):
+        ipresolver.__DBIP_FILE__ = self.dbip_file
+        ipresolver.__INDEX__ = None
+        shutil.rmtree(self.tmp)
+
+    def test_country_code(self):
+        self.assertEqual(ipresolver.getCountryCode('145.100.61.14'), 'NL')
+        self.assertEqual(ipresolver.getCountryCode('144.173.6.146'), 'GB')
+        self.assertEqual(ipresolver.getCountryCode('74.125.136.106'), 'US')
+        self.assertEqual(ipresolver.getCountryCode('::ffff:145.100.61.14'),
+                         'NL')
+        self.assertEqual(ipresolver.getCountryCode('2a00:1450::200e'), 'IE')
+        self.assertIsNone(ipresolver.getCountryCode('148.243.168.33'))
+        self.assertIsNone(ipresolver.getCountryCode('not an IP'))
+
+    def test_lookup_many_v4(self):
+        ips = [int(ipaddress.ip_address(ip)) for ip in
+               ('145.100.61.14', '144.173.6.146', '74.125.136.106',
+                '148.243.168.33')]
+        self.assertEqual(list(ipresolver.lookup_many(ips, default='?')),
+                         ['NL', 'GB', 'US', '?'])
+        self.assertEqual(list(ipresolver.lookup_many([-1, 2 ** 32],
+                                                     default='?')),
+                         ['?', '?'])
+
+    def test_lookup_many_v6(self):
+        ips = [int(ipaddress.ip_address(ip)) for ip in
+               ('2001:610:188::1', '2a00:1450::200e', '2001:db8::1',
+                '::ffff:74.125.136.106')]
+        self.assertEqual(list(ipresolver.lookup_many(ips, default='?',
+                                                     version=6)),
+                         ['NL', 'IE', '?', 'US'])
+        self.assertEqual(list(ipresolver.lookup_many([-1, 2 ** 128],
+                                                     default='?',
+                                                     version=6)),
+                         ['?', '?'])
+
+    def test_cache_files(self):
+        ipresolver.getCountryCode('145.100.61.14')
+        caches = glob.glob(os.path.join(self.tmp, 'dbip-country.*.npy'))
+        self.assertEqual(len(caches), len(ipresolver.ARRAYS))
+        # New CSV file: its cache files replace those of the previous one
+        with open(self.dbip, 'w') as fout:
+            fout.write(DBIP.replace('"GB"', '"FR"'))
+            fout.write('"1.0.0.0","1.0.0.255","AU"\n')
+        ipresolver.__INDEX__ = None
+        self.assertEqual(ipresolver.getCountryCode('144.173.6.146'), 'FR')
+        new_caches = glob.glob(os.path.join(self.tmp, 'dbip-country.*.npy'))
+        self.assertEqual(len(new_caches), len(ipresolver.ARRAYS))
+        self.assertFalse(set(caches) & set(new_caches))
+        # Index is memory-mapped from the cache files
+        ipresolver.__INDEX__ = None
+        self.assertEqual(ipresolver.getCountryCode('1.0.0.1'), 'AU')
+        self.assertIsInstance(ipresolver.__INDEX__.lower, np.memmap)
+
+
+if __name__ == '__main__':
+    unittest.main()
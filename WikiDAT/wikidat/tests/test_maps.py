@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for detection of quality templates (FA, FLIST and GA)
+
+Run from the wikidat folder:
+    python -m unittest tests.test_maps
+"""
+import unittest
+
+from utils.maps import (FA_RE, FLIST_RE, GA_RE, QUALITY_RE, QUALITY_TYPES,
+                        find_quality)
+
+SAMPLES = ['', 'No templates here', '{{{{{', '{{Featured article}}',
+           '{{Featured list}} {{Good article}}', '{{Exzellent|a|1}}',
+           '{{Exzellent|x}} {{Lesenswert|a|1}}', '{{Informativ}}',
+           u'{{Artículo bueno}} {{Artículo destacado}}',
+           '{{Article de qualité|x}} {{Bon article|y}}',
+           u'{{Vetrina|x}}\n{{Voce di qualità|y}}',
+           u'{{Dobry artykuł}} {{Medal}}', u'{{نوشتار برگزیده}}',
+           u'{{مقاله برگزیده}}', '{{1000+AdQ|x}}',
+           '{{Article de Qualitat}}', u'{{Хорошая статья|x}}',
+           '{{God}} {{Fremragende}}', u'{{Gæðagrein}}']
+
+
+def lines(*parts):
+    """
+    Text with each part in its own line
+    """
+    return '\n'.join(parts)
+
+
+class FindQualityTest(unittest.TestCase):
+
+    def test_same_as_separate_patterns(self):
+        for lang, pat in QUALITY_RE.items():
+            for text in SAMPLES:
+                expected = set(name for name, table in
+                               zip(QUALITY_TYPES, (FA_RE, FLIST_RE, GA_RE))
+                               if table[lang] is not None and
+                               table[lang].search(text) is not None)
+                self.assertEqual(find_quality(pat, text), expected,
+                                 (lang, text))
+
+    def test_window_fallback(self):
+        filler = ['Lorem ipsum'] * 100
+        text = lines(*(filler + ['{{Featured article}}'] + filler))
+        pat = QUALITY_RE['enwiki']
+        self.assertEqual(find_quality(pat, text, window=100), {'fa'})
+        self.assertEqual(find_quality(pat, text, window=100,
+                                      fallback=False), set())
+        self.assertEqual(find_quality(pat, text + text, window=100), {'fa'})
+
+    def test_window_fallback_some_found(self):
+        # FA in the head and FLIST in the tail windows, GA only in the body
+        filler = ['Lorem ipsum'] * 100
+        text = lines(*(['{{Featured article}}'] + filler +
+                       ['{{Good article}}'] + filler + ['{{Featured list}}']))
+        pat = QUALITY_RE['enwiki']
+        self.assertEqual(find_quality(pat, text, window=100),
+                         find_quality(pat, text))
+        self.assertEqual(find_quality(pat, text, window=100),
+                         {'fa', 'flist', 'ga'})
+        self.assertEqual(find_quality(pat, text, window=100,
+                                      fallback=False), {'fa', 'flist'})
+
+
+if __name__ == '__main__':
+    unittest.main()
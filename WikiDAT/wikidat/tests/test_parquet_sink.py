@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for Parquet output of ETL workflows
+
+Run from the wikidat folder:
+    python -m unittest tests.test_parquet_sink
+"""
+import ipaddress
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+from retrieval.parquet_sink import PartitionedWriter, revision_ip_row
+
+
+@unittest.skipIf(pq is None, 'requires pyarrow')
+class RevisionIPTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_ipv4_and_ipv6_rows(self):
+        # IP addresses are cached in Redis as integer strings
+        ipv4 = int(ipaddress.ip_address('145.100.61.14'))
+        ipv6 = int(ipaddress.ip_address('2001:db8::1'))
+        writer = PartitionedWriter(self.tmp_dir, 'revision_IP', 'testwiki')
+        writer.append((), revision_ip_row('1', str(ipv4)))
+        writer.append((), revision_ip_row('2', str(ipv6)))
+        writer.close()
+
+        table = pq.read_table(os.path.join(self.tmp_dir, 'revision_IP',
+                                           'testwiki.parquet'))
+        self.assertEqual(table.to_pydict(),
+                         {'rev_id': [1, 2], 'ip': [ipv4, None],
+                          'ipv6': [None, '2001:db8::1']})
+
+
+if __name__ == '__main__':
+    unittest.main()
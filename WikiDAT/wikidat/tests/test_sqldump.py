@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the streaming parser of SQL dump files
+
+Run from the wikidat folder:
+    python -m unittest tests.test_sqldump
+"""
+import io
+import unittest
+
+from retrieval.sqldump import parse_sql_dump
+
+DUMP = b"""-- MySQL dump
+/*!40101 SET NAMES utf8mb4 */;
+DROP TABLE IF EXISTS `pagelinks`;
+CREATE TABLE `pagelinks` (
+  `pl_from` int(8) unsigned NOT NULL DEFAULT 0,
+  `pl_title` varbinary(255) NOT NULL DEFAULT '',
+  PRIMARY KEY (`pl_from`,`pl_title`)
+) ENGINE=InnoDB DEFAULT CHARSET=binary;
+INSERT INTO `pagelinks` VALUES (1,'A(b)'),(2,'It\\'s, \\"x\\"'),(3,''),(4,NULL),(5,'t\tab');
+INSERT INTO `pagelinks` VALUES (6,'\\\\');
+"""
+
+
+class ParseSQLDumpTest(unittest.TestCase):
+
+    def setUp(self):
+        self.items = list(parse_sql_dump(io.BytesIO(DUMP)))
+
+    def test_create_table(self):
+        self.assertEqual(self.items[0][:2], ('create', 'pagelinks'))
+        self.assertTrue(self.items[0][2].endswith('DEFAULT CHARSET=binary'))
+
+    def test_rows(self):
+        # Quoted values keep their escapes, NULL and literal tabs are
+        # escaped for LOAD DATA
+        self.assertEqual(self.items[1],
+                         ('rows', 'pagelinks',
+                          b"1\tA(b)\n2\tIt\\'s, \\\"x\\\"\n3\t\n"
+                          b"4\t\\N\n5\tt\\tab\n"))
+        self.assertEqual(self.items[2], ('rows', 'pagelinks', b"6\t\\\\\n"))
+        self.assertEqual(len(self.items), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for encoding of rows in TSV temp data files
+
+Run from the wikidat folder:
+    python -m unittest tests.test_tsv
+"""
+import io
+import unittest
+
+from retrieval.tsv import ENCODERS, TSVWriter, decode_line
+
+ROWS = {
+    'page': [(1, 0, 'Main_Page', ''), (2, 4, 'A\tB\\C\nD', None),
+             ('3', '1', '\\N', 'edit=sysop')],
+    'logging': [(7, 'block', 'block', '2010-01-01 00:00:00', 3, 'Bob',
+                 '2', 'User:"Quoted"', 'x\\ty', '', 0, 1)],
+    'block': [(7, 'block', 3, '2010-01-01 00:00:00', 'Eve', '', 86400.0)],
+    'user_new': [(8, 4, 'Alice', '2010-01-01 00:00:00', 'create')],
+    'user_level': [(9, 3, 'Alice', '2010-01-01 00:00:00', '', 'sysop')],
+    'revision': [(5, 1, 0, '2010-01-01 00:00:00', 10, None, 0, 1, 0, 0, 0,
+                  'NULL')],
+    'revision_IP': [('5', '16843009')],
+}
+
+
+class TSVWriterTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        # NULLs, tabs, newlines and backslashes are read back by LOAD DATA
+        # as they were written
+        for table, rows in ROWS.items():
+            data = io.StringIO()
+            writer = TSVWriter(data, table)
+            for row in rows:
+                writer.writerow(row)
+            lines = data.getvalue().split('\n')
+            self.assertEqual(lines.pop(), '')
+            self.assertEqual(len(lines), len(rows))
+            for line, row in zip(lines, rows):
+                self.assertEqual(decode_line(line),
+                                 [v if v is None else str(v) for v in row],
+                                 (table, line))
+
+    def test_escapes(self):
+        self.assertEqual(ENCODERS['page']((2, 4, 'A\tB\\C\nD', None)),
+                         '2\t4\tA\\tB\\\\C\\nD\t\\N\n')
+        self.assertEqual(ENCODERS['revision_hash']((1, 2, 3, '\\N')),
+                         '1\t2\t3\t\\\\N\n')
+        self.assertEqual(decode_line('1\t2\t3\t\\\\N\n'),
+                         ['1', '2', '3', '\\N'])
+
+
+if __name__ == '__main__':
+    unittest.main()
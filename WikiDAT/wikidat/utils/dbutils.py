@@ -4,10 +4,70 @@ Created on Sat Mar 29 22:27:02 2014
 
 @author: jfelipe
 """
+import os
+import io
+import time
+import errno
+import logging
 import pymysql
 import warnings
+import threading
+import queue
+import collections
 import retrieval.db.base_schema as bs
 
+# Size of write buffers of temp data files
+FILE_BUFFER = 1 << 20
+
+# Error codes of transient failures after which statements were not applied,
+# so they can be sent again on a new connection: lock wait timeout and
+# deadlock (rolled back), too many connections and can't connect
+RETRY_ERRORS = (1205, 1213, 1040, 2003)
+
+# Error codes of lost connections: server gone away and lost connection
+# (0 = connection already closed). Statements might have been applied, so
+# only idempotent ones are sent again
+LOST_CONNECTION_ERRORS = (2006, 2013, 0)
+
+TRANSIENT_ERRORS = RETRY_ERRORS + LOST_CONNECTION_ERRORS
+
+# Statements with the same result if they are applied twice
+IDEMPOTENT_STATEMENTS = ('SELECT', 'SHOW', 'SET', 'DELETE', 'DROP')
+
+
+def is_transient(error):
+    """
+    Whether DB error (exception) is worth retrying with a new connection
+    """
+    return (isinstance(error, (pymysql.OperationalError,
+                               pymysql.InterfaceError)) and
+            bool(error.args) and error.args[0] in TRANSIENT_ERRORS)
+
+
+def can_retry(error, statement=None):
+    """
+    Whether statement (SQL, or None for connections) can be sent again after
+    DB error (exception): transient errors that guarantee it was not applied,
+    or lost connections while sending idempotent statements. LOAD DATA and
+    INSERT statements are never sent again after lost connections, since
+    tables without keys would get duplicated rows
+    """
+    if not is_transient(error):
+        return False
+    if error.args[0] in RETRY_ERRORS or statement is None:
+        return True
+    return statement.split(None, 1)[0].upper() in IDEMPOTENT_STATEMENTS
+
+
+def load_profile(engine):
+    """
+    Return load profile of DB engine (see base_schema.load_profiles).
+    Unknown engines create keys after data loads, without special settings
+    """
+    return bs.load_profiles.get(str(engine).lower(),
+                                {'engine': engine, 'keys': True,
+                                 'index_session': []})
+
 
 class MySQLDB(object):
     """
@@ -17,33 +77,111 @@ class MySQLDB(object):
     """
 
     def __init__(self, db=None, host='localhost', port=5306,
-                 user=None, passwd=None):
+                 user=None, passwd=None, retries=5, backoff=1.0):
         """
         Intilialize new MySQL DB connection object
+        Transient errors (see can_retry) are retried up to retries times,
+        reconnecting after backoff, 2*backoff, 4*backoff... seconds
         """
         self.db = db
         self.host = host
         self.port = port
         self.user = user
         self.passwd = passwd
+        self.retries = retries
+        self.backoff = backoff
         self.con = None  # Connection to DB
         self.cursor = None  # Cursor to DB
+        # Statement type --> [number of statements, total seconds]
+        self.timings = collections.defaultdict(lambda: [0, 0.0])
 
     def connect(self):
         """
         Establish a new connection to MySQL DB and initialize new cursor
+        Every statement is committed on its own (autocommit), so that
+        statements retried on a new connection never lose previous ones
         """
-        if self.db is None:
-            self.con = pymysql.Connect(host=self.host, port=self.port,
-                                       user=self.user, passwd=self.passwd,
-                                       charset="utf8", use_unicode=True, local_infile=True)
-        else:
-            # print "Connected to database: " + self.db
-            self.con = pymysql.Connect(host=self.host, port=self.port,
-                                       user=self.user, passwd=self.passwd,
-                                       db=self.db, charset="utf8",
-                                       use_unicode=True, local_infile=True)
+        self.retry(self._connect, retry_connect=False)
+
+    def _connect(self):
+        self.con = pymysql.Connect(host=self.host, port=self.port,
+                                   user=self.user, passwd=self.passwd,
+                                   db=self.db, charset="utf8",
+                                   use_unicode=True, local_infile=True,
+                                   autocommit=True)
         self.cursor = self.con.cursor()
+        # Multi-row INSERT statements built by insert_many must fit in
+        # max_allowed_packet
+        self.cursor.execute("SELECT @@max_allowed_packet")
+        max_packet = self.cursor.fetchone()[0]
+        self.cursor.max_stmt_length = max(max_packet - 1024, 1024)
+
+    def reconnect(self):
+        """
+        Open a new connection, discarding the current one
+        """
+        if self.con is not None:
+            try:
+                self.con.close()
+            except Exception:
+                pass
+        self.con = None
+        self.cursor = None
+        self._connect()
+
+    def is_alive(self):
+        """
+        Health check: whether connection is open and server responds
+        """
+        if self.con is None:
+            return False
+        try:
+            self.con.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def retry(self, action, statement=None, retry_connect=True):
+        """
+        Call action() and return its result. If it fails with a transient
+        error after which statement (SQL sent by action) can be sent again
+        (see can_retry), reconnect and try again, up to self.retries times
+        with exponential backoff. Otherwise, or if all attempts fail, the
+        error is raised.
+
+        If statement is given, the time taken by action is logged and added
+        to self.timings for its statement type.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                if attempt and retry_connect:
+                    self.reconnect()
+                start = time.time()
+                result = action()
+            except Exception as e:
+                if not can_retry(e, statement) or attempt == self.retries:
+                    raise
+                wait = self.backoff * 2 ** attempt
+                logging.warning("Transient DB error %s, retrying in %.1f "
+                                "sec. (%d/%d)" % (e, wait, attempt + 1,
+                                                  self.retries))
+                time.sleep(wait)
+                continue
+            if statement is not None:
+                elapsed = time.time() - start
+                kind = ' '.join(statement.split()[:2]).upper()
+                self.timings[kind][0] += 1
+                self.timings[kind][1] += elapsed
+                logging.debug("%.3f sec.: %s" % (elapsed, statement[:100]))
+            return result
+
+    def timing_report(self):
+        """
+        Return lines with number and total time of statements of each type
+        run in this connection
+        """
+        return ["%s: %d statements in %.2f sec." % (kind, count, seconds)
+                for kind, (count, seconds) in sorted(self.timings.items())]
 
     def close(self):
         """
@@ -66,6 +204,13 @@ class MySQLDB(object):
         params = {'dbname': db}
         return self.execute_query(bs.check_database.format(**params))
 
+    def table_exists(self, table):
+        """
+        Check if table exists in DB or not
+        """
+        params = {'table': table}
+        return self.execute_query(bs.check_table.format(**params)) is not None
+
     def create_database(self, db):
         """
         Create schema in local database
@@ -79,9 +224,9 @@ class MySQLDB(object):
     def create_schema_revhist(self, engine='ARIA'):
         """
         Create schema in local database for tables related to rev-history dumps
+        Tables have no keys until create_pks_revhist is called
         """
-        # TODO: Parameterize engine with common configuration file
-        params = {'engine': engine}
+        params = {'engine': load_profile(engine)['engine']}
         self.send_query(bs.drop_page)
         self.send_query(bs.create_page.format(**params))
         self.send_query(bs.drop_revision)
@@ -102,9 +247,9 @@ class MySQLDB(object):
     def create_schema_logitem(self, engine='ARIA'):
         """
         Create schema in local database for tables related with logging dump
+        Tables have no keys until create_pks_logitem is called
         """
-        # TODO: Parameterize engine with common configuration file
-        params = {'engine': engine}
+        params = {'engine': load_profile(engine)['engine']}
         self.send_query(bs.drop_logging)
         self.send_query(bs.create_logging.format(**params))
         self.send_query(bs.drop_block)
@@ -114,78 +259,145 @@ class MySQLDB(object):
         self.send_query(bs.drop_user_level)
         self.send_query(bs.create_user_level.format(**params))
 
-    def create_pks_revhist(self):
+    def create_pks_revhist(self, engine='ARIA', workers=1):
         """
-        Create primary keys for baselines database tables in revision
-        history dumps
+        Create primary and secondary keys for baselines database tables in
+        revision history dumps
         """
-        print("Creating primary key for table page...")
-        self.send_query(bs.pk_page)
-        print("Creating primary key for table revision...")
-        self.send_query(bs.pk_revision)
-        print("Creating primary key for table namespaces...")
-        self.send_query(bs.pk_namespaces)
-        print("Creating primary key for table user and others...")
-        print()
-        self.send_query(bs.pk_user)
-        self.send_query(bs.pk_revision_IP)
-        self.send_query(bs.pk_IP_country)
+        self.create_keys(bs.tables_revhist, engine=engine, workers=workers)
 
-    def create_pks_logitem(self):
+    def create_pks_logitem(self, engine='ARIA', workers=1):
         """
         Create primary keys for baselines database tables in logging dump
         """
-        print("Creating primary key for table logging and block...")
+        self.create_keys(bs.tables_logitem, engine=engine, workers=workers)
+
+    def create_keys(self, tables, engine='ARIA', workers=1):
+        """
+        Create primary and secondary keys of tables (see base_schema.keys)
+        once data are loaded. Keys are built in up to workers parallel
+        connections to the same DB, one table at a time in each connection
+        """
+        profile = load_profile(engine)
+        if not profile['keys']:
+            print("Engine %s does not use keys, skipping them." % (
+                  profile['engine']))
+            return
+        pending = queue.Queue()
+        for table in tables:
+            pending.put(table)
+
+        pool = get_pool(self)
+        errors = []  # Keys of other tables are created anyway
+
+        def build_keys():
+            db_keys = pool.get()
+            db_keys.set_session(profile['index_session'])
+            while True:
+                try:
+                    table = pending.get_nowait()
+                except queue.Empty:
+                    break
+                print("Creating keys for table %s..." % table)
+                try:
+                    db_keys.send_query(bs.add_keys.format(
+                        table=table, keys=', ADD '.join(bs.keys[table])))
+                except Exception as e:
+                    logging.error("Error creating keys for table %s: %s" % (
+                                  table, e))
+                    errors.append(e)
+                    if is_transient(e):
+                        db_keys.reconnect()
+                        db_keys.set_session(profile['index_session'])
+            pool.put(db_keys)
+
+        threads = [threading.Thread(target=build_keys)
+                   for x in range(max(1, min(workers, len(tables))))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
         print()
-        self.send_query(bs.pk_logging)
-        # PKs for additional tables used in data processing
-        self.send_query(bs.pk_block)
-        self.send_query(bs.pk_user_new)
-        self.send_query(bs.pk_user_level)
+        if errors:
+            raise errors[0]
+
+    def set_session(self, statements, optional=False):
+        """
+        Apply session settings (list of SET statements) to this connection
+        optional: if True, settings that cannot be applied (e.g. for lack of
+        privileges) are skipped with a warning in the log
+        """
+        for statement in statements:
+            try:
+                self.send_query(statement)
+            except pymysql.MySQLError as e:
+                if not optional or is_transient(e):
+                    raise
+                logging.warning("Session setting not applied (%s): %s" % (
+                                statement, e))
 
     def insert_namespaces(self, nsdict):
         """
         Insert namespace info (from RevHist or RevMeta dumps)
         """
-        self.cursor.executemany(bs.insert_namespaces, nsdict.items())
+        self.insert_many(bs.insert_namespaces, list(nsdict.items()))
 
-    def send_query(self, query):
+    def send_query(self, query, raise_errors=True):
         """
-        Send query to DB. Attempt 'ntimes' consecutive times before giving up
+        Send query to DB, retrying transient errors (see retry)
         query: query to be sent to DB
+        raise_errors: if False, errors are only logged, except transient
+        errors, which are raised anyway once all attempts fail
         """
-        # TODO: Handle errors properly with logger library
         with warnings.catch_warnings():
             # Change filter action to 'error' to raise warnings as if they
             # were exceptions, to record them in the log file
             warnings.simplefilter('ignore', pymysql.Warning)
             try:
-                self.cursor.execute(query)
-                # self.con.commit()
+                self.retry(lambda: self.cursor.execute(query), query)
             except Exception as e:
-                # TODO: This is potentially dangerous, we should
-                # capture and log DB exceptions adequately using
-                # Python logger
+                if raise_errors or is_transient(e):
+                    raise
+                logging.error("Exception in send_query method: %s" % e)
                 print("Exception in send_query method: ", e)
                 print(query)
 
-    def insert_many(self, query_template, values):
+    def insert_many(self, query_template, values, raise_errors=True):
         """
         Send multiple statements to DB. Typically used in bulk data inserts.
+        Rows for INSERT ... VALUES templates are sent in batches of
+        multi-row statements that fit in max_allowed_packet, each one
+        retried on its own (see retry)
+        raise_errors: if False, errors are only logged (see send_query)
         """
-        # TODO: Handle errors properly with logger library
+        # Rough size of each batch, leaving room for quotes and escapes
+        max_size = self.cursor.max_stmt_length // 2
+        batch = []
+        size = 0
+        for row in values:
+            batch.append(row)
+            size += sum(len(str(v)) + 4 for v in row)
+            if size >= max_size:
+                self._insert_batch(query_template, batch, raise_errors)
+                batch = []
+                size = 0
+        if batch:
+            self._insert_batch(query_template, batch, raise_errors)
+
+    def _insert_batch(self, query_template, batch, raise_errors):
         with warnings.catch_warnings():
             # Change filter action to 'error' to raise warnings as if they
             # were exceptions, to record them in the log file
             warnings.simplefilter('ignore', pymysql.Warning)
             try:
-                self.cursor.executemany(query_template, values)
-                # self.con.commit()
+                self.retry(lambda: self.cursor.executemany(query_template,
+                                                           batch),
+                           query_template)
             except Exception as e:
-                # TODO: This is potentially dangerous, we should
-                # capture and log DB exceptions adequately using
-                # Python logger
-                print("Exception in send_query method: ", e)
+                if raise_errors or is_transient(e):
+                    raise
+                logging.error("Exception in insert_many method: %s" % e)
+                print("Exception in insert_many method: ", e)
 
     def execute_query(self, query):
         """
@@ -198,12 +410,336 @@ class MySQLDB(object):
             # were exceptions, to record them in the log file
             # TODO: Handle errors properly with logger
             warnings.simplefilter('ignore', pymysql.Warning)
-            try:
-                nres = self.cursor.execute(query)
-                results = self.cursor.fetchall()
-                if nres == 0:
-                    return None
-                else:
-                    return results
-            except (Exception):
+            nres, results = self.retry(
+                lambda: (self.cursor.execute(query), self.cursor.fetchall()),
+                query)
+            if nres == 0:
+                return None
+            else:
+                return results
+
+    def iter_query(self, query, chunk_rows=100000):
+        """
+        Send query to DB, yield lists of up to chunk_rows returned values.
+        Rows are streamed from the server (unbuffered cursor), so large
+        results are never held in memory at once. Not retried, since some
+        rows may have been consumed already, and no other query can be sent
+        through this connection until all rows are read
+        """
+        cursor = self.con.cursor(pymysql.cursors.SSCursor)
+        try:
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+
+class ConnectionPool(object):
+    """
+    Pool of open connections (MySQLDB objects) to the same DB, so that bulk
+    loaders and other helpers running in the same process reuse them
+    instead of opening new ones for every dump file. Idle connections are
+    checked before being handed out again, and replaced if they are broken.
+    """
+
+    def __init__(self, host, port, user, passwd, db, size=8, retries=5,
+                 backoff=1.0):
+        """
+        Arguments:
+            - host, port, user, passwd, db = Connection parameters
+            - size = Maximum number of idle connections kept open
+            - retries, backoff = Retries of transient errors (see MySQLDB)
+        """
+        self.params = dict(host=host, port=port, user=user, passwd=passwd,
+                           db=db, retries=retries, backoff=backoff)
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def get(self):
+        """
+        Return an open connection, reused if possible
+        """
+        with self.lock:
+            while self.idle:
+                db_con = self.idle.pop()
+                if db_con.is_alive():
+                    return db_con
+                db_con.close()
+        db_con = MySQLDB(**self.params)
+        db_con.connect()
+        return db_con
+
+    def put(self, db_con):
+        """
+        Give back connection obtained with get()
+        """
+        with self.lock:
+            if db_con.con is not None and len(self.idle) < self.size:
+                self.idle.append(db_con)
+                return
+        db_con.close()
+
+    def close(self):
+        """
+        Close all idle connections
+        """
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for db_con in idle:
+            db_con.close()
+
+
+# (process id, host, port, user, db) --> ConnectionPool
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+def get_pool(con):
+    """
+    Return pool of connections to the same DB as con (MySQLDB) for the
+    current process (forked processes never share connections)
+    """
+    key = (os.getpid(), con.host, con.port, con.user, con.db)
+    with POOLS_LOCK:
+        pool = POOLS.get(key)
+        if pool is None:
+            pool = ConnectionPool(host=con.host, port=con.port,
+                                  user=con.user, passwd=con.passwd,
+                                  db=con.db, retries=con.retries,
+                                  backoff=con.backoff)
+            POOLS[key] = pool
+    return pool
+
+
+class MemoryFile(io.StringIO):
+    """
+    In-memory replacement of a temp data file, keeping its contents (as
+    UTF-8 bytes) in attribute data once it is closed
+    """
+    def close(self):
+        if not self.closed:
+            self.data = self.getvalue().encode('utf-8')
+        super(MemoryFile, self).close()
+
+
+class MemoryBinaryFile(io.BytesIO):
+    """
+    In-memory replacement of a binary temp data file, keeping its contents
+    in attribute data once it is closed
+    """
+    def close(self):
+        if not self.closed:
+            self.data = self.getvalue()
+        super(MemoryBinaryFile, self).close()
+
+
+def feed_fifo(path, data, loaded):
+    """
+    Write data to the named pipe in path, as soon as a LOAD DATA LOCAL
+    query opens it for reading. Gives up if the query finishes (event
+    loaded) without opening it, e.g. because of an error.
+    """
+    while True:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+            break
+        except OSError as e:
+            if e.errno != errno.ENXIO:
                 raise
+            if loaded.is_set():
+                return
+            time.sleep(0.001)
+    os.set_blocking(fd, True)
+    with os.fdopen(fd, 'wb') as fifo:
+        try:
+            fifo.write(data)
+        except BrokenPipeError:
+            # Load aborted, the error is reported by send_query
+            pass
+
+
+class BulkLoader(object):
+    """
+    Runs bulk data loads (LOAD DATA queries) from temp files in background
+    threads, each one with its own connection to the same DB as con. Thus,
+    callers can keep writing the next temp file while previous ones are
+    being loaded, instead of waiting for every load to finish.
+
+    At most "workers" loads are queued or running at the same time, so
+    callers can rotate workers + 1 temp file names safely.
+
+    If fifo is True, temp files returned by open() are kept in memory, and
+    each load creates a named pipe (FIFO) in their path to stream data to
+    LOAD DATA LOCAL INFILE, so no data is written to disk.
+
+    Load connections are taken from the connection pool of the process (see
+    get_pool). They disable uniqueness and foreign key checks, and binary
+    logging if the DB account is allowed to (see base_schema.load_session
+    and load_session_optional). Loads failing with transient errors that
+    guarantee no row was loaded are retried, including their named pipes in
+    FIFO mode (see MySQLDB.retry). If a load fails, no other load is run,
+    and the error is raised by the next call to load, wait or close, which
+    never return the mark of a failed load, so that no data is lost
+    silently.
+    """
+
+    def __init__(self, con, workers=1, remove_files=False, fifo=False):
+        """
+        Arguments:
+            - con = MySQLDB object with connection parameters to be used
+            - workers = Number of threads (and connections) loading data
+            - remove_files = Delete temp files once loaded
+            - fifo = Stream data from memory through named pipes
+        """
+        self.workers = max(1, workers)
+        self.remove_files = remove_files
+        self.fifo = fifo
+        self.memory_files = {}  # path --> MemoryFile not loaded yet
+        self.tasks = queue.Queue()
+        # (done event, mark, [error]) of every load not returned yet, in order
+        self.in_flight = collections.deque()
+        self.error = None  # Error of the first load that failed
+        self.pool = get_pool(con)
+        self.threads = []
+        # Prepare all connections before starting any thread, so that no
+        # thread is left waiting for loads if one of them fails
+        connections = []
+        try:
+            for x in range(self.workers):
+                connections.append(self.pool.get())
+                connections[-1].set_session(bs.load_session)
+                connections[-1].set_session(bs.load_session_optional,
+                                            optional=True)
+        except Exception:
+            for db_load in connections:
+                db_load.close()
+            raise
+        for db_load in connections:
+            thread = threading.Thread(target=self._load, args=(db_load,))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _load(self, db_load):
+        for query, path, data, done, status in iter(self.tasks.get, None):
+            if self.error is not None:
+                # Loads requested after a failed one are not run
+                status[0] = self.error
+            else:
+                try:
+                    db_load.retry(lambda: self._run_load(db_load, query,
+                                                         path, data),
+                                  query)
+                except Exception as e:
+                    logging.error("Error loading %s: %s" % (path, e))
+                    print("Exception in BulkLoader: ", e)
+                    print(query)
+                    self.error = status[0] = e
+                else:
+                    if self.remove_files and data is None:
+                        os.remove(path)
+            done.set()
+        for line in db_load.timing_report():
+            logging.info(line)
+        if self.error is None:
+            self.pool.put(db_load)
+        else:
+            db_load.close()
+
+    def _run_load(self, db_load, query, path, data):
+        """
+        Run load query, streaming data through a named pipe in path if
+        data are in memory
+        """
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', pymysql.Warning)
+            if data is None:
+                db_load.cursor.execute(query)
+                return
+            if os.path.exists(path):
+                os.remove(path)
+            os.mkfifo(path)
+            loaded = threading.Event()
+            feeder = threading.Thread(target=feed_fifo,
+                                      args=(path, data, loaded))
+            feeder.start()
+            try:
+                db_load.cursor.execute(query)
+            finally:
+                loaded.set()
+                feeder.join()
+                os.remove(path)
+
+    def open(self, path, mode='w'):
+        """
+        Open temp data file in path for writing, with a large buffer (kept
+        in memory in FIFO mode). It must be closed before requesting its load
+        """
+        if not self.fifo:
+            return open(path, mode, buffering=FILE_BUFFER,
+                        encoding=None if 'b' in mode else 'utf-8')
+        memory_file = MemoryBinaryFile() if 'b' in mode else MemoryFile()
+        self.memory_files[path] = memory_file
+        return memory_file
+
+    def _finished(self, max_in_flight):
+        """
+        Wait until at most max_in_flight loads are pending, and return marks
+        of loads finished so far, in the same order they were requested.
+        Raise the error of the first failed load found
+        """
+        marks = []
+        while self.in_flight:
+            done, mark, status = self.in_flight[0]
+            if len(self.in_flight) > max_in_flight:
+                done.wait()
+            elif not done.is_set():
+                break
+            if status[0] is not None:
+                raise status[0]
+            self.in_flight.popleft()
+            if mark is not None:
+                marks.append(mark)
+        return marks
+
+    def load(self, query, path, mark=None):
+        """
+        Request load of temp file in path with query, which must be closed
+        already. Blocks while "workers" loads are still pending. Returns list
+        with the marks of all previous loads that have finished, once every
+        load requested before them has finished too (e.g. page ids to record
+        progress in checkpoints).
+        """
+        marks = self._finished(self.workers - 1)
+        done = threading.Event()
+        status = [None]
+        memory_file = self.memory_files.pop(path, None)
+        data = memory_file.data if memory_file is not None else None
+        self.in_flight.append((done, mark, status))
+        self.tasks.put((query, path, data, done, status))
+        return marks
+
+    def wait(self):
+        """
+        Wait for all pending loads and return their marks (not returned yet)
+        """
+        return self._finished(0)
+
+    def close(self):
+        """
+        Wait for all pending loads, close connections and return the marks
+        of loads not returned yet
+        """
+        try:
+            marks = self.wait()
+        finally:
+            for thread in self.threads:
+                self.tasks.put(None)
+            for thread in self.threads:
+                thread.join()
+        return marks
@@ -2,29 +2,52 @@
 Created on Jul 24, 2014
 
 @author: carlosm
-'''
-'''
-Created on Jul 24, 2014
 
-@author: carlosm
+Resolution of IP addresses to country codes, using IP ranges from db-ip.
+
+IPv4 and IPv6 ranges are kept in a single NumPy index, sorted by lower
+bound: a record array of lower and upper bounds (128-bit addresses split in
+two uint64 fields, with IPv4 addresses mapped to ::ffff:0:0/96) and country
+codes. IPv4 ranges are also kept with uint32 bounds, which are much faster
+to search.
+
+Nothing is loaded until the first lookup. Then, each array used for lookups
+is memory-mapped from its own binary cache file next to the CSV file, named
+after the size and modification time of the CSV file, with no other work.
+If there is no cache for the current CSV file, the arrays are built from it
+and saved. Many addresses are resolved at once with lookup_many.
 '''
 
 import ipaddress
-import bisect
+import glob
 import os
+import threading
+import numpy as np
 
+# IPv4 addresses are stored as IPv4-mapped IPv6 addresses (::ffff:a.b.c.d)
+V4_MAPPED = 0xFFFF << 32
+MAX_V6 = (1 << 128) - 1
+LOW_64 = (1 << 64) - 1
 
-def __load_data__():
+ADDRESS = np.dtype([('hi', '<u8'), ('lo', '<u8')])
+RANGE = np.dtype([('lower', ADDRESS), ('upper', ADDRESS), ('country', '<U3')])
+
+
+def __parse_csv__(dbip):
     # Load data from __DBIP_FILE__
     # File __DBIP_FILE__ is a file with IP ranges downloaded from http://db-ip.com/db/
     # (Data downloaded 24 June 2014).
-    data = []
-    path = os.path.dirname(__file__)
-    dbip = path + '/' + __DBIP_FILE__
+    # Returns lists of lower and upper bounds (IPv4 addresses are mapped to
+    # IPv6) and countries
+    lowerAdd = []
+    upperAdd = []
+    countries = []
 
     with open(dbip, 'r') as fin:
         for line in fin:
             line = line.strip()
+            if not line:
+                continue
             cols = line.split(',')
 
             fromIP_str = cols[0].strip('"')
@@ -34,16 +57,146 @@ def __load_data__():
             fromIP = ipaddress.ip_address(str(fromIP_str))
             toIP = ipaddress.ip_address(str(toIP_str))
 
-            fromIP_int = int(fromIP)
-            toIP_int = int(toIP)
+            offset = V4_MAPPED if fromIP.version == 4 else 0
+            lowerAdd.append(int(fromIP) + offset)
+            upperAdd.append(int(toIP) + offset)
+            countries.append(country)
+
+    return lowerAdd, upperAdd, countries
+
+
+def split_addresses(ints):
+    '''
+    Return array of 128-bit addresses (ADDRESS) from a list of integers
+    '''
+    addresses = np.empty(len(ints), dtype=ADDRESS)
+    addresses['hi'] = [x >> 64 for x in ints]
+    addresses['lo'] = [x & LOW_64 for x in ints]
+    return addresses
+
+
+def build_index(lowerAdd, upperAdd, countries):
+    '''
+    Return index of IP ranges: record array of RANGE, sorted by lower bound
+    '''
+    index = np.empty(len(lowerAdd), dtype=RANGE)
+    index['lower'] = split_addresses(lowerAdd)
+    index['upper'] = split_addresses(upperAdd)
+    index['country'] = countries
+    return index[np.argsort(index['lower'], kind='mergesort')]
+
 
-            data.append((fromIP_int, toIP_int, country))
+def index_arrays(index):
+    '''
+    Return dict of contiguous arrays used for lookups in index (see
+    build_index), by name (see ARRAYS)
+    '''
+    lower = np.ascontiguousarray(index['lower'])
+    upper = np.ascontiguousarray(index['upper'])
+    countries = np.ascontiguousarray(index['country'])
+    v4 = np.flatnonzero((lower['hi'] == 0) & ((lower['lo'] >> 32) == 0xFFFF))
+    return {'lower': lower, 'upper': upper, 'countries': countries,
+            'v4_lower': (lower['lo'][v4] & 0xFFFFFFFF).astype(np.uint32),
+            'v4_upper': (upper['lo'][v4] & 0xFFFFFFFF).astype(np.uint32),
+            'v4_countries': countries[v4]}
 
-    lowerAdd = [x[0] for x in data]
-    upperAdd = [x[1] for x in data]
-    country = [x[2] for x in data]
 
-    return lowerAdd, upperAdd, country
+class RangeIndex(object):
+    '''
+    Lookups in the arrays of an index of IP ranges (see index_arrays)
+    '''
+
+    def __init__(self, arrays):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    def lookup_v4(self, ips, default=''):
+        ips = np.asarray(ips, dtype=np.int64).ravel()
+        if len(self.v4_upper) == 0:
+            return np.full(len(ips), default)
+        valid = (ips >= 0) & (ips <= 0xFFFFFFFF)
+        # Search keys with the same type as bounds, to avoid conversions
+        keys = np.where(valid, ips, 0).astype(np.uint32)
+        idx = np.searchsorted(self.v4_upper, keys, side='left')
+        idx = np.minimum(idx, len(self.v4_upper) - 1)
+        found = (valid & (self.v4_lower[idx] <= keys) &
+                 (keys <= self.v4_upper[idx]))
+        return np.where(found, self.v4_countries[idx], default)
+
+    def lookup_v6(self, ips, default=''):
+        ips = [int(ip) for ip in ips]
+        if len(self.upper) == 0:
+            return np.full(len(ips), default)
+        valid = np.array([0 <= ip <= MAX_V6 for ip in ips], dtype=bool)
+        keys = split_addresses([ip if 0 <= ip <= MAX_V6 else 0 for ip in ips])
+        # Structured arrays are searched in lexicographic order of (hi, lo)
+        idx = np.searchsorted(self.upper, keys, side='left')
+        idx = np.minimum(idx, len(self.upper) - 1)
+        lower, upper = self.lower[idx], self.upper[idx]
+        above_lower = ((lower['hi'] < keys['hi']) |
+                       ((lower['hi'] == keys['hi']) &
+                        (lower['lo'] <= keys['lo'])))
+        below_upper = ((keys['hi'] < upper['hi']) |
+                       ((keys['hi'] == upper['hi']) &
+                        (keys['lo'] <= upper['lo'])))
+        found = valid & above_lower & below_upper
+        return np.where(found, self.countries[idx], default)
+
+
+def __load_data__():
+    # Load arrays of the index of IP ranges from the cache files of the
+    # current CSV file (memory-mapped), or build them from the CSV file and
+    # save them
+    dbip = os.path.join(os.path.dirname(__file__), __DBIP_FILE__)
+    stat = os.stat(dbip)
+    base = os.path.splitext(dbip)[0]
+    caches = dict((name, '%s.%x-%x.%s.npy' % (base, stat.st_size,
+                                              stat.st_mtime_ns, name))
+                  for name in ARRAYS)
+
+    if all(os.path.isfile(cache) for cache in caches.values()):
+        return dict((name, np.load(cache, mmap_mode='r'))
+                    for name, cache in caches.items())
+
+    arrays = index_arrays(build_index(*__parse_csv__(dbip)))
+    try:
+        for name, cache in caches.items():
+            tmp_cache = cache + '.%d.tmp' % os.getpid()
+            with open(tmp_cache, 'wb') as fout:
+                np.save(fout, arrays[name])
+            os.replace(tmp_cache, cache)
+        # Remove cache files of previous CSV files
+        for old_cache in glob.glob(glob.escape(base) + '.*.npy'):
+            if old_cache not in caches.values():
+                os.remove(old_cache)
+    except OSError:
+        # Read-only installation, index is rebuilt every time
+        pass
+    return arrays
+
+
+def __get_index__():
+    # Load index on first lookup (only once, also with many threads)
+    global __INDEX__
+    if __INDEX__ is None:
+        with __LOCK__:
+            if __INDEX__ is None:
+                __INDEX__ = RangeIndex(__load_data__())
+    return __INDEX__
+
+
+def lookup_many(ips, default='', version=4):
+    '''
+    For many IP addresses (integers, as stored in table revision_IP),
+    locate their country codes at once. IPv4 addresses can be given in any
+    array-like object, IPv6 addresses (version=6) in a list of ints.
+
+    Return array of country codes (str), with default for addresses out of
+    known ranges (or invalid).
+    '''
+    if version == 4:
+        return __get_index__().lookup_v4(ips, default)
+    return __get_index__().lookup_v6(ips, default)
 
 
 def getCountryCode(ip_str):
@@ -51,36 +204,26 @@ def getCountryCode(ip_str):
     For a given ip address (as string), locate its country code.
 
     ip_str        Target IP address (as string)
-    lowerAdd      List of lower ranges
-    upperAdd      List of upper ranges
-    countryCodes  Range country codes
 
-    Return the target countr code (or NaN if not know.)
+    Return the target country code (or None if not known.)
     '''
     try:
         ip = ipaddress.ip_address(str(ip_str))
-    except:
+    except ValueError:
         # Invalid IP
         return None
-    ip_int = int(ip)
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
 
-    idx = bisect.bisect_left(__UPPER_ADD__, ip_int)
+    country = lookup_many([int(ip)], version=ip.version)[0]
+    return country if country else None
 
-    if __LOWER__ADD__[idx] <= ip_int and ip_int <= __UPPER_ADD__[idx]:
-        return __COUNTRY__[idx]
-    else:
-        ip_t = str(ip_int)
-        ip_l = str(__LOWER__ADD__[idx])
-        ip_h = str(__UPPER_ADD__[idx])
-        print('Address ', ip_t, ' is not in range [', ip_l, ', ', ip_h, ']')
-        return None
 
-# Initialize module
-__DBIP_FILE__ = 'dbip-country.csv'
-__LOWER__ADD__, __UPPER_ADD__, __COUNTRY__ = __load_data__()
+# Arrays of the index, each one in its own cache file
+ARRAYS = ('lower', 'upper', 'countries', 'v4_lower', 'v4_upper',
+          'v4_countries')
 
-if __name__ == '__main__':
-    assert getCountryCode('145.100.61.14') == 'NL'  # eScience center IP
-    assert getCountryCode('144.173.6.146') == 'GB'  # U. Exeter IP
-    assert getCountryCode('74.125.136.106') == 'US'  # www.google.com
-    assert getCountryCode('148.243.168.33') == 'MX'  # www.eluniversal.com.mx
+# Initialize module (the index is loaded on first lookup)
+__DBIP_FILE__ = 'dbip-country.csv'
+__INDEX__ = None
+__LOCK__ = threading.Lock()
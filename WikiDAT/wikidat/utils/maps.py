@@ -16,6 +16,7 @@ capture just STDOUT
 """
 EXTENSIONS = {
     'xml': "cat 2>/dev/null",
+    'sql': "cat 2>/dev/null",
     'bz2': "bzcat 2>/dev/null",
     '7z':  "7za e -so 2>/dev/null",
     'lzma': "lzcat 2>/dev/null",
@@ -180,3 +181,94 @@ GA_RE = {'dewiki': DE_GA_RE, 'enwiki': EN_GA_RE, 'eswiki': ES_GA_RE,
          'euwiki': None, 'glwiki': None, 'simplewiki': None,
          'iswiki': IS_GA_RE, 'fowiki': None, 'scowiki': None, 'furwiki': None
          }
+
+"""
+Combined detector of quality templates (FA, FLIST and GA) for each language.
+Every template above begins with a literal '{{', so the combined pattern
+consumes it and then tests each type in a lookahead, capturing it in a
+named group. A single finditer() scan over the text then reports the same
+positives as running the three searches above separately, even when matches
+of different types overlap (e.g. greedy '.*' spanning several templates).
+"""
+QUALITY_TYPES = ('fa', 'flist', 'ga')
+
+_TEMPLATE_OPEN_RE = re.compile(r'^(\\?\{){2}')
+
+
+def _template_body(pat):
+    """
+    Source of a quality template pattern without the opening braces
+    and the capturing group(s) wrapping each alternative
+    """
+    alternatives = []
+    for alt in pat.pattern.split(')|('):
+        alt = alt.lstrip('(')
+        if alt.endswith(')'):
+            alt = alt[:-1]
+        alternatives.append(_TEMPLATE_OPEN_RE.sub('', alt))
+    return '|'.join(alternatives)
+
+
+def _quality_pattern(lang):
+    """
+    Compile the combined quality template pattern for lang, or
+    None if no quality template is supported in that language
+    """
+    pats = [(name, table[lang]) for name, table in
+            zip(QUALITY_TYPES, (FA_RE, FLIST_RE, GA_RE))
+            if table[lang] is not None]
+    if not pats:
+        return None
+    lookaheads = ''.join([r'(?:(?=(?P<%s>%s)))?' % (name, _template_body(pat))
+                          for name, pat in pats])
+    # Fail unless at least one of the lookaheads matched
+    condition = '(?!)'
+    for name, pat in reversed(pats):
+        condition = '(?(%s)|%s)' % (name, condition)
+    return re.compile(r'\{\{' + lookaheads + condition)
+
+# Dictionary of combined quality template patterns, by language
+QUALITY_RE = dict((lang, _quality_pattern(lang)) for lang in FA_RE)
+
+
+def _scan_quality(pat, text, found, pos=0, endpos=None):
+    """
+    Add to found the quality template types matched by pat
+    in text[pos:endpos]
+    """
+    if endpos is None:
+        endpos = len(text)
+    for match in pat.finditer(text, pos, endpos):
+        found.update(name for name, value in match.groupdict().items()
+                     if value is not None)
+        if len(found) == len(pat.groupindex):
+            break
+    return found
+
+
+def find_quality(pat, text, window=None, fallback=True):
+    """
+    Return the set of quality template types (among QUALITY_TYPES)
+    found in text, using a combined pattern from QUALITY_RE
+
+    Quality templates are placed at the top or the bottom of articles. If
+    window is given, only the first and last window characters of text are
+    scanned (extended to whole lines, as no template pattern spans more
+    than one line). If some type supported by pat is not found there and
+    fallback is True, the rest of the text is scanned too, so the result
+    is the same as scanning the whole text. Without fallback, templates
+    placed only in the middle of the text are missed.
+    """
+    found = set()
+    if pat is None:
+        return found
+    if window and len(text) > 2 * window:
+        head_end = text.find('\n', window)
+        tail_start = text.rfind('\n', 0, len(text) - window) + 1
+        if 0 <= head_end < tail_start:
+            _scan_quality(pat, text, found, 0, head_end)
+            _scan_quality(pat, text, found, tail_start)
+            if len(found) < len(pat.groupindex) and fallback:
+                _scan_quality(pat, text, found, head_end, tail_start)
+            return found
+    return _scan_quality(pat, text, found)
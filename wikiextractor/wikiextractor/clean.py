@@ -16,16 +16,30 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # =============================================================================
 
-from extract import Extractor, ignoreTag, resetIgnoredTags
+import multiprocessing
+from collections import deque
+from itertools import islice
 
+from extract import (Extractor, ignoreTag, resetIgnoredTags, define_template,
+                     set_template_namespace, load_templates, save_templates)
 
-def clean_markup(markup, keep_links=False, ignore_headers=True):
+# Template index functions are re-exported, to be used together with
+# clean_markup(expand_templates=True)
+__all__ = ['clean_markup', 'clean_markup_many', 'define_template',
+           'set_template_namespace', 'load_templates', 'save_templates']
+
+
+def clean_markup(markup, keep_links=False, ignore_headers=True,
+                 expand_templates=False):
     """
     Clean Wikimarkup to produce plaintext.
 
     :param keep_links: Set to True to keep internal and external links
     :param ignore_headers: if set to True, the output list will not contain
     headers, only 
+    :param expand_templates: Set to True to expand templates instead of
+    dropping them. Template definitions must be loaded first, e.g. with
+    load_templates()
 
     Returns a list of paragraphs (unicode strings).
     """
@@ -53,7 +67,7 @@ def clean_markup(markup, keep_links=False, ignore_headers=True):
     # returns a list of strings
     paragraphs = extractor.clean_text(markup,
                                       mark_headers=True,
-                                      expand_templates=False,
+                                      expand_templates=expand_templates,
                                       escape_doc=True)
     resetIgnoredTags()
 
@@ -62,3 +76,60 @@ def clean_markup(markup, keep_links=False, ignore_headers=True):
             paragraphs = list(filter(lambda s: not s.startswith(k), paragraphs))
 
     return paragraphs
+
+
+def _init_worker(templates_file):
+    """
+    Load template definitions once in every worker of the pool.
+    """
+    if templates_file:
+        load_templates(templates_file)
+
+
+def _clean_chunk(chunk, keep_links, ignore_headers, expand_templates):
+    return [clean_markup(markup, keep_links=keep_links,
+                         ignore_headers=ignore_headers,
+                         expand_templates=expand_templates)
+            for markup in chunk]
+
+
+def clean_markup_many(markups, workers=None, chunksize=64, keep_links=False,
+                      ignore_headers=True, expand_templates=False,
+                      templates_file=None):
+    """
+    Clean an iterable of Wikimarkup texts in a pool of processes.
+
+    :param markups: iterable of Wikimarkup texts, it is consumed lazily.
+    :param workers: number of worker processes (default: number of CPUs).
+    :param chunksize: number of texts sent to a worker at a time.
+    :param templates_file: template index loaded by each worker at startup,
+    see load_templates().
+
+    Other parameters are those of clean_markup(). Compiled regular
+    expressions and templates loaded before calling this function are
+    inherited by the workers.
+
+    Yields the list of paragraphs of each text, in input order.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    options = (keep_links, ignore_headers, expand_templates)
+    markups = iter(markups)
+
+    if workers <= 1:
+        _init_worker(templates_file)
+        for chunk in iter(lambda: list(islice(markups, chunksize)), []):
+            yield from _clean_chunk(chunk, *options)
+        return
+
+    # Bound the number of chunks in flight, so that long streams of
+    # revisions are not read into memory ahead of the workers
+    pending = deque()
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(templates_file,)) as pool:
+        for chunk in iter(lambda: list(islice(markups, chunksize)), []):
+            pending.append(pool.apply_async(_clean_chunk, (chunk,) + options))
+            if len(pending) > 2 * workers:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
@@ -20,6 +20,8 @@
 
 import re
 import cgi
+import json
+from collections import OrderedDict
 from itertools import zip_longest
 import urllib
 from html.entities import name2codepoint
@@ -42,6 +44,11 @@ urlbase = ''
 # We include as default Template, when loading external template file.
 knownNamespaces = set(['Template'])
 
+##
+# The namespace used for template definitions.
+templateNamespace = 'Template'
+templatePrefix = templateNamespace + ':'
+
 ##
 # Drop these elements from article text
 #
@@ -594,6 +601,11 @@ class MagicWords(object):
         'cascadingsources',
     ]
 
+    # Magic words whose value depends on the page being extracted
+    page_names = frozenset(name for name in names
+                           if 'page' in name or 'space' in name) - {
+        'numberofpages'}
+
     def __init__(self):
         self.values = {'!': '|'}
 
@@ -829,6 +841,9 @@ class Extractor(object):
         self.recursion_exceeded_2_errs = 0  # template recursion within expandTemplate()
         self.recursion_exceeded_3_errs = 0  # parameter recursion
         self.template_title_errs = 0
+        self.template_expansions = 0  # expansions performed for this article
+        self.expansion_budget_errs = 0  # expansions refused over budget
+        self.page_magic_words = 0  # page magic words expanded (e.g. PAGENAME)
 
     def clean_text(self, text, mark_headers=False, expand_templates=False,
                    escape_doc=True):
@@ -843,6 +858,7 @@ class Extractor(object):
         self.magicWords['currentday'] = time.strftime('%d')
         self.magicWords['currenthour'] = time.strftime('%H')
         self.magicWords['currenttime'] = time.strftime('%H:%M:%S')
+        self.template_expansions = 0
 
         text = clean(self, text, expand_templates=expand_templates,
                      escape_doc=escape_doc)
@@ -874,16 +890,29 @@ class Extractor(object):
         errs = (self.template_title_errs,
                 self.recursion_exceeded_1_errs,
                 self.recursion_exceeded_2_errs,
-                self.recursion_exceeded_3_errs)
+                self.recursion_exceeded_3_errs,
+                self.expansion_budget_errs)
         if any(errs):
-            logging.warn("Template errors in article '%s' (%s): title(%d) recursion(%d, %d, %d)",
+            logging.warn("Template errors in article '%s' (%s): title(%d) recursion(%d, %d, %d) budget(%d)",
                          self.title, self.id, *errs)
 
+    def recursion_errs(self):
+        """
+        :return: total number of template errors that truncated an expansion.
+        """
+        return (self.recursion_exceeded_1_errs +
+                self.recursion_exceeded_2_errs +
+                self.recursion_exceeded_3_errs +
+                self.expansion_budget_errs)
+
     # ----------------------------------------------------------------------
     # Expand templates
 
     maxTemplateRecursionLevels = 30
     maxParameterRecursionLevels = 10
+    # total number of template instantiations allowed in one article, to
+    # bound the cost of pathological pages (cached expansions are free)
+    maxTemplateExpansions = 5000
 
     # check for template beginning
     reOpen = re.compile('(?<!{){{(?!{)', re.DOTALL)
@@ -1063,6 +1092,8 @@ class Extractor(object):
             subst = True
 
         if title.lower() in self.magicWords.values:
+            if title.lower() in MagicWords.page_names:
+                self.page_magic_words += 1
             return self.magicWords[title.lower()]
 
         # Parser functions
@@ -1138,6 +1169,23 @@ class Extractor(object):
         # build a dict of name-values for the parameter values
         params = self.templateParams(params)
 
+        # The same invocation is very frequent across articles and revisions
+        # (infoboxes, citation templates...), reuse its previous expansion.
+        # Expansions that depend on the page, e.g. through {{PAGENAME}} in
+        # the template or in any template it invokes, are not memoized.
+        key = (title, tuple(sorted(params.items())))
+        value = expansionCache.get(key)
+        if value is not None:
+            expansionCache.move_to_end(key)
+            return value
+
+        if self.template_expansions >= self.maxTemplateExpansions:
+            self.expansion_budget_errs += 1
+            return ''
+        self.template_expansions += 1
+        errs = self.recursion_errs()
+        page_words = self.page_magic_words
+
         # Perform parameter substitution
         # extend frame before subst, since there may be recursion in default
         # parameter value, e.g. {{OTRS|celebrative|date=April 2015}} in article
@@ -1148,9 +1196,124 @@ class Extractor(object):
         value = self.expandTemplates(instantiated)
         self.frame.pop()
         # logging.debug('   INVOCATION> %s %d %s', title, len(self.frame), value)
+
+        # Do not memoize expansions truncated by recursion limits, they
+        # depend on the depth at which the template was invoked, nor those
+        # that depend on the page.
+        if (self.recursion_errs() == errs and
+                self.page_magic_words == page_words):
+            expansionCache[key] = value
+            if len(expansionCache) > expansionCacheSize:
+                expansionCache.popitem(last=False)
         return value
 
 
+# ----------------------------------------------------------------------
+# Template bodies
+
+
+class Template(list):
+    """
+    A Template is a list of TemplateText or TemplateArgs
+    """
+
+    @classmethod
+    def parse(cls, body):
+        tpl = Template()
+        # we must handle nesting, s.a.
+        # {{{1|{{PAGENAME}}}
+        # {{{italics|{{{italic|}}}
+        # {{#if:{{{{{#if:{{{nominee|}}}|nominee|candidate}}|}}}|
+        #
+        start = 0
+        for s, e in findMatchingBraces(body, 3):
+            tpl.append(TemplateText(body[start:s]))
+            tpl.append(TemplateArg(body[s + 3:e - 3]))
+            start = e
+        tpl.append(TemplateText(body[start:]))  # leftover
+        return tpl
+
+    def subst(self, params, extractor, depth=0):
+        # We perform parameter substitutions recursively.
+        # We also limit the maximum number of iterations to avoid too long or
+        # even endless loops (in case of malformed input).
+
+        # :see: http://meta.wikimedia.org/wiki/Help:Expansion#Distinction_between_variables.2C_parser_functions.2C_and_templates
+        #
+        # Parameter values are assigned to parameters in two (?) passes.
+        # Therefore a parameter name in a template can depend on the value of
+        # another parameter of the same template, regardless of the order in
+        # which they are specified in the template call, for example, using
+        # Template:ppp containing "{{{{{{p}}}}}}", {{ppp|p=q|q=r}} and even
+        # {{ppp|q=r|p=q}} gives r, but using Template:tvvv containing
+        # "{{{{{{{{{p}}}}}}}}}", {{tvvv|p=q|q=r|r=s}} gives s.
+
+        if depth > extractor.maxParameterRecursionLevels:
+            extractor.recursion_exceeded_3_errs += 1
+            return ''
+
+        return ''.join([tpl.subst(params, extractor, depth) for tpl in self])
+
+    def __str__(self):
+        return ''.join([str(x) for x in self])
+
+
+class TemplateText(str):
+    """Fixed text of template"""
+
+    def subst(self, params, extractor, depth):
+        return self
+
+
+class TemplateArg(object):
+    """
+    parameter to a template.
+    Has a name and a default value, both of which are Templates.
+    """
+
+    def __init__(self, parameter):
+        """
+        :param parameter: the parts of a tplarg.
+        """
+        # the parameter name itself might contain templates, e.g.:
+        #   appointe{{#if:{{{appointer14|}}}|r|d}}14|
+        #   4|{{{{{subst|}}}CURRENTYEAR}}
+
+        # any parts in a tplarg after the first (the parameter default) are
+        # ignored, and an equals sign in the first part is treated as plain text.
+        parts = splitParts(parameter)
+        self.name = Template.parse(parts[0])
+        if len(parts) > 1:
+            # This parameter has a default value
+            self.default = Template.parse(parts[1])
+        else:
+            self.default = None
+
+    def __str__(self):
+        if self.default:
+            return '{{{%s|%s}}}' % (self.name, self.default)
+        else:
+            return '{{{%s}}}' % self.name
+
+    def subst(self, params, extractor, depth):
+        """
+        Substitute value for this argument from dict :param params:
+        Use :param extractor: to evaluate expressions for name and default.
+        Limit substitution to the maximun :param depth:.
+        """
+        # the parameter name itself might contain templates, e.g.:
+        # appointe{{#if:{{{appointer14|}}}|r|d}}14|
+        paramName = self.name.subst(params, extractor, depth + 1)
+        paramName = extractor.expandTemplates(paramName)
+        res = ''
+        if paramName in params:
+            res = params[paramName]  # use parameter value specified in template invocation
+        elif self.default:  # use the default value
+            defaultValue = self.default.subst(params, extractor, depth + 1)
+            res = extractor.expandTemplates(defaultValue)
+        return res
+
+
 # ----------------------------------------------------------------------
 # parameter handling
 
@@ -1574,6 +1737,14 @@ def sharp_switch(primary, *params):
 
 
 # Extension Scribuntu
+# Lua modules emulated in Python, called through {{#invoke:}}
+modules = {
+    'convert': {
+        'convert': lambda x, u, *rest: x + ' ' + u,  # no conversion
+    }
+}
+
+
 def sharp_invoke(module, function, frame):
     functions = modules.get(module)
     if functions:
@@ -1675,6 +1846,10 @@ redirects = {}
 # cache of parser templates
 # FIXME: sharing this with a Manager slows down.
 templateCache = {}
+# cache of expanded invocations, (template title, params) -> text
+# Least recently used entries are discarded beyond expansionCacheSize.
+expansionCache = OrderedDict()
+expansionCacheSize = 100000
 
 
 def define_template(title, page):
@@ -1725,3 +1900,51 @@ def define_template(title, page):
         if title in templates:
             logging.warn('Redefining: %s', title)
         templates[title] = text
+
+
+def set_template_namespace(name):
+    """
+    Use :param name: (the local name of namespace 10, e.g. 'Plantilla') to
+    resolve template invocations.
+    """
+    global templateNamespace
+    global templatePrefix
+
+    templateNamespace = name
+    templatePrefix = name + ':'
+    knownNamespaces.add(name)
+
+
+def save_templates(path):
+    """
+    Save the current template definitions and redirects to :param path:, so
+    that they can be reused by other processes with :func:`load_templates`.
+    :return: the number of templates saved.
+    """
+    index = {'namespace': templateNamespace,
+             'templates': templates,
+             'redirects': redirects}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    logging.info("Saved %d templates to '%s'", len(templates), path)
+    return len(templates)
+
+
+def load_templates(path):
+    """
+    Load template definitions and redirects from a file created with
+    :func:`save_templates`. Previously parsed templates and cached expansions
+    are discarded.
+    :return: the number of templates loaded.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    set_template_namespace(index['namespace'])
+    templates.clear()
+    templates.update(index['templates'])
+    redirects.clear()
+    redirects.update(index['redirects'])
+    templateCache.clear()
+    expansionCache.clear()
+    logging.info("Loaded %d templates from '%s'", len(templates), path)
+    return len(templates)